@@ -3,6 +3,8 @@ from typing import Dict, Any, List, Set, Tuple
 import re
 
 from llm.driver import generate_json
+from evaluators.approval import ChainResolver
+from evaluators.intervals import compiled
 from facts import store as facts_store
 from retrieval.index import DocIndex, Chunk
 
@@ -179,13 +181,15 @@ Build a strictly document-grounded JSON structure:
 - Return STRICT JSON that matches the schema skeleton exactly. Do not invent policy.
 """
 
+# Fixed retrieval query (pre-warmed at ingest).
+RETRIEVAL_QUERY = "approval authority signing officer signing officers financial signing authorities limit threshold up to over not exceeding amount"
+
+
 def run_approval_chain(doc_id: str, index: DocIndex, user_query: str) -> Dict[str, Any]:
     """
     Create an Approval Chain panel from document-only signals.
     """
-    base_chunks = index.top_k(
-        "approval authority signing officer signing officers financial signing authorities limit threshold up to over not exceeding amount"
-    )
+    base_chunks = index.top_k(RETRIEVAL_QUERY)
 
     all_chunks = index.all_chunks()
     amount_sents = _harvest_amount_candidates(all_chunks)
@@ -206,9 +210,7 @@ ADDITIONAL CONSTRAINTS:
 """
         result = generate_json(strict + "\n\nAMOUNT_CANDIDATES:\n" + amount_block, context, SCHEMA_SKELETON)
 
-    facts = facts_store.load(doc_id)
-    facts["approval_chain_rules"] = result
-    facts_store.save(doc_id, facts)
+    facts_store.upsert(doc_id, "approval_chain_rules", result)
 
     cited: Set[str] = set()
     for lvl in result.get("levels", []) or []:
@@ -240,50 +242,15 @@ ADDITIONAL CONSTRAINTS:
     return {"patches": patches, "message": message}
 
 
-def _match_amount(amount: float, cond: Dict[str, Any]) -> bool:
-    op = cond.get("op")
-    if op == "between":
-        rng = cond.get("range") or {}
-        mn = float(rng.get("min", float("-inf")))
-        mx = rng.get("max", None)
-        mxv = float(mx) if mx is not None else float("inf")
-        return mn <= amount <= mxv
-    val = float(cond.get("value", 0))
-    if op == "<":  return amount <  val
-    if op == "<=": return amount <= val
-    if op == ">":  return amount >  val
-    if op == ">=": return amount >= val
-    if op == "==": return amount == val
-    return False
-
-def _derive_chain(amount: float | None, instrument: str | None, rules: Dict[str, Any]) -> List[str]:
+def chain_resolver(rules: Dict[str, Any], doc_id: str | None = None) -> ChainResolver:
+    """Compiled rules with their chain memo, rebuilt once per rules (facts) version."""
+    version = facts_store.version(doc_id) if doc_id else None
+    return compiled(("approval_chain", doc_id, version, id(rules)), rules, lambda: ChainResolver(rules))
+
+def _derive_chain(amount: float | None, instrument: str | None, rules: Dict[str, Any], doc_id: str | None = None) -> List[str]:
     if amount is None:
         return []
-    levels = rules.get("levels") or []
-    matched: List[List[str]] = []
-    for lvl in levels:
-        cond = lvl.get("condition") or {}
-        if cond.get("field") == "amount" and _match_amount(float(amount), cond):
-            approvers = [a for a in (lvl.get("approvers") or []) if isinstance(a, str)]
-            if approvers:
-                matched.append(approvers)
-
-    chain: List[str] = []
-    for group in matched:
-        for a in group:
-            if a not in chain:
-                chain.append(a)
-
-    inst = (instrument or "").strip().lower()
-    for trg in rules.get("triggers") or []:
-        when = (trg.get("when") or {})
-        w_inst = (when.get("instrument") or "").strip().lower()
-        if w_inst and inst and (w_inst in inst):
-            for a in trg.get("add") or []:
-                if a not in chain:
-                    chain.append(a)
-
-    return chain
+    return list(chain_resolver(rules, doc_id).resolve(amount, instrument))
 
 def evaluate_approval_controls(doc_id: str, panel_cfg: Dict[str, Any]) -> Dict[str, Any]:
     facts = facts_store.load(doc_id)
@@ -295,5 +262,5 @@ def evaluate_approval_controls(doc_id: str, panel_cfg: Dict[str, Any]) -> Dict[s
     if amount is None:
         return { "chain": [] }
 
-    chain = _derive_chain(float(amount), instrument, rules)
+    chain = _derive_chain(float(amount), instrument, rules, doc_id)
     return { "chain": chain }
@@ -1,6 +1,7 @@
 from __future__ import annotations
 from typing import Dict, Any, List, Set, Optional
 from datetime import datetime
+from functools import lru_cache
 
 from llm.driver import generate_json
 from facts import store as facts_store
@@ -16,14 +17,18 @@ def _ctx(chunks: List[Chunk], limit: int = 28) -> str:
 def _ids_in(chunks: List[Chunk]) -> Set[str]:
     return {c.id for c in chunks}
 
-def _parse_date(s: Optional[str]) -> Optional[datetime]:
+@lru_cache(maxsize=4096)
+def _parse_date_str(s: str) -> Optional[datetime]:
     try:
-        if not s:
-            return None
         return datetime.strptime(s, DateFmt)
     except Exception:
         return None
 
+def _parse_date(s: Optional[str]) -> Optional[datetime]:
+    if not s or not isinstance(s, str):
+        return None
+    return _parse_date_str(s)
+
 def _days_between(a: Optional[str], b: Optional[str]) -> Optional[int]:
     da = _parse_date(a); db = _parse_date(b)
     if not da or not db:
@@ -166,15 +171,19 @@ STRICT REQUIREMENTS
 Return STRICT JSON matching the schema skeleton.
 """
 
+# Fixed retrieval query (pre-warmed at ingest).
+RETRIEVAL_QUERY = (
+    "travel advance claim reimbursement return excess within days one week ten days monthly follow up "
+    "bank reconciliation independent depositor signer monthly within days escalate "
+    "credit card reconciliation monthly spending authority independent verification"
+)
+
+
 def run_control_checklists(doc_id: str, index: DocIndex, user_query: str) -> Dict[str, Any]:
     """
     Build the Control Checklists panel with LLM-extracted rules.
     """
-    chunks = index.top_k(
-        "travel advance claim reimbursement return excess within days one week ten days monthly follow up "
-        "bank reconciliation independent depositor signer monthly within days escalate "
-        "credit card reconciliation monthly spending authority independent verification"
-    )
+    chunks = index.top_k(RETRIEVAL_QUERY)
     context = _ctx(chunks, limit=28)
 
     extracted = generate_json(BASE_PROMPT, context, SCHEMA_SKELETON)
@@ -187,9 +196,7 @@ ADDITIONAL CONSTRAINTS:
 """
         extracted = generate_json(strict, context, SCHEMA_SKELETON)
 
-    facts = facts_store.load(doc_id)
-    facts["control_rules"] = extracted
-    facts_store.save(doc_id, facts)
+    facts_store.upsert(doc_id, "control_rules", extracted)
 
     cited: Set[str] = set()
     for key in ("travel_rules", "bank_recon_rules", "credit_card_rules"):
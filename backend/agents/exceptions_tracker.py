@@ -3,6 +3,8 @@ from typing import Dict, Any, List, Tuple, Set
 import re
 
 from llm.driver import generate_json
+from evaluators.exceptions import ExceptionMatcher, item_status, parse_amount
+from evaluators.intervals import compiled
 from facts import store as facts_store
 from retrieval.index import DocIndex, Chunk
 
@@ -90,8 +92,12 @@ STRICTNESS:
 Return strict JSON following the schema skeleton.
 """
 
+# Fixed retrieval query (pre-warmed at ingest).
+RETRIEVAL_QUERY = "exception waiver emergency sole source non competitive tender deviation variance approval documentation reporting"
+
+
 def run_exceptions_tracker(doc_id: str, index: DocIndex, user_query: str) -> Dict[str, Any]:
-    chunks = index.top_k("exception waiver emergency sole source non competitive tender deviation variance approval documentation reporting")
+    chunks = index.top_k(RETRIEVAL_QUERY)
     context = _ctx(chunks, limit=24)
 
     cands = _exception_candidates(chunks)
@@ -100,9 +106,7 @@ def run_exceptions_tracker(doc_id: str, index: DocIndex, user_query: str) -> Dic
     prompt = BASE_PROMPT + "\n\nCANDIDATE_SENTENCES:\n" + cand_block
     result = generate_json(prompt, context, SCHEMA_SKELETON)
 
-    facts = facts_store.load(doc_id)
-    facts["exception_rules"] = result
-    facts_store.save(doc_id, facts)
+    facts_store.upsert(doc_id, "exception_rules", result)
 
     cited_ids: Set[str] = set()
     for row in result.get("exception_policies", []) or []:
@@ -149,85 +153,28 @@ def run_exceptions_tracker(doc_id: str, index: DocIndex, user_query: str) -> Dic
 
 # ---------- evaluation ----------
 
-def _match_amount(cond: Dict[str, Any] | None, amount: float | None) -> bool:
-    if not cond or not isinstance(cond, dict):
-        return True
-    amt = cond.get("amount")
-    if not amt:
-        return True
-    if amount is None:
-        return False
-    try:
-        v = float(amt.get("value"))
-    except Exception:
-        return True
-    op = (amt.get("op") or "").strip()
-    a = float(amount)
-    if op == "<": return a < v
-    if op == "<=": return a <= v
-    if op == ">": return a > v
-    if op == ">=": return a >= v
-    if op == "==": return a == v
-    return True
-
-def _match_keyword(cond: Dict[str, Any] | None, kw: str) -> bool:
-    if not cond or not isinstance(cond, dict):
-        return True
-    want = (cond.get("keyword") or "").strip().lower()
-    if not want: return True
-    return want in (kw or "").strip().lower()
+def _matcher(doc_id: str, rules: Dict[str, Any]) -> ExceptionMatcher:
+    """exception_policies compiled once per facts version."""
+    policies = rules.get("exception_policies") or []
+    return compiled(
+        ("exception_policies", doc_id, facts_store.version(doc_id), id(policies)),
+        policies,
+        lambda: ExceptionMatcher(policies),
+    )
 
 def evaluate_exceptions_controls(doc_id: str, panel_cfg: Dict[str, Any]) -> Dict[str, Any]:
     facts = facts_store.load(doc_id)
     rules = (facts.get("exception_rules") or {})
     entry = ((panel_cfg.get("controls") or {}).get("entry") or {})
 
-    kw = (entry.get("keywords") or "").strip()
-    amount = entry.get("amount")
-    try:
-        amount = None if amount in (None, "",) else float(amount)
-    except Exception:
-        amount = None
-
-    applicable = []
-    for pol in (rules.get("exception_policies") or []):
-        when = pol.get("when") or {}
-        if _match_keyword(when, kw) and _match_amount(when, amount):
-            applicable.append(pol)
-
-    req_approvals = []
-    req_docs = []
-    req_reporting = []
-    for pol in applicable:
-        req = pol.get("requires", {}) or {}
-        for a in (req.get("approvals") or []):
-            if a not in req_approvals: req_approvals.append(a)
-        for d in (req.get("documentation") or []):
-            if d not in req_docs: req_docs.append(d)
-        for r in (req.get("reporting") or []):
-            if r not in req_reporting: req_reporting.append(r)
-
-    approvals_state = entry.get("approvals") or {}
-    docs_state = entry.get("documentation") or {}
-    report_state = entry.get("reporting") or {}
-
-    def eval_items(reqs: List[str], state: Dict[str, Any]) -> List[Dict[str, Any]]:
-        out = []
-        for item in reqs:
-            got = state.get(item)
-            if got is True:
-                status = "PASS"
-            elif got is False:
-                status = "FAIL"
-            else:
-                status = "UNKNOWN"
-            out.append({"item": item, "status": status})
-        return out
+    matcher = _matcher(doc_id, rules)
+    applicable = matcher.applicable(entry.get("keywords"), parse_amount(entry.get("amount")))
+    required = matcher.requirements(applicable)
 
     status = {
-        "approvals": eval_items(req_approvals, approvals_state),
-        "documentation": eval_items(req_docs, docs_state),
-        "reporting": eval_items(req_reporting, report_state)
+        "approvals": item_status(required["approvals"], entry.get("approvals") or {}),
+        "documentation": item_status(required["documentation"], entry.get("documentation") or {}),
+        "reporting": item_status(required["reporting"], entry.get("reporting") or {})
     }
 
     return {"status": status}
@@ -100,10 +100,13 @@
 
 
 from __future__ import annotations
-from typing import Dict, Any, List, Tuple, Set
+from typing import Dict, Any, Hashable, List, Tuple, Set
+import json
 import re
 
 from llm.driver import generate_json
+from evaluators.delegation import ConflictGraph
+from evaluators.intervals import compiled
 from facts import store as facts_store
 from retrieval.index import DocIndex, Chunk
 
@@ -238,8 +241,12 @@ Requirements:
 - Return strict JSON matching the schema skeleton.
 """
 
+# Fixed retrieval query (pre-warmed at ingest).
+RETRIEVAL_QUERY = "roles responsibilities authority separation duties independence cheque signing payment spending reconciliation approval verification"
+
+
 def run_roles_sod(doc_id: str, index: DocIndex, user_query: str) -> Dict[str, Any]:
-    chunks = index.top_k("roles responsibilities authority separation duties independence cheque signing payment spending reconciliation approval verification")
+    chunks = index.top_k(RETRIEVAL_QUERY)
     context = _ctx(chunks, limit=24)
 
     cands = _constraint_candidates(chunks)
@@ -256,9 +263,7 @@ ADDITIONAL CONSTRAINTS:
 """
         result = generate_json(strict + "\n\nCONSTRAINT_CANDIDATES:\n" + cand_block, context, SCHEMA_SKELETON)
 
-    facts = facts_store.load(doc_id)
-    facts["delegation_rules"] = result
-    facts_store.save(doc_id, facts)
+    facts_store.upsert(doc_id, "delegation_rules", result)
 
     cited_ids: Set[str] = set()
     for ev in result.get("role_evidence", []) or []:
@@ -289,25 +294,35 @@ ADDITIONAL CONSTRAINTS:
     msg = "I’ve created a **Roles & SoD** panel. Assign people to the extracted roles to see conflicts based on the document."
     return {"patches": patches, "message": msg}
 
+def _conflict_graph(doc_id: str, rules: Dict[str, Any]) -> ConflictGraph:
+    constraints = rules.get("constraints", []) or []
+    return compiled(
+        ("roles_sod", doc_id, facts_store.version(doc_id), id(constraints)),
+        constraints,
+        lambda: ConflictGraph(constraints, codes=("ConflictRolePair",)),
+    )
+
 def evaluate_roles_controls(doc_id: str, panel_cfg: Dict[str, Any]) -> Dict[str, Any]:
     facts = facts_store.load(doc_id)
     rules = (facts.get("delegation_rules") or {})
     assigns = ((panel_cfg.get("controls") or {}).get("assignments") or {})
-    viols: List[Dict[str,Any]] = []
+    graph = _conflict_graph(doc_id, rules)
 
-    pairs = []
-    for c in rules.get("constraints", []) or []:
-        if c.get("code") == "ConflictRolePair":
-            pr = c.get("pair") or []
-            if isinstance(pr, list) and len(pr) == 2 and all(isinstance(x, str) for x in pr):
-                pairs.append((pr[0], pr[1], c.get("message","Conflict")))
+    # Group roles by holder; only the constraints adjacent to a holder's roles are looked at.
+    held: Dict[Any, Set[str]] = {}
+    for role, person in assigns.items():
+        if person is None:
+            continue
+        key = person if isinstance(person, Hashable) else json.dumps(person, sort_keys=True)
+        held.setdefault(key, set()).add(role)
 
-    def same(a: str, b: str) -> bool:
-        pa = assigns.get(a); pb = assigns.get(b)
-        return (pa is not None) and (pb is not None) and (pa == pb)
+    hits: Set[int] = set()
+    for roles in held.values():
+        hits.update(graph.violated(roles))
 
-    for a, b, msg in pairs:
-        if same(a, b):
-            viols.append({"code":"ConflictRolePair", "message": msg, "path": f"/assignments/{b}"})
+    viols: List[Dict[str,Any]] = []
+    for k in sorted(hits):
+        a, b = graph.pairs[k]
+        viols.append({"code":"ConflictRolePair", "message": graph.constraints[k].get("message","Conflict"), "path": f"/assignments/{b}"})
 
     return {"violations": viols}
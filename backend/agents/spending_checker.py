@@ -134,6 +134,8 @@ from typing import Dict, Any, List, Set, Tuple
 import re
 
 from llm.driver import generate_json
+from evaluators.intervals import compiled
+from evaluators.spend import compile_spending_rules
 from facts import store as facts_store
 from retrieval.index import DocIndex, Chunk
 
@@ -232,42 +234,16 @@ STRICT RULES:
 def _context_from_chunks(chunks: List[Chunk]) -> str:
     return "\n\n".join(f"[{c.id} p.{c.page}] {c.text}" for c in chunks[:12])
 
-def _derive_required_steps(amount: float, category: str | None, rules: Dict[str, Any]) -> List[str]:
-    steps: List[str] = []
-    tiers = rules.get("tiers") or []
-
-    for t in tiers:
-        cond = (t.get("condition") or {})
-        if (cond.get("op") or "").lower() == "any":
-            steps.extend(t.get("required_steps") or [])
-
-    for t in tiers:
-        cond = (t.get("condition") or {})
-        if (cond.get("field") == "amount") and (cond.get("op") not in (None, "any")):
-            op = cond.get("op")
-            try:
-                val = float(cond.get("value"))
-            except Exception:
-                continue
-            ok = False
-            if op == "<": ok = amount < val
-            elif op == "<=": ok = amount <= val
-            elif op == ">": ok = amount > val
-            elif op == ">=": ok = amount >= val
-            elif op == "==": ok = amount == val
-            if ok:
-                steps.extend(t.get("required_steps") or [])
-
-    for ex in rules.get("exceptions") or []:
-        cond = ex.get("if") or {}
-        cat = (cond.get("category") or "")
-        if category and cat and cat.lower() == category.lower():
-            steps.extend(ex.get("then_add_steps") or [])
-
-    seen = set(); out=[]
-    for s in steps:
-        if s not in seen:
-            seen.add(s); out.append(s)
+def _derive_required_steps(amount: float, category: str | None, rules: Dict[str, Any], doc_id: str | None = None) -> List[str]:
+    version = facts_store.version(doc_id) if doc_id else None
+    always, table, by_category = compiled(
+        ("spending_steps", doc_id, version, id(rules)), rules, lambda: compile_spending_rules(rules)
+    )
+    extra = by_category.get(category.lower(), []) if category else []
+    out: List[str] = []
+    for s in (*always, *table.lookup(amount), *extra):
+        if s not in out:
+            out.append(s)
     return out
 
 def _used_numbers_in_rules(rules: Dict[str, Any]) -> List[float]:
@@ -282,8 +258,12 @@ def _used_numbers_in_rules(rules: Dict[str, Any]) -> List[float]:
             pass
     return nums
 
+# Fixed retrieval query (pre-warmed at ingest).
+RETRIEVAL_QUERY = "spending threshold procurement rfp tender competitive bids sole source contract purchase approval limit value cheque signatures"
+
+
 def run_spending_checker(doc_id: str, index: DocIndex, user_query: str) -> Dict[str, Any]:
-    chunks = index.top_k("spending threshold procurement rfp tender competitive bids sole source contract purchase approval limit value cheque signatures")
+    chunks = index.top_k(RETRIEVAL_QUERY)
     context = _context_from_chunks(chunks)
 
     cands = _money_candidates(chunks)
@@ -346,5 +326,5 @@ def evaluate_spending_controls(doc_id: str, panel_config: Dict[str, Any]) -> Dic
     category = panel_config.get("controls", {}).get("category")
     if amount is None:
         return {"required_steps": []}
-    steps = _derive_required_steps(float(amount), category, rules)
+    steps = _derive_required_steps(float(amount), category, rules, doc_id)
     return {"required_steps": steps}
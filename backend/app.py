@@ -2,26 +2,29 @@ from __future__ import annotations
 
 import asyncio
 import csv
+import io
 import json
+import math
 import os
 import time
 from datetime import datetime
 from pathlib import Path
-from typing import Any, Dict, List, Optional, Set
+from typing import Any, Dict, List, Optional, Set, Tuple
 from uuid import uuid4
 from fastapi import Request
 
+from agents import approval_chain, control_checklists, exceptions_tracker, roles_sod, spending_checker
 from agents.roles_sod import run_roles_sod, evaluate_roles_controls
-from agents.approval_chain import run_approval_chain, evaluate_approval_controls
+from agents.approval_chain import run_approval_chain, evaluate_approval_controls, chain_resolver
 from agents.control_checklists import run_control_checklists, evaluate_control_checklists
 from agents.exceptions_tracker import run_exceptions_tracker, evaluate_exceptions_controls
 
 
 import jsonpatch
-from fastapi import Body, FastAPI, File, Form, HTTPException, Request, UploadFile
+from fastapi import Body, FastAPI, File, Form, HTTPException, Query, Request, UploadFile
 from fastapi import BackgroundTasks
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from pydantic import BaseModel, ValidationError
 from sse_starlette.sse import EventSourceResponse
@@ -36,11 +39,25 @@ from agents.spending_checker import (
 )
 from compilers.delegation_compiler import compile_delegation_rules
 from compilers.spend_compiler import compile_spend_policy
-from evaluators.delegation import validate_delegation
+from evaluators import batch_approval, batch_controls, batch_exceptions
+from evaluators.batch_spend import INPUT_FORMATS, SpendBatch, format_for, read_rows, to_csv, to_ndjson
+from evaluators.delegation import DelegationEngine, check_org, day
+from evaluators.exceptions import ExceptionMatcher
 from evaluators.spend import derive_requirements
 from facts import store as facts_store
 from ingest import extract_text_from_pdf
+from jobs.runner import Job, JobBusy, JobRunner
+from retrieval.cache import RESULTS as RETRIEVAL_CACHE
+from retrieval.corpus import CorpusIndex, snippet
 from retrieval.index import DocIndex, chunk_text_to_paragraphs
+from state.coalesce import PatchCoalescer, controls_panel
+from state.derived import DerivedGraph, Node
+from state.hub import RESYNC, Client, ClientHub
+from state.panel_cache import PanelCache
+from state.patching import assign, diff, effective_ops, set_in
+from state.shards import Shard, ShardRegistry
+from state.validation import validate_full, validate_incremental
+from state.wal import OpLog
 from state_models import (
     AppState,
     Citation,
@@ -65,6 +82,19 @@ FILES_DIR.mkdir(parents=True, exist_ok=True)
 DOCS_DIR = Path(__file__).parent / "docs"
 DOCS_DIR.mkdir(parents=True, exist_ok=True)
 
+# BM25 index per uploaded doc (retrieval/index.py layout), written at ingest
+# and mmap'd on first use, so restarts and extra workers skip re-extraction.
+INDEX_DIR = Path(os.getenv("INDEX_DIR", str(Path(__file__).parent / "indexes")))
+INDEX_DIR.mkdir(parents=True, exist_ok=True)
+
+# "incremental" validates only the subtrees touched by a patch; "full"
+# re-validates the whole AppState; "verify" runs both and records mismatches.
+STATE_VALIDATION = os.getenv("STATE_VALIDATION", "incremental").strip().lower()
+
+# Bursts of control edits to one panel are merged for this many ms and
+# committed as one revision (0 disables unless a request opts in).
+PATCH_COALESCE_MS = float(os.getenv("PATCH_COALESCE_MS", "0"))
+
 app.mount("/files", StaticFiles(directory=str(FILES_DIR)), name="files")
 
 _initial_state = AppState(
@@ -76,19 +106,84 @@ _initial_state = AppState(
     violations=[],
     citations=[],
 )
-STATE: Dict[str, Any] = _initial_state.model_dump()
-STATE_LOCK = asyncio.Lock()
 
 POLICY_DIR = Path(__file__).parent / "policy"
 SPEND_POLICY_PATH = POLICY_DIR / "spend_policy.json"
 DELEGATION_RULES_PATH = POLICY_DIR / "delegation_rules.json"
 
+# Agent runs (LLM calls, facts I/O) execute in a bounded worker pool.
+JOBS = JobRunner(
+    max_workers=int(os.getenv("AGENT_WORKERS", "4")),
+    max_pending=int(os.getenv("AGENT_MAX_PENDING", "64")),
+)
+
 # ----------In-memory retrieval registries ----------
 # Map of doc_id -> DocIndex
 DOC_INDEXES: Dict[str, DocIndex] = {}
 CURRENT_DOC_ID: Optional[str] = None 
+# Every doc's index as one searchable corpus (/search); other workers' new
+# or rewritten index files are picked up from INDEX_DIR before each search.
+CORPUS = CorpusIndex(max_terms=int(os.getenv("CORPUS_CACHED_TERMS", "4096")))
 # ---------------------------------------------------------
 
+# The agents' fixed retrieval queries, ranked as soon as a doc is indexed.
+AGENT_QUERIES = [
+    spending_checker.RETRIEVAL_QUERY,
+    roles_sod.RETRIEVAL_QUERY,
+    approval_chain.RETRIEVAL_QUERY,
+    control_checklists.RETRIEVAL_QUERY,
+    exceptions_tracker.RETRIEVAL_QUERY,
+]
+
+
+def _index_path(doc_id: str) -> Path:
+    return INDEX_DIR / f"{doc_id}.bm25"
+
+
+def _persist_index(index: DocIndex) -> None:
+    """Write a freshly built index, add it to the corpus and pre-warm the agent queries (runs in the job pool)."""
+    RETRIEVAL_CACHE.invalidate(index.doc_id)
+    index.save(_index_path(index.doc_id))
+    CORPUS.add(index)
+    index.prewarm(AGENT_QUERIES)
+
+
+async def _doc_index(doc_id: str) -> Optional[DocIndex]:
+    """
+    DOC_INDEXES entry for `doc_id`. After a restart (or in another worker) the
+    on-disk index is mapped; without one it is rebuilt from the saved upload.
+    """
+    index = DOC_INDEXES.get(doc_id)
+    if index is not None and not index.stale(_index_path(doc_id)):
+        return index
+    if Path(doc_id).name != doc_id:
+        return None
+    try:
+        index = DOC_INDEXES[doc_id] = DocIndex.open(_index_path(doc_id))
+        await JOBS.run_blocking(index.prewarm, AGENT_QUERIES)
+        return index
+    except (OSError, ValueError):
+        pass
+    path = DOCS_DIR / doc_id
+    if not path.is_file():
+        return None
+    text = await JOBS.run_blocking(_read_upload, path)
+    index = DOC_INDEXES[doc_id] = await JOBS.run_blocking(_build_index, doc_id, text)
+    await JOBS.run_blocking(_persist_index, index)
+    return index
+
+
+def _read_upload(path: Path) -> str:
+    """Text of a saved .pdf or .txt upload (runs in the job pool)."""
+    if path.suffix.lower() == ".pdf":
+        return extract_text_from_pdf(str(path))
+    return path.read_text(encoding="utf-8", errors="ignore")
+
+
+def _build_index(doc_id: str, text: str) -> DocIndex:
+    """Chunk and index a document's text (runs in the job pool)."""
+    return DocIndex(doc_id=doc_id, chunks=chunk_text_to_paragraphs(text, page_map=[]))
+
 
 def _load_spend_policy() -> Dict[str, Any]:
     with open(SPEND_POLICY_PATH, "r", encoding="utf-8") as f:
@@ -111,6 +206,26 @@ def _save_spend_policy(policy: Dict[str, Any]) -> None:
 def _save_delegation_rules(rules: Dict[str, Any]) -> None:
     DELEGATION_RULES_PATH.write_text(json.dumps(rules, indent=2), encoding="utf-8")
 
+
+def _compile_policies(text: str, kind: str) -> Tuple[Optional[Dict[str, Any]], Optional[Dict[str, Any]]]:
+    """Compile and persist an uploaded doc's spend policy and delegation rules per `kind` (runs in the job pool)."""
+    compiled_spend = None
+    compiled_deleg = None
+
+    if kind in ("auto", "spend"):
+        compiled_spend = compile_spend_policy(text)
+        _save_spend_policy(compiled_spend)
+
+    elif kind in ("llm", "auto_llm"):
+        compiled_spend = compile_spend_policy_llm(text)
+        if compiled_spend.get("spend_policy"):
+            _save_spend_policy({"spend_policy": compiled_spend["spend_policy"]})
+
+    if kind in ("auto", "delegation", "llm", "auto_llm"):
+        compiled_deleg = compile_delegation_rules(text)
+        _save_delegation_rules(compiled_deleg)
+    return compiled_spend, compiled_deleg
+
 # ---- Chat intent helper (doc-agnostic) ----
 def detect_intent(prompt: str) -> str:
     q = (prompt or "").strip().lower()
@@ -130,40 +245,164 @@ def detect_intent(prompt: str) -> str:
 
 
 
-class Client:
-    def __init__(self) -> None:
-        self.queue: asyncio.Queue = asyncio.Queue()
+def _new_hub() -> ClientHub:
+    return ClientHub(
+        queue_size=int(os.getenv("SSE_QUEUE_SIZE", "256")),
+        lag_threshold=int(os.getenv("SSE_LAG_THRESHOLD", "64")),
+        idle_timeout=float(os.getenv("SSE_IDLE_TIMEOUT", "60")),
+    )
 
 
-clients: Set[Client] = set()
-clients_lock = asyncio.Lock()
+# One state shard per session (X-Session-Id header, ?session_id= or the chat
+# body's session_id); requests without one share the "default" shard. The
+# web client gets its id from /chat/open once per tab and sends it on every
+# request and on the SSE stream.
+# Write-ahead journal per session: committed batches are appended to
+# journal/<session>/log.ndjson (fsync'd off the event loop every
+# STATE_WAL_FSYNC_MS) and compacted into a snapshot, written in the
+# background, every STATE_SNAPSHOT_EVERY revisions, so a restart
+# recovers every session's panels instead of re-running the agents.
+STATE_WAL = os.getenv("STATE_WAL", "1").strip().lower() not in ("0", "false", "no", "off")
+STATE_JOURNAL_DIR = Path(__file__).parent / "journal"
+STATE_WAL_FSYNC_MS = float(os.getenv("STATE_WAL_FSYNC_MS", "50"))
+
+
+def _new_journal(shard_id: str) -> OpLog:
+    return OpLog(
+        STATE_JOURNAL_DIR / shard_id,
+        snapshot_every=int(os.getenv("STATE_SNAPSHOT_EVERY", "200")),
+    )
+
+
+SHARDS = ShardRegistry(
+    initial_state=_initial_state.model_dump,
+    spill_dir=Path(__file__).parent / "sessions",
+    ttl=float(os.getenv("SESSION_TTL", "1800")),
+    log_size=int(os.getenv("STATE_DELTA_LOG_SIZE", "1024")),
+    hub_factory=_new_hub,
+    journal_factory=_new_journal if STATE_WAL else None,
+    journal_dir=STATE_JOURNAL_DIR,
+)
 
 
-async def broadcast(event: str, payload: Any) -> None:
+async def _journal_sync_loop() -> None:
+    while True:
+        await asyncio.sleep(max(STATE_WAL_FSYNC_MS, 10.0) / 1000.0)
+        try:
+            await asyncio.to_thread(SHARDS.sync)
+        except Exception as e:
+            global LAST_ERROR
+            LAST_ERROR = {"type": "journal_sync", "detail": str(e)}
+
+
+@app.on_event("startup")
+async def _recover_state() -> None:
+    # Recover the default session eagerly (others recover on first use) and
+    # keep fsync batching bounded in time.
+    SHARDS.get(None)
+    if STATE_WAL:
+        app.state.journal_sync = asyncio.create_task(_journal_sync_loop())
+
+
+@app.on_event("shutdown")
+async def _close_journals() -> None:
+    task = getattr(app.state, "journal_sync", None)
+    if task is not None:
+        task.cancel()
+    SHARDS.close()
+
+
+def _session_id(request: Request, body: Dict[str, Any] | None = None) -> Optional[str]:
+    return (
+        request.headers.get("x-session-id")
+        or request.query_params.get("session_id")
+        or (body or {}).get("session_id")
+    )
+
+
+def _audit(request: Request, source: str, **extra: Any) -> Dict[str, Any]:
+    """Journal fields saying who made a change and through what."""
+    out: Dict[str, Any] = {"source": source, **extra}
+    actor = request.headers.get("x-actor")
+    if actor:
+        out["actor"] = actor[:128]
+    return out
+
+
+def get_shard(request: Request, body: Dict[str, Any] | None = None) -> Shard:
+    try:
+        return SHARDS.get(_session_id(request, body))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+async def broadcast(shard: Shard, event: str, payload: Any, event_id: Optional[str] = None) -> None:
     message = {"event": event, "data": json.dumps(payload)}
-    async with clients_lock:
-        for c in list(clients):
-            try:
-                await c.queue.put(message)
-            except Exception:
-                clients.discard(c)
+    if event_id is not None:
+        message["id"] = event_id
+    shard.hub.publish(message)
 
 
-async def sse_generator(client: Client):
+async def publish_state(
+    shard: Shard,
+    new_state: Dict[str, Any],
+    ops: List[Dict[str, Any]],
+    audit: Optional[Dict[str, Any]] = None,
+) -> int:
+    """
+    Commit `new_state` and broadcast `ops` as its STATE_DELTA. An empty `ops`
+    means nothing changed: nothing is committed or sent and the current
+    revision is returned. `audit` (source, actor, ...) is recorded in the
+    journal. Caller holds shard.store.lock.
+    """
+    if not ops:
+        return shard.store.revision
+    rev = shard.store.commit(new_state, ops, audit)
+    await broadcast(shard, "STATE_DELTA", {"ops": ops, "rev": rev}, event_id=shard.store.event_id(rev))
+    return rev
+
+
+async def publish_snapshot(shard: Shard, new_state: Dict[str, Any], audit: Optional[Dict[str, Any]] = None) -> int:
+    """Commit `new_state` wholesale and broadcast it as a STATE_SNAPSHOT. Caller holds shard.store.lock."""
+    rev = shard.store.commit(new_state, None, audit)
+    await broadcast(shard, "STATE_SNAPSHOT", {"state": new_state, "rev": rev, "ts": time.time()}, event_id=shard.store.event_id(rev))
+    return rev
+
+
+async def sse_generator(shard: Shard, client: Client, last_event_id: Optional[str] = None):
+    store = shard.store
     yield {"event": "RUN_STARTED", "data": json.dumps({"ts": time.time()})}
-    async with STATE_LOCK:
-        snapshot = {"state": STATE, "ts": time.time()}
-    yield {"event": "STATE_SNAPSHOT", "data": json.dumps(snapshot)}
+
+    # Resume from Last-Event-ID when the delta log still covers it, else snapshot.
+    rev, root = store.head
+    since = store.parse_event_id(last_event_id)
+    replay = store.deltas_since(since) if since is not None else None
+    if replay is None:
+        snapshot = {"state": root, "rev": rev, "ts": time.time()}
+        yield {"event": "STATE_SNAPSHOT", "data": json.dumps(snapshot), "id": store.event_id(rev)}
+    else:
+        for r, ops in replay:
+            yield {"event": "STATE_DELTA", "data": json.dumps({"ops": ops, "rev": r}), "id": store.event_id(r)}
     try:
-        while True:
+        while not client.closed:
+            client.touch()
             try:
                 message = await asyncio.wait_for(client.queue.get(), timeout=15.0)
+                if message is RESYNC:
+                    # We lagged and our pending deltas were dropped; catch up in one go.
+                    rev, root = store.head
+                    snapshot = {"state": root, "rev": rev, "ts": time.time()}
+                    yield {"event": "STATE_SNAPSHOT", "data": json.dumps(snapshot), "id": store.event_id(rev)}
+                    continue
+                # Skip state events already covered by the snapshot/replay above.
+                msg_rev = store.parse_event_id(message.get("id"))
+                if msg_rev is not None and msg_rev <= rev:
+                    continue
                 yield message
             except asyncio.TimeoutError:
                 yield {"event": "HEARTBEAT", "data": json.dumps({"ts": time.time()})}
     finally:
-        async with clients_lock:
-            clients.discard(client)
+        shard.hub.disconnect(client)
 
 
 class PatchOp(BaseModel):
@@ -175,6 +414,8 @@ class PatchOp(BaseModel):
 
 class PatchRequest(BaseModel):
     ops: List[PatchOp]
+    # None follows PATCH_COALESCE_MS; True/False forces coalescing on/off for this request.
+    coalesce: Optional[bool] = None
 
 
 LAST_APPLIED: List[Dict[str, Any]] = []
@@ -186,18 +427,125 @@ def _normalize_ops(ops_raw: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
     for op in ops_raw:
         op2 = dict(op)
         if "from_" in op2:
-            op2["from"] = op2.pop("from_")
+            frm = op2.pop("from_")
+            if frm is not None:
+                op2["from"] = frm
+        if op2.get("op") in ("remove", "move", "copy") and op2.get("value") is None:
+            op2.pop("value", None)
         ops.append(op2)
     return ops
 
 
-def _validate_state(candidate: Dict[str, Any]) -> AppState:
-    """Validate dict against AppState; raise ValidationError if invalid."""
-    return AppState.model_validate(candidate)
+def _stamp(state: Dict[str, Any]) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    """Set /meta/server_timestamp; returns the new state and the op for it."""
+    return assign(state, "/meta/server_timestamp", time.time())
+
 
+def _validate_state(base: Dict[str, Any], candidate: Dict[str, Any], ops: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Validate `candidate` (= `base` + `ops`) against AppState and return the
+    normalized state dict; raise ValidationError if invalid.
+    """
+    global LAST_ERROR
+    if STATE_VALIDATION == "full":
+        return validate_full(candidate)
+    validated = validate_incremental(base, candidate, ops)
+    if STATE_VALIDATION == "verify":
+        expected = validate_full(candidate)
+        if validated != expected:
+            LAST_ERROR = {"type": "validation_mismatch", "ops": ops}
+            return expected
+    return validated
+
+
+# ---------- Derived state ----------
+# What each derived field reads and how it is computed; apply_patch recomputes
+# only the nodes its ops touched. Policies are read from the globals, so
+# reloading one must call DERIVED.clear().
+DERIVED = DerivedGraph(memo_size=int(os.getenv("DERIVED_MEMO_SIZE", "512")))
+
+DERIVED.register(Node(
+    "spend",
+    lambda ctx, amount, category, flags, requester, approver: derive_requirements(
+        {"amount": amount, "category": category, "flags": flags or [], "requester": requester, "approver": approver},
+        SPEND_POLICY,
+    ),
+    inputs=["/spend/amount", "/spend/category", "/spend/flags", "/spend/requester", "/spend/approver"],
+    outputs=lambda r: {"/spend/required_steps": r["required_steps"]},
+))
+
+def _delegation_engine(ctx: Dict[str, Any]) -> DelegationEngine:
+    # One incremental engine per shard; it rebuilds itself when DELEGATION_RULES is replaced.
+    shard = ctx.get("shard")
+    if shard is None:
+        return DelegationEngine()
+    return shard.evaluators.setdefault("delegation", DelegationEngine())
+
+# Not in the graph memo (fingerprinting /delegation costs as much as the
+# incremental engine); the engine itself returns its last result while the
+# /delegation subtree is the same object, so /spend edits do not revalidate.
+DERIVED.register(Node(
+    "delegation",
+    lambda ctx, delegation: _delegation_engine(ctx).validate(delegation or {}, DELEGATION_RULES),
+    inputs=["/delegation"],
+    memo=False,
+))
+DERIVED.register(Node(
+    "violations",
+    lambda ctx, spend, delegation: (spend.get("violations") or []) + (delegation or []),
+    deps=["spend", "delegation"],
+    outputs=lambda v: {"/violations": v},
+))
+
+
+# Panel results are shared across panels and sessions showing the same doc;
+# a doc's entries go as soon as its facts are rewritten.
+PANEL_CACHE = PanelCache(max_entries=int(os.getenv("PANEL_CACHE_SIZE", "1024")))
+facts_store.on_change(PANEL_CACHE.invalidate)
+
+
+def _register_panel(ptype: str, evaluate, outputs) -> None:
+    def compute(ctx: Dict[str, Any], _type: Any, controls: Any) -> Dict[str, Any]:
+        controls = controls or {}
+        return PANEL_CACHE.get_or_compute(
+            ctx["doc_id"], ctx["facts_version"], ptype, controls,
+            lambda: evaluate(ctx["doc_id"], {"type": ptype, "controls": controls}),
+        )
 
-def _ops_touch_prefix(ops: List[Dict[str, Any]], prefix: str) -> bool:
-    return any(o.get("path", "").startswith(prefix) for o in ops)
+    DERIVED.register(Node(
+        f"panel:{ptype}",
+        compute,
+        inputs=["/panel_configs/{panel}/type", "/panel_configs/{panel}/controls"],
+        panel_type=ptype,
+        outputs=outputs,
+        memo=False,
+    ))
+
+
+_register_panel(
+    "form_spending", evaluate_spending_controls,
+    lambda u: {"/panel_configs/{panel}/data/required_steps": u.get("required_steps", [])},
+)
+_register_panel(
+    "roles_sod", evaluate_roles_controls,
+    lambda u: {"/panel_configs/{panel}/data/violations": u.get("violations", [])},
+)
+_register_panel(
+    "control_checklists", evaluate_control_checklists,
+    lambda u: {"/panel_configs/{panel}/data/status": {
+        "travel": u.get("travel", []),
+        "bank":   u.get("bank", []),
+        "credit": u.get("credit", []),
+    }},
+)
+_register_panel(
+    "exceptions_tracker", evaluate_exceptions_controls,
+    lambda u: {"/panel_configs/{panel}/data/status": u.get("status", {"approvals": [], "documentation": [], "reporting": []})},
+)
+_register_panel(
+    "approval_chain", evaluate_approval_controls,
+    lambda u: {"/panel_configs/{panel}/data/chain": u.get("chain", [])},
+)
 
 
 def _export_csv_from_state(state: Dict[str, Any]) -> str:
@@ -336,9 +684,8 @@ async def health():
 
 
 @app.get("/agui/state")
-async def get_state():
-    async with STATE_LOCK:
-        return STATE
+async def get_state(request: Request):
+    return get_shard(request).store.root
 
 
 @app.get("/agui/schema")
@@ -347,8 +694,8 @@ async def get_schema():
 
 
 @app.post("/agui/reset")
-async def reset_state(body: Dict[str, Any] | None = None):
-    global STATE
+async def reset_state(request: Request, body: Dict[str, Any] | None = None):
+    shard = get_shard(request)
     panels = (body or {}).get("panels", [])
     fresh = AppState(
         meta=Meta(docName="Demo Policy"),
@@ -358,28 +705,39 @@ async def reset_state(body: Dict[str, Any] | None = None):
         violations=[],
         citations=[],
     ).model_dump()
-    async with STATE_LOCK:
-        STATE.clear()
-        STATE.update(fresh)
-    await broadcast("STATE_SNAPSHOT", {"state": STATE, "ts": time.time()})
-    return {"ok": True, "state": STATE}
+    async with shard.store.lock:
+        await publish_snapshot(shard, fresh, _audit(request, "reset"))
+    return {"ok": True, "state": fresh}
 
 
 @app.get("/debug/last")
-async def debug_last():
-    return {"last_applied": LAST_APPLIED, "last_error": LAST_ERROR}
+async def debug_last(request: Request):
+    shard = get_shard(request)
+    return {"last_applied": LAST_APPLIED, "last_error": LAST_ERROR, "sse": shard.hub.stats(), "shards": SHARDS.stats(), "derived": DERIVED.stats(), "panels": PANEL_CACHE.stats(), "retrieval": RETRIEVAL_CACHE.stats(), "corpus": CORPUS.stats()}
+
+
+@app.get("/agui/audit")
+async def audit_log(request: Request, since: int = 0, limit: int = 100, path: Optional[str] = None):
+    """Journaled commits of the caller's session (who changed what, when), oldest first."""
+    shard = get_shard(request)
+    journal = shard.store.journal
+    if journal is None:
+        return JSONResponse(status_code=404, content={"error": "State journal is disabled (STATE_WAL=0)"})
+    entries = await asyncio.to_thread(journal.history, since, max(1, min(limit, 1000)), path)
+    return {"session_id": shard.id, "entries": entries}
 
 
 @app.get("/agui/stream")
 async def stream(request: Request):
-    client = Client()
-    async with clients_lock:
-        clients.add(client)
-    return EventSourceResponse(sse_generator(client))
+    last_event_id = request.headers.get("last-event-id") or request.query_params.get("lastEventId")
+    shard = get_shard(request)
+    client = shard.hub.connect()
+    return EventSourceResponse(sse_generator(shard, client, last_event_id))
 
 
 @app.post("/ingest/upload")
 async def ingest_upload(
+    request: Request,
     background: BackgroundTasks,
     file: UploadFile = File(...),
     kind: str = Form("auto"),
@@ -390,42 +748,27 @@ async def ingest_upload(
     - Persist and reload policies
     - Update meta.docName and broadcast a small delta
     """
+    shard = get_shard(request)
     filename = file.filename or "uploaded"
     ext = os.path.splitext(filename)[1].lower()
     save_path = DOCS_DIR / filename
-    with save_path.open("wb") as f:
-        f.write(await file.read())
+    await JOBS.run_blocking(save_path.write_bytes, await file.read())
 
-    if ext == ".pdf":
-        text = extract_text_from_pdf(str(save_path))
-    elif ext in (".txt",):
-        text = save_path.read_text(encoding="utf-8", errors="ignore")
-    else:
+    if ext not in (".pdf", ".txt"):
         return JSONResponse(
             status_code=400, content={"error": "Only .pdf or .txt supported for now"}
         )
+    text = await JOBS.run_blocking(_read_upload, save_path)
 
-    compiled_spend = None
-    compiled_deleg = None
-
-    if kind in ("auto", "spend"):
-        compiled_spend = compile_spend_policy(text)
-        _save_spend_policy(compiled_spend)
-
-    elif kind in ("llm", "auto_llm"):
-        compiled_spend = compile_spend_policy_llm(text)  
-        if compiled_spend.get("spend_policy"):
-            _save_spend_policy({"spend_policy": compiled_spend["spend_policy"]})
-
-    if kind in ("auto", "delegation", "llm", "auto_llm"):
-        compiled_deleg = compile_delegation_rules(text)
-        _save_delegation_rules(compiled_deleg)
+    # Compilers (and, for kind=llm, the model call) and the policy writes stay off the event loop.
+    compiled_spend, compiled_deleg = await JOBS.run_blocking(_compile_policies, text, kind)
 
     global SPEND_POLICY, DELEGATION_RULES
     if compiled_spend is not None:
-        SPEND_POLICY = _load_spend_policy()
+        SPEND_POLICY = await JOBS.run_blocking(_load_spend_policy)
     if compiled_deleg is not None:
-        DELEGATION_RULES = _load_delegation_rules()
+        DELEGATION_RULES = await JOBS.run_blocking(_load_delegation_rules)
+    DERIVED.clear()
 
     citations: List[Dict[str, Any]] = []
     if compiled_spend and "spend_policy" in compiled_spend:
@@ -441,27 +784,12 @@ async def ingest_upload(
                 {"key": row.get("key", "delegation"), "snippet": row.get("snippet", "")}
             )
 
-    async with STATE_LOCK:
-        STATE["meta"]["docName"] = filename
-        STATE["citations"] = citations
-
-    await broadcast(
-        "STATE_DELTA",
-        {
-            "ops": [
-                {
-                    "op": "replace" if "docName" in STATE["meta"] else "add",
-                    "path": "/meta/docName",
-                    "value": filename,
-                },
-                {
-                    "op": "replace" if "citations" in STATE else "add",
-                    "path": "/citations",
-                    "value": citations,
-                },
-            ]
-        },
-    )
+    doc_ops = [
+        {"op": "replace", "path": "/meta/docName", "value": filename},
+        {"op": "replace", "path": "/citations", "value": citations},
+    ]
+    async with shard.store.lock:
+        await publish_state(shard, shard.store.preview(doc_ops), effective_ops(shard.store.root, doc_ops), _audit(request, "ingest", file=filename))
 
     threshold = None
     if compiled_spend:
@@ -477,48 +805,34 @@ async def ingest_upload(
     doc_id = filename
     CURRENT_DOC_ID = doc_id
 
-    chunks = chunk_text_to_paragraphs(text, page_map=[])
-    DOC_INDEXES[doc_id] = DocIndex(doc_id=doc_id, chunks=chunks)
+    DOC_INDEXES[doc_id] = await JOBS.run_blocking(_build_index, doc_id, text)
+    await JOBS.run_blocking(_persist_index, DOC_INDEXES[doc_id])
 
-    async with STATE_LOCK:
-        STATE["meta"]["doc_id"] = doc_id
-
-    await broadcast(
-        "STATE_DELTA",
-        {
-            "ops": [
-                {
-                    "op": "add" if "doc_id" not in STATE["meta"] else "replace",
-                    "path": "/meta/doc_id",
-                    "value": doc_id,
-                }
-            ]
-        },
-    )
+    doc_id_ops = [{"op": "add", "path": "/meta/doc_id", "value": doc_id}]
+    async with shard.store.lock:
+        await publish_state(shard, shard.store.preview(doc_id_ops), effective_ops(shard.store.root, doc_id_ops), _audit(request, "ingest", file=filename))
 
     # --- Auto-create key panels from the uploaded document (Control Calendar, Exceptions) ---
+    global LAST_ERROR
     try:
         # Reuse the doc index for agents
-        result_controls = run_control_checklists(doc_id, index, "control calendar")
-        result_exceptions = run_exceptions_tracker(doc_id, index, "exceptions")
+        index = DOC_INDEXES[doc_id]
+        result_controls = await JOBS.run_blocking(run_control_checklists, doc_id, index, "control calendar")
+        result_exceptions = await JOBS.run_blocking(run_exceptions_tracker, doc_id, index, "exceptions")
 
         auto_patches = (result_controls.get("patches") or []) + (result_exceptions.get("patches") or [])
 
         if auto_patches:
             try:
-                async with STATE_LOCK:
-                    base = json.loads(json.dumps(STATE))
-                    patched = jsonpatch.apply_patch(base, auto_patches, in_place=False)
-                    validated_model = _validate_state(patched)
-                    new_state = validated_model.model_dump()
-                    new_state["meta"]["server_timestamp"] = time.time()
-                    server_op = {"op": "replace", "path": "/meta/server_timestamp", "value": new_state["meta"]["server_timestamp"]}
-                    for k in list(STATE.keys()):
-                        STATE[k] = new_state[k]
+                async with shard.store.lock:
+                    base = shard.store.root
+                    new_state = _validate_state(base, shard.store.preview(auto_patches), auto_patches)
+                    delta = diff(base, new_state)
+                    if delta:
+                        new_state, server_op = _stamp(new_state)
+                        await publish_state(shard, new_state, delta + [server_op], _audit(request, "ingest_auto_panels", file=filename))
             except Exception as e:
                 LAST_ERROR = {"type": "ingest_auto_panels_apply", "detail": str(e), "patches": auto_patches}
-            else:
-                await broadcast("STATE_DELTA", {"ops": auto_patches + [server_op]})
     except Exception as e:
         # Do not fail upload on agent errors
         LAST_ERROR = {"type": "ingest_auto_panels", "detail": str(e)}
@@ -526,6 +840,7 @@ async def ingest_upload(
     # Suggest a guided workflow in chat
     try:
         await broadcast(
+            shard,
             "TOOL_RESULT",
             {
                 "name": "chat_message",
@@ -542,7 +857,7 @@ async def ingest_upload(
             {"label": "Spending Checker", "kind": "chat", "prompt": "spending checker"},
             {"label": "Export CSV", "kind": "export"},
         ]
-        await broadcast("TOOL_RESULT", {"name": "action_items", "items": suggestions})
+        await broadcast(shard, "TOOL_RESULT", {"name": "action_items", "items": suggestions})
     except Exception:
         pass
 
@@ -567,12 +882,13 @@ async def compile_spend(text: Dict[str, str] = Body(...), persist: bool = True):
             status_code=400, content={"error": "Provide 'text' with policy excerpt"}
         )
 
-    compiled = compile_spend_policy(raw)
+    compiled = await JOBS.run_blocking(compile_spend_policy, raw)
 
     if persist:
-        _save_spend_policy(compiled)
+        await JOBS.run_blocking(_save_spend_policy, compiled)
         global SPEND_POLICY
-        SPEND_POLICY = _load_spend_policy()
+        SPEND_POLICY = await JOBS.run_blocking(_load_spend_policy)
+        DERIVED.clear()
 
     return {"ok": True, "compiled": compiled, "persisted": bool(persist)}
 
@@ -581,9 +897,189 @@ async def compile_spend(text: Dict[str, str] = Body(...), persist: bool = True):
 async def reload_spend_policy():
     global SPEND_POLICY
     SPEND_POLICY = _load_spend_policy()
+    DERIVED.clear()
     return {"ok": True}
 
 
+@app.post("/policy/spend/batch")
+async def spend_batch(
+    request: Request,
+    file: UploadFile = File(...),
+    format: Optional[str] = Form(None),
+    output: str = Form("ndjson"),
+    doc_id: Optional[str] = Form(None),
+):
+    """
+    Evaluate a CSV/NDJSON file of spends (amount, category, requester, approver)
+    against SPEND_POLICY and, if the session (or `doc_id`) has one, the doc's
+    spending_rules facts. Results stream back as NDJSON or CSV, one row each.
+    """
+    fmt = format or format_for(file.filename or "")
+    if fmt not in INPUT_FORMATS or output not in ("csv", "ndjson"):
+        return JSONResponse(status_code=400, content={"error": "format must be 'csv', 'tsv' or 'ndjson'; output 'csv' or 'ndjson'"})
+    doc_id = doc_id or get_shard(request).store.root.get("meta", {}).get("doc_id")
+    rules = (await asyncio.to_thread(facts_store.load, doc_id)).get("spending_rules") if doc_id else None
+    batch = SpendBatch(SPEND_POLICY, rules)
+
+    def body():
+        # Sync generator: Starlette iterates it in a worker thread, chunk by chunk.
+        stream = io.TextIOWrapper(file.file, encoding="utf-8", errors="replace", newline="")
+        results = batch.run(read_rows(stream, fmt))
+        try:
+            yield from (to_csv(results) if output == "csv" else to_ndjson(results))
+        except ValueError as e:
+            # Headers are already sent; report bad input as a final record.
+            yield f"error,{json.dumps(str(e))}\n" if output == "csv" else json.dumps({"error": str(e)}) + "\n"
+
+    media = "text/csv" if output == "csv" else "application/x-ndjson"
+    return StreamingResponse(body(), media_type=media)
+
+
+@app.post("/approval/chain/batch")
+async def approval_chain_batch(
+    request: Request,
+    file: UploadFile = File(...),
+    format: Optional[str] = Form(None),
+    output: str = Form("ndjson"),
+    doc_id: Optional[str] = Form(None),
+    amount_field: str = Form("amount"),
+    instrument_field: str = Form("instrument"),
+):
+    """
+    Resolve the approval chain of every payment in a CSV/NDJSON ledger
+    (amount, instrument, optional id) from the doc's approval_chain_rules.
+    The ledger is streamed in and results stream back, one row each.
+    """
+    fmt = format or format_for(file.filename or "")
+    if fmt not in INPUT_FORMATS or output not in ("csv", "ndjson"):
+        return JSONResponse(status_code=400, content={"error": "format must be 'csv', 'tsv' or 'ndjson'; output 'csv' or 'ndjson'"})
+    doc_id = doc_id or get_shard(request).store.root.get("meta", {}).get("doc_id")
+    if not doc_id:
+        return JSONResponse(status_code=400, content={"error": "no doc_id (pass one or ingest a document first)"})
+    rules = (await asyncio.to_thread(facts_store.load, doc_id)).get("approval_chain_rules") or {}
+    resolver = await asyncio.to_thread(chain_resolver, rules, doc_id)
+
+    def body():
+        stream = io.TextIOWrapper(file.file, encoding="utf-8", errors="replace", newline="")
+        results = batch_approval.resolve_rows(resolver, read_rows(stream, fmt), amount_field, instrument_field)
+        try:
+            yield from (batch_approval.to_csv(results) if output == "csv" else batch_approval.to_ndjson(results))
+        except ValueError as e:
+            yield f"error,{json.dumps(str(e))}\n" if output == "csv" else json.dumps({"error": str(e)}) + "\n"
+
+    media = "text/csv" if output == "csv" else "application/x-ndjson"
+    return StreamingResponse(body(), media_type=media)
+
+
+@app.post("/controls/checklists/batch")
+async def control_checklists_batch(
+    request: Request,
+    file: UploadFile = File(...),
+    format: Optional[str] = Form(None),
+    output: str = Form("ndjson"),
+    doc_id: Optional[str] = Form(None),
+    rule_set: str = Form("all"),
+):
+    """
+    Evaluate a CSV/NDJSON file of travel claims or reconciliation records
+    against the doc's control_rules (all rule sets, or travel/bank/credit).
+    NDJSON streams one PASS/FAIL/UNKNOWN record per row and ends with a
+    summary line of counts per rule code; CSV streams the records only;
+    `summary` returns just the summary.
+    """
+    fmt = format or format_for(file.filename or "")
+    if fmt not in INPUT_FORMATS or output not in ("csv", "ndjson", "summary"):
+        return JSONResponse(status_code=400, content={"error": "format must be 'csv', 'tsv' or 'ndjson'; output 'csv', 'ndjson' or 'summary'"})
+    if rule_set != "all" and rule_set not in batch_controls.RULE_SETS:
+        return JSONResponse(status_code=400, content={"error": f"rule_set must be 'all' or one of {list(batch_controls.RULE_SETS)}"})
+    doc_id = doc_id or get_shard(request).store.root.get("meta", {}).get("doc_id")
+    if not doc_id:
+        return JSONResponse(status_code=400, content={"error": "no doc_id (pass one or ingest a document first)"})
+    rules = (await asyncio.to_thread(facts_store.load, doc_id)).get("control_rules") or {}
+    batch = batch_controls.ChecklistBatch(rules, rule_set)
+    summary = batch.new_summary()
+
+    def records():
+        stream = io.TextIOWrapper(file.file, encoding="utf-8", errors="replace", newline="")
+        return batch.run(read_rows(stream, fmt), summary)
+
+    if output == "summary":
+        def consume() -> Dict[str, Any]:
+            for _ in records():
+                pass
+            return dict(summary, failures=batch_controls.failure_counts(summary))
+        try:
+            return await asyncio.to_thread(consume)
+        except ValueError as e:
+            return JSONResponse(status_code=400, content={"error": str(e)})
+
+    def body():
+        try:
+            if output == "csv":
+                yield from batch_controls.to_csv(records(), batch.codes)
+            else:
+                yield from batch_controls.to_ndjson(records(), summary)
+        except ValueError as e:
+            yield f"error,{json.dumps(str(e))}\n" if output == "csv" else json.dumps({"error": str(e)}) + "\n"
+
+    media = "text/csv" if output == "csv" else "application/x-ndjson"
+    return StreamingResponse(body(), media_type=media)
+
+
+@app.post("/exceptions/batch")
+async def exceptions_batch(
+    request: Request,
+    file: UploadFile = File(...),
+    format: Optional[str] = Form(None),
+    output: str = Form("ndjson"),
+    doc_id: Optional[str] = Form(None),
+):
+    """
+    Resolve a CSV/NDJSON file of waiver requests (keywords, amount, optional
+    id) against the exception policies of `doc_id` (comma-separated for
+    several docs; default: the session's doc). NDJSON streams one result per
+    request and ends with a summary of required approvals, documentation and
+    reporting; CSV streams the results only; `summary` returns just the summary.
+    """
+    fmt = format or format_for(file.filename or "")
+    if fmt not in INPUT_FORMATS or output not in ("csv", "ndjson", "summary"):
+        return JSONResponse(status_code=400, content={"error": "format must be 'csv', 'tsv' or 'ndjson'; output 'csv', 'ndjson' or 'summary'"})
+    doc_ids = [d.strip() for d in (doc_id or "").split(",") if d.strip()]
+    if not doc_ids:
+        session_doc = get_shard(request).store.root.get("meta", {}).get("doc_id")
+        if not session_doc:
+            return JSONResponse(status_code=400, content={"error": "no doc_id (pass one or ingest a document first)"})
+        doc_ids = [session_doc]
+    matcher = await asyncio.to_thread(lambda: ExceptionMatcher(batch_exceptions.library(doc_ids)))
+    summary = batch_exceptions.new_summary()
+
+    def results():
+        stream = io.TextIOWrapper(file.file, encoding="utf-8", errors="replace", newline="")
+        return batch_exceptions.resolve_rows(matcher, read_rows(stream, fmt), summary)
+
+    if output == "summary":
+        def consume() -> Dict[str, Any]:
+            for _ in results():
+                pass
+            return summary
+        try:
+            return await asyncio.to_thread(consume)
+        except ValueError as e:
+            return JSONResponse(status_code=400, content={"error": str(e)})
+
+    def body():
+        try:
+            if output == "csv":
+                yield from batch_exceptions.to_csv(results())
+            else:
+                yield from batch_exceptions.to_ndjson(results(), summary)
+        except ValueError as e:
+            yield f"error,{json.dumps(str(e))}\n" if output == "csv" else json.dumps({"error": str(e)}) + "\n"
+
+    media = "text/csv" if output == "csv" else "application/x-ndjson"
+    return StreamingResponse(body(), media_type=media)
+
+
 @app.get("/policy/delegation")
 async def get_delegation_rules():
     return DELEGATION_RULES
@@ -593,9 +1089,128 @@ async def get_delegation_rules():
 async def reload_delegation_rules():
     global DELEGATION_RULES
     DELEGATION_RULES = _load_delegation_rules()
+    DERIVED.clear()
     return {"ok": True}
 
 
+@app.get("/delegation/acting")
+async def acting_holders(
+    request: Request,
+    role: Optional[str] = None,
+    on: Optional[str] = None,
+    start: Optional[str] = None,
+    end: Optional[str] = None,
+):
+    """
+    Who may act in `role` on day `on` (or at any time in [start, end]), from
+    the session's acting grants; also lists the role's permanent assignee.
+    Without a role every role is reported.
+    """
+    lo, hi = (on, on) if on else (start, end)
+    lo_d = day(lo) if lo else -math.inf
+    hi_d = day(hi) if hi else math.inf
+    if lo_d is None or hi_d is None:
+        return JSONResponse(status_code=400, content={"error": "dates must be YYYY-MM-DD"})
+    shard = get_shard(request)
+    delegation = shard.store.root.get("delegation") or {}
+    engine = _delegation_engine({"shard": shard})
+    engine.validate(delegation, DELEGATION_RULES)  # brings the timeline up to the current state
+    acting = delegation.get("acting") or []
+    assignments = delegation.get("assignments") or {}
+    roles = [role] if role else sorted(engine.timeline.trees)
+    return {
+        "on": on, "start": start, "end": end,
+        "roles": {
+            r: {
+                "assigned": assignments.get(r),
+                "acting": [dict(acting[i], index=i) for i in sorted(engine.timeline.overlapping(r, lo_d, hi_d))],
+            }
+            for r in roles
+        },
+    }
+
+
+@app.get("/delegation/acting/overlaps")
+async def acting_overlaps(request: Request, role: Optional[str] = None):
+    """Every pair of overlapping acting grants for the same role (indices into /delegation/acting)."""
+    shard = get_shard(request)
+    delegation = shard.store.root.get("delegation") or {}
+    engine = _delegation_engine({"shard": shard})
+    engine.validate(delegation, DELEGATION_RULES)
+    return {"overlaps": [{"role": r, "grants": [i, j]} for r, i, j in engine.timeline.overlaps(role)]}
+
+
+@app.post("/policy/delegation/batch")
+async def delegation_batch(
+    file: UploadFile = File(...),
+    format: Optional[str] = Form(None),
+    people: Optional[UploadFile] = File(None),
+):
+    """
+    Validate an org assignment file (CSV/NDJSON rows of person, role and an
+    optional unit) against DELEGATION_RULES and return every conflict. With a
+    `people` roster (one name per line) assignees are checked against it too.
+    """
+    fmt = format or format_for(file.filename or "")
+    if fmt not in INPUT_FORMATS:
+        return JSONResponse(status_code=400, content={"error": "format must be 'csv', 'tsv' or 'ndjson'"})
+
+    def run() -> Dict[str, Any]:
+        roster = None
+        if people is not None:
+            text = io.TextIOWrapper(people.file, encoding="utf-8", errors="replace")
+            roster = {line.strip() for line in text if line.strip()}
+        stream = io.TextIOWrapper(file.file, encoding="utf-8", errors="replace", newline="")
+        return check_org(read_rows(stream, fmt), DELEGATION_RULES, roster)
+
+    try:
+        return await asyncio.to_thread(run)
+    except ValueError as e:
+        return JSONResponse(status_code=400, content={"error": str(e)})
+
+
+@app.get("/search")
+async def search(
+    q: str,
+    doc_id: Optional[List[str]] = Query(None),
+    section: Optional[str] = None,
+    page: int = 1,
+    page_size: int = 10,
+):
+    """
+    BM25 search over every ingested doc. Repeat `doc_id` to search some docs;
+    `section` ("2.2", "6.2") keeps chunks under that heading. Snippets are
+    HTML-escaped with the matched terms in <mark>.
+    """
+    if not q.strip():
+        return JSONResponse(status_code=400, content={"error": "Provide a non-empty 'q'"})
+    page, page_size = max(1, page), max(1, min(page_size, 100))
+
+    def run() -> Dict[str, Any]:
+        CORPUS.sync(INDEX_DIR)
+        total, hits = CORPUS.search(q, (page - 1) * page_size, page_size, doc_ids=doc_id, section=section)
+        terms = CORPUS.analyzer(q)
+        return {
+            "query": q,
+            "total": total,
+            "page": page,
+            "page_size": page_size,
+            "results": [
+                {
+                    "doc_id": h.doc_id,
+                    "chunk_id": h.chunk.id,
+                    "page": h.chunk.page,
+                    "section": h.chunk.section,
+                    "score": round(h.score, 4),
+                    "snippet": snippet(h.chunk.text, terms, CORPUS.analyzer),
+                }
+                for h in hits
+            ],
+        }
+
+    return await asyncio.to_thread(run)
+
+
 class ChatOpenRequest(BaseModel):
     pass
 
@@ -607,15 +1222,23 @@ class ChatOpenResponse(BaseModel):
 
 
 @app.post("/chat/open")
-async def chat_open(body: ChatOpenRequest):
+async def chat_open(body: ChatOpenRequest, request: Request):
+    origin = get_shard(request).store.root.get("meta", {})
     session_id = uuid4().hex[:12]
+    # The new session starts with its own empty state, bound to the caller's
+    # current doc. That is its seed, not a commit: a session nobody uses is
+    # never journaled and is dropped when it goes idle.
+    seed = SHARDS.initial_state()
+    if origin.get("doc_id"):
+        seed = set_in(set_in(seed, "/meta/docName", origin.get("docName")), "/meta/doc_id", origin["doc_id"])
+    shard = SHARDS.get(session_id, seed=seed)
     greeting = (
         "Hi! I’m your Policy Assistant. Ask me for a **Spending Checker**, "
         "**Roles & SoD**, **Approval Checklist**, or **Timeline**—or just type your question."
     )
     return {
         "session_id": session_id,
-        "doc_id": STATE.get("meta", {}).get("doc_id"),
+        "doc_id": shard.store.root.get("meta", {}).get("doc_id"),
         "greeting": greeting,
     }
 
@@ -716,11 +1339,83 @@ class ChatAskRequest(BaseModel):
 #     return {"ok": True}
 
 
+AGENTS = {
+    "spending": run_spending_checker,
+    "roles_sod": run_roles_sod,
+    "approval_chain": run_approval_chain,
+    "controls": run_control_checklists,
+    "exceptions": run_exceptions_tracker,
+}
+
+CHAT_HELP = (
+    "I can create panels for:\n"
+    "• Spending Checker\n"
+    "• Roles & SoD\n"
+    "• Approval Chain\n"
+    "• Control Calendar & Checklists\n"
+    "• Exceptions & Waiver Tracker\n\n"
+    "Try: “Spending checker”, “Roles & SoD”, “Approval chain”, "
+    "“Control calendar”, or “Exceptions tracker”."
+)
+
+
+async def _chat_job(
+    job: Job, shard: Shard, doc_id: str, index: DocIndex, intent: str, prompt: str, audit: Dict[str, Any]
+) -> Dict[str, Any]:
+    """Run the agent for `intent` in the worker pool, then apply its patches to the shard."""
+    agent = AGENTS.get(intent)
+    if agent is None:
+        result = {"patches": [], "message": CHAT_HELP}
+    else:
+        await JOBS.progress(job, "agent", intent=intent)
+        try:
+            result = await JOBS.run_blocking(agent, doc_id, index, prompt)
+        except Exception as e:
+            raise RuntimeError(f"Agent failed: {type(e).__name__}: {e}")
+
+    patches = result.get("patches") or []
+
+    await JOBS.progress(job, "apply", ops=len(patches))
+    try:
+        async with shard.store.lock:
+            # Agents emit whole panel configs; only what actually changed goes on the wire.
+            base = shard.store.root
+            new_state = _validate_state(base, shard.store.preview(patches), patches)
+            delta = diff(base, new_state)
+            if delta:
+                new_state, server_op = _stamp(new_state)
+                await publish_state(shard, new_state, delta + [server_op], dict(audit, job=job.id))
+    except Exception as e:
+        global LAST_ERROR
+        LAST_ERROR = {"type": "chat_ask_apply", "detail": str(e), "patches": patches}
+        raise RuntimeError(f"State update failed: {type(e).__name__}: {e}")
+
+    if result.get("message"):
+        await broadcast(shard, "TOOL_RESULT", {"name": "chat_message", "message": result["message"], "job_id": job.id})
+
+    # Provide actionable suggestions/buttons for the UI
+    try:
+        suggestions = [
+            {"label": "Open Control Calendar", "kind": "chat", "prompt": "control calendar"},
+            {"label": "Open Exceptions Tracker", "kind": "chat", "prompt": "exceptions"},
+            {"label": "Open Approval Chain", "kind": "chat", "prompt": "approval chain"},
+            {"label": "Export CSV", "kind": "export"},
+        ]
+        await broadcast(shard, "TOOL_RESULT", {"name": "action_items", "items": suggestions})
+    except Exception:
+        pass
+
+    return {"message": result.get("message")}
+
+
 @app.post("/chat/ask")
 async def chat_ask(request: Request):
     """
     Flexible chat endpoint:
     Accepts {"prompt":"..."} or {"message":"..."} or {"text":"..."}.
+    Starts the agent as a background job and returns its job_id right away;
+    progress arrives over SSE as RUN_STARTED / RUN_PROGRESS / RUN_FINISHED.
+    Pass {"wait": true} to block until the job is done.
     Applies agent patches; broadcasts only if the new state validates.
     """
     try:
@@ -735,77 +1430,38 @@ async def chat_ask(request: Request):
     if not prompt:
         return JSONResponse(status_code=422, content={"error": "Missing 'prompt' string"})
 
-    doc_id = STATE.get("meta", {}).get("doc_id")
-    if not doc_id or doc_id not in DOC_INDEXES:
+    shard = get_shard(request, data)
+    doc_id = shard.store.root.get("meta", {}).get("doc_id")
+    index = await _doc_index(doc_id) if doc_id else None
+    if index is None:
         return JSONResponse(status_code=400, content={"error": "No document uploaded yet"})
 
-    index = DOC_INDEXES[doc_id]
-
-    try:
-        intent = detect_intent(prompt)
-        if intent == "spending":
-            result = run_spending_checker(doc_id, index, prompt)
-        elif intent == "roles_sod":
-            result = run_roles_sod(doc_id, index, prompt)
-        elif intent == "approval_chain":
-            result = run_approval_chain(doc_id, index, prompt)
-        elif intent == "controls":
-            result = run_control_checklists(doc_id, index, prompt)
-        elif intent == "exceptions":
-            result = run_exceptions_tracker(doc_id, index, prompt)
-        else:
-            result = {
-                "patches": [],
-                "message": (
-                    "I can create panels for:\n"
-                    "• Spending Checker\n"
-                    "• Roles & SoD\n"
-                    "• Approval Chain\n"
-                    "• Control Calendar & Checklists\n"
-                    "• Exceptions & Waiver Tracker\n\n"
-                    "Try: “Spending checker”, “Roles & SoD”, “Approval chain”, "
-                    "“Control calendar”, or “Exceptions tracker”."
-                ),
-            }
-    except Exception as e:
-        return JSONResponse(status_code=500, content={"error": f"Agent failed: {type(e).__name__}: {e}"})
-
+    intent = detect_intent(prompt)
 
-    patches = result.get("patches") or []
+    async def notify(event: str, payload: Dict[str, Any]) -> None:
+        await broadcast(shard, event, payload)
 
     try:
-        async with STATE_LOCK:
-            base = json.loads(json.dumps(STATE))
-            patched = jsonpatch.apply_patch(base, patches, in_place=False)
-            validated_model = _validate_state(patched)   
-            new_state = validated_model.model_dump()
-            new_state["meta"]["server_timestamp"] = time.time()
-            server_op = {"op": "replace", "path": "/meta/server_timestamp", "value": new_state["meta"]["server_timestamp"]}
-            for k in list(STATE.keys()):
-                STATE[k] = new_state[k]
-    except Exception as e:
-        global LAST_ERROR
-        LAST_ERROR = {"type": "chat_ask_apply", "detail": str(e), "patches": patches}
-        return JSONResponse(status_code=500, content={"error": f"State update failed: {type(e).__name__}: {e}"})
+        audit = _audit(request, f"agent:{intent}")
+        job = JOBS.submit("chat", notify, lambda job: _chat_job(job, shard, doc_id, index, intent, prompt, audit))
+    except JobBusy as e:
+        return JSONResponse(status_code=429, content={"error": str(e)})
 
-    await broadcast("STATE_DELTA", {"ops": patches + [server_op]})
+    if not data.get("wait"):
+        return {"ok": True, "job_id": job.id, "intent": intent}
 
-    if result.get("message"):
-        await broadcast("TOOL_RESULT", {"name": "chat_message", "message": result["message"]})
+    await job.done.wait()
+    if job.status == "failed":
+        return JSONResponse(status_code=500, content={"error": job.error, "job_id": job.id})
+    return {"ok": True, "job_id": job.id, "intent": intent, "message": (job.result or {}).get("message")}
 
-    # Provide actionable suggestions/buttons for the UI
-    try:
-        suggestions = [
-            {"label": "Open Control Calendar", "kind": "chat", "prompt": "control calendar"},
-            {"label": "Open Exceptions Tracker", "kind": "chat", "prompt": "exceptions"},
-            {"label": "Open Approval Chain", "kind": "chat", "prompt": "approval chain"},
-            {"label": "Export CSV", "kind": "export"},
-        ]
-        await broadcast("TOOL_RESULT", {"name": "action_items", "items": suggestions})
-    except Exception:
-        pass
 
-    return {"ok": True}
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    job = JOBS.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown job")
+    return job.to_dict()
 
 
 # ---------- end chat routes ----------
@@ -1021,131 +1677,40 @@ async def chat_ask(request: Request):
 #     return {"ok": True, "applied": delta_ops}
 
 
-@app.post("/agui/patch")
-async def apply_patch(patch_req: PatchRequest):
+async def _commit_patch(
+    shard: Shard, ops: List[Dict[str, Any]], audit: Optional[Dict[str, Any]] = None
+) -> Tuple[int, Dict[str, Any]]:
+    """Validate, derive and commit one batch of client ops; returns (status_code, content)."""
     global LAST_APPLIED, LAST_ERROR
     LAST_ERROR = None
-    ops = _normalize_ops([op.model_dump() for op in patch_req.ops])
 
-    async with STATE_LOCK:
-        current = json.loads(json.dumps(STATE))
+    async with shard.store.lock:
+        current = shard.store.root
         try:
-            patched = jsonpatch.apply_patch(current, ops, in_place=False)
+            patched = shard.store.preview(ops)
         except jsonpatch.JsonPatchException as e:
             LAST_ERROR = {"type": "patch", "detail": str(e)}
-            return JSONResponse(status_code=400, content={"error": f"Invalid patch: {str(e)}"})
+            return 400, {"error": f"Invalid patch: {str(e)}"}
 
         try:
-            validated_model = _validate_state(patched)
-            validated = validated_model.model_dump()
+            validated = _validate_state(current, patched, ops)
         except ValidationError as ve:
             LAST_ERROR = {"type": "validation", "detail": json.loads(ve.json())}
-            return JSONResponse(status_code=400, content={"error": "Validation failed", "details": LAST_ERROR})
-
-        extra_ops: List[Dict[str, Any]] = []
-
-        # --- Spend derived steps + violations when /spend/* changes
-        if _ops_touch_prefix(ops, "/spend/"):
-            derived = derive_requirements(validated["spend"], SPEND_POLICY)
-            validated["spend"]["required_steps"] = derived["required_steps"]
-            extra_ops.append({
-                "op": "replace",
-                "path": "/spend/required_steps",
-                "value": derived["required_steps"],
-            })
-
-        # --- Delegation + Spend violations summary
-        if _ops_touch_prefix(ops, "/delegation/") or _ops_touch_prefix(ops, "/spend/"):
-            del_viol = validate_delegation(validated["delegation"], DELEGATION_RULES)
-        else:
-            del_viol = []
-        if _ops_touch_prefix(ops, "/spend/"):
-            spend_viol = derive_requirements(validated["spend"], SPEND_POLICY)["violations"]
-        else:
-            spend_viol = []
-        all_viol = (spend_viol or []) + (del_viol or [])
-        validated["violations"] = all_viol
-        extra_ops.append({"op": "replace", "path": "/violations", "value": all_viol})
-
-        # --- Dynamic panel control listeners (single place for all panels)
-        if _ops_touch_prefix(ops, "/panel_configs/"):
-            touched_panels: Set[str] = set()
-            for o in ops:
-                p = o.get("path", "")
-                if p.startswith("/panel_configs/") and "/controls/" in p:
-                    parts = p.split("/")
-                    if len(parts) >= 4:
-                        touched_panels.add(parts[2])
-
-
-            doc_id = validated.get("meta", {}).get("doc_id") or validated.get("meta", {}).get("docName", "default")
-
-
-            for panel_id in touched_panels:
-                panel_cfg = validated["panel_configs"].get(panel_id) or {}
-                ptype = panel_cfg.get("type")
-
-                if ptype == "form_spending":
-                    updates = evaluate_spending_controls(doc_id, panel_cfg)
-                    validated["panel_configs"][panel_id].setdefault("data", {})
-                    validated["panel_configs"][panel_id]["data"]["required_steps"] = updates.get("required_steps", [])
-                    extra_ops.append({
-                        "op": "replace",
-                        "path": f"/panel_configs/{panel_id}/data/required_steps",
-                        "value": updates.get("required_steps", []),
-                    })
-
-                elif ptype == "roles_sod":
-                    updates = evaluate_roles_controls(doc_id, panel_cfg)
-                    validated["panel_configs"][panel_id].setdefault("data", {})
-                    validated["panel_configs"][panel_id]["data"]["violations"] = updates.get("violations", [])
-                    extra_ops.append({
-                        "op": "replace",
-                        "path": f"/panel_configs/{panel_id}/data/violations",
-                        "value": updates.get("violations", []),
-                    })
-
-                elif ptype == "control_checklists":
-                    updates = evaluate_control_checklists(doc_id, panel_cfg)
-                    status = {
-                        "travel": updates.get("travel", []),
-                        "bank":   updates.get("bank", []),
-                        "credit": updates.get("credit", []),
-                    }
-                    validated["panel_configs"][panel_id].setdefault("data", {})
-                    validated["panel_configs"][panel_id]["data"]["status"] = status
-                    extra_ops.append({
-                        "op": "replace",
-                        "path": f"/panel_configs/{panel_id}/data/status",
-                        "value": status,
-                    })
-
-                elif ptype == "exceptions_tracker":
-                    updates = evaluate_exceptions_controls(doc_id, panel_cfg)
-                    validated["panel_configs"][panel_id].setdefault("data", {})
-                    validated["panel_configs"][panel_id]["data"]["status"] = updates.get("status", {"approvals":[],"documentation":[],"reporting":[]})
-                    extra_ops.append({
-                        "op": "replace",
-                        "path": f"/panel_configs/{panel_id}/data/status",
-                        "value": updates.get("status", {"approvals":[],"documentation":[],"reporting":[]}),
-                    })
-
-                elif ptype == "approval_chain":
-                    updates = evaluate_approval_controls(doc_id, panel_cfg)
-                    validated["panel_configs"][panel_id].setdefault("data", {})
-                    validated["panel_configs"][panel_id]["data"]["chain"] = updates.get("chain", [])
-                    extra_ops.append({
-                        "op": "replace",
-                        "path": f"/panel_configs/{panel_id}/data/chain",
-                        "value": updates.get("chain", []),
-                    })
-
+            return 400, {"error": "Validation failed", "details": LAST_ERROR}
 
+        # Ops that change nothing are neither broadcast nor used to pick derived fields
+        sent_ops = ops
+        ops = effective_ops(current, ops)
 
+        # --- Derived fields (spend steps, violations, panel data) for whatever the ops touched
+        meta = validated.get("meta", {})
+        doc_id = meta.get("doc_id") or meta.get("docName", "default")
+        ctx = {"doc_id": doc_id, "facts_version": facts_store.version(doc_id), "shard": shard}
+        validated, extra_ops = DERIVED.run(validated, ops, ctx)
 
         # --- Export CSV tool
         export_requested = False
-        for o in ops:
+        for o in sent_ops:
             if (
                 o.get("path") == "/meta/exportRequested"
                 and o.get("op") in ("add", "replace")
@@ -1156,8 +1721,8 @@ async def apply_patch(patch_req: PatchRequest):
 
         if export_requested:
             url = _export_csv_from_state(validated)
-            validated["meta"]["last_export_url"] = url
-            validated["meta"]["exportRequested"] = False
+            validated = set_in(validated, "/meta/last_export_url", url)
+            validated = set_in(validated, "/meta/exportRequested", False)
             extra_ops.extend([
                 {
                     "op": "add" if "exportRequested" not in current.get("meta", {}) else "replace",
@@ -1171,18 +1736,54 @@ async def apply_patch(patch_req: PatchRequest):
                 },
             ])
 
-        # --- Server timestamp + commit
-        validated["meta"]["server_timestamp"] = time.time()
-        server_op = {"op": "replace", "path": "/meta/server_timestamp", "value": validated["meta"]["server_timestamp"]}
+        # --- Server timestamp + commit (skipped entirely when nothing changed)
+        delta_ops = ops + extra_ops
+        if delta_ops:
+            validated, server_op = _stamp(validated)
+            delta_ops.append(server_op)
+        LAST_APPLIED = delta_ops
+        rev = await publish_state(shard, validated, delta_ops, audit or {"source": "patch"})
 
-        for k in list(STATE.keys()):
-            STATE[k] = validated[k]
+    if export_requested:
+        await broadcast(shard, "TOOL_RESULT", {"name": "export_csv", "url": validated["meta"].get("last_export_url")})
 
-    delta_ops = ops + extra_ops + [server_op]
-    LAST_APPLIED = delta_ops
-    await broadcast("STATE_DELTA", {"ops": delta_ops})
+    return 200, {"ok": True, "applied": delta_ops, "rev": rev}
 
-    if export_requested:
-        await broadcast("TOOL_RESULT", {"name": "export_csv", "url": STATE["meta"].get("last_export_url")})
 
-    return {"ok": True, "applied": delta_ops}
+def _coalesced_audit(audits: List[Optional[Dict[str, Any]]]) -> Dict[str, Any]:
+    """Journal fields of a coalesced commit: who made each merged batch, in order."""
+    audits = [a or {"source": "patch"} for a in audits]
+    if len(audits) == 1:
+        return audits[0]
+    out: Dict[str, Any] = {"source": "patch", "coalesced": len(audits), "actors": [a.get("actor") for a in audits]}
+    actors = {a.get("actor") for a in audits}
+    if len(actors) == 1 and None not in actors:
+        out["actor"] = audits[0]["actor"]
+    return out
+
+
+PATCH_COALESCER = PatchCoalescer(
+    lambda shard, ops, audits: _commit_patch(shard, ops, _coalesced_audit(audits)),
+    window=(PATCH_COALESCE_MS or 50.0) / 1000.0,
+    max_delay=float(os.getenv("PATCH_COALESCE_MAX_MS", "250")) / 1000.0,
+    max_ops=int(os.getenv("PATCH_COALESCE_MAX_OPS", "256")),
+)
+
+
+@app.post("/agui/patch")
+async def apply_patch(patch_req: PatchRequest, request: Request):
+    shard = get_shard(request)
+    ops = _normalize_ops([op.model_dump() for op in patch_req.ops])
+
+    coalesce = PATCH_COALESCE_MS > 0 if patch_req.coalesce is None else patch_req.coalesce
+    panel_id = controls_panel(ops) if coalesce else None
+    if panel_id is not None:
+        status, content = await PATCH_COALESCER.submit((shard.id, panel_id), shard, ops, _audit(request, "patch", coalesced=True))
+    else:
+        # Anything buffered for this session commits first so revisions keep request order.
+        await PATCH_COALESCER.flush_matching(lambda key: key[0] == shard.id)
+        status, content = await _commit_patch(shard, ops, _audit(request, "patch"))
+
+    if status != 200:
+        return JSONResponse(status_code=status, content=content)
+    return content
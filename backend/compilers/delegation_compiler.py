@@ -71,7 +71,7 @@ def compile_delegation_rules(text: str) -> Dict[str, Any]:
         "delegation": {
             "roles": roles,
             "constraints": constraints,
-            "acting_rules": { "require_dates": True },
+            "acting_rules": { "require_dates": True, "exclusive": True },
             "evidence": evidence  
         }
     }
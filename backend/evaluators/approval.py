@@ -0,0 +1,90 @@
+from __future__ import annotations
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+from evaluators.intervals import IntervalTable, from_condition, merged
+from evaluators.substrings import SubstringMatcher
+
+# Approval chains from a doc's `approval_chain_rules` facts:
+# {"levels": [{"condition": {...amount...}, "approvers": [...]}],
+#  "triggers": [{"when": {"instrument": "..."}, "add": [...]}]}
+#
+# A chain depends only on which amount segment of the levels table the
+# amount falls in and on the normalized instrument, so ChainResolver
+# memoizes per (segment, instrument) and a ledger with millions of rows
+# resolves each distinct combination once.
+
+
+def compile_levels(levels: List[Dict[str, Any]]) -> IntervalTable:
+    """Amount -> merged approver chain of every matching level, in level order."""
+    intervals, approvers = [], []
+    for lvl in levels:
+        cond = lvl.get("condition") or {}
+        intervals.append(from_condition(cond) if cond.get("field") == "amount" else None)
+        approvers.append([a for a in (lvl.get("approvers") or []) if isinstance(a, str)])
+    return IntervalTable(intervals, merged(approvers))
+
+
+def normalize_instrument(instrument: Any) -> str:
+    return str(instrument or "").strip().lower()
+
+
+class InstrumentMatcher(SubstringMatcher):
+    """
+    Which triggers fire for an instrument: trigger k fires iff its
+    (normalized) `when.instrument` is a substring of the instrument. All
+    trigger strings share one Aho-Corasick automaton, so a lookup is one pass
+    over the instrument whatever the number of triggers.
+    """
+
+    def __init__(self, triggers: List[Dict[str, Any]]):
+        super().__init__(
+            (normalize_instrument((trg.get("when") or {}).get("instrument")), k) for k, trg in enumerate(triggers)
+        )
+
+
+class ChainResolver:
+    """Compiled approval_chain_rules with a bounded (segment, instrument) -> chain memo."""
+
+    def __init__(self, rules: Dict[str, Any], memo_size: int = 4096):
+        self.levels = compile_levels(rules.get("levels") or [])
+        self.triggers = rules.get("triggers") or []
+        self.matcher = InstrumentMatcher(self.triggers)
+        self.memo_size = memo_size
+        self._memo: "OrderedDict[Tuple[int, str], Tuple[str, ...]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _build(self, seg: int, inst: str) -> Tuple[str, ...]:
+        chain: List[str] = list(self.levels.values[seg])
+        for k in self.matcher.match(inst):
+            for a in self.triggers[k].get("add") or []:
+                if a not in chain:
+                    chain.append(a)
+        return tuple(chain)
+
+    def resolve(self, amount: Any, instrument: Optional[str] = None) -> Tuple[str, ...]:
+        """Chain for one payment; () when the amount is missing or not a number."""
+        seg = self.levels.segment(amount)
+        return () if seg < 0 else self.for_segment(seg, instrument)
+
+    def for_segment(self, seg: int, instrument: Optional[str]) -> Tuple[str, ...]:
+        key = (seg, normalize_instrument(instrument))
+        with self._lock:
+            chain = self._memo.get(key)
+            if chain is not None:
+                self._memo.move_to_end(key)
+                self.hits += 1
+                return chain
+            self.misses += 1
+        chain = self._build(*key)
+        with self._lock:
+            self._memo[key] = chain
+            if len(self._memo) > self.memo_size:
+                self._memo.popitem(last=False)
+        return chain
+
+    def stats(self) -> Dict[str, int]:
+        return {"memo": len(self._memo), "hits": self.hits, "misses": self.misses}
@@ -0,0 +1,94 @@
+from __future__ import annotations
+import argparse
+import csv
+import io
+import json
+import sys
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+from evaluators.approval import ChainResolver
+from evaluators.batch_spend import INPUT_FORMATS, format_for, read_rows
+
+# Bulk approval chains for a payment ledger (CSV or NDJSON).
+#
+# Rows are resolved one at a time as they are read and results are written
+# as they are produced, so memory stays constant however long the ledger
+# is; the per-(amount segment, instrument) memo in ChainResolver keeps the
+# per-row cost to one binary search and a dict lookup.
+
+
+def resolve_rows(
+    resolver: ChainResolver,
+    rows: Iterable[Dict[str, Any]],
+    amount_field: str = "amount",
+    instrument_field: str = "instrument",
+) -> Iterator[Dict[str, Any]]:
+    for n, r in enumerate(rows):
+        amount = r.get(amount_field)
+        if amount == "":
+            amount = None
+        instrument = r.get(instrument_field)
+        seg = resolver.levels.segment(amount)
+        res = {
+            "row": n,
+            "id": r.get("id"),
+            "amount": amount,
+            "instrument": instrument,
+            "chain": list(resolver.for_segment(seg, instrument)) if seg >= 0 else [],
+        }
+        if seg < 0 and amount is not None:
+            res["error"] = "amount is not a number"
+        yield res
+
+
+def to_ndjson(results: Iterable[Dict[str, Any]]) -> Iterator[str]:
+    for r in results:
+        yield json.dumps(r) + "\n"
+
+
+def to_csv(results: Iterable[Dict[str, Any]]) -> Iterator[str]:
+    buf = io.StringIO()
+    w = csv.writer(buf)
+    w.writerow(["row", "id", "amount", "instrument", "chain", "error"])
+    for r in results:
+        w.writerow([
+            r["row"], "" if r["id"] is None else r["id"], "" if r["amount"] is None else r["amount"],
+            r["instrument"] or "", ";".join(r["chain"]), r.get("error", ""),
+        ])
+        yield buf.getvalue()
+        buf.seek(0)
+        buf.truncate()
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    ap = argparse.ArgumentParser(description="Resolve the approval chain of every payment in a CSV/NDJSON ledger.")
+    ap.add_argument("input", help="ledger file ('-' for stdin)")
+    ap.add_argument("--format", choices=list(INPUT_FORMATS), help="input format (default: from the file extension)")
+    ap.add_argument("--output", choices=["ndjson", "csv"], default="ndjson")
+    src = ap.add_mutually_exclusive_group(required=True)
+    src.add_argument("--doc-id", help="use this doc's approval_chain_rules facts")
+    src.add_argument("--rules", type=Path, help="JSON file with approval_chain_rules")
+    ap.add_argument("--amount-field", default="amount")
+    ap.add_argument("--instrument-field", default="instrument")
+    args = ap.parse_args(argv)
+
+    if args.doc_id:
+        from facts import store as facts_store
+        rules = facts_store.load(args.doc_id).get("approval_chain_rules") or {}
+    else:
+        rules = json.loads(args.rules.read_text(encoding="utf-8"))
+
+    resolver = ChainResolver(rules)
+    fmt = args.format or format_for(args.input)
+    stream = sys.stdin if args.input == "-" else open(args.input, "r", encoding="utf-8", newline="")
+    with stream:
+        results = resolve_rows(resolver, read_rows(stream, fmt), args.amount_field, args.instrument_field)
+        for line in (to_csv(results) if args.output == "csv" else to_ndjson(results)):
+            sys.stdout.write(line)
+    print(json.dumps(resolver.stats()), file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
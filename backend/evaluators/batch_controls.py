@@ -0,0 +1,254 @@
+from __future__ import annotations
+import argparse
+import csv
+import io
+import json
+import sys
+from datetime import datetime
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+import numpy as np
+
+from evaluators.batch_spend import CHUNK_ROWS, INPUT_FORMATS, _chunks, format_for, read_rows
+
+# Batch control-checklist evaluation (travel claims, bank and credit card
+# reconciliations) over whole files of records.
+#
+# Per chunk every date column a rule reads is parsed once into a
+# datetime64[D] array (NaT when missing/invalid) and every flag column into
+# an int8 array (1 true, 0 false, -1 missing); each rule is then one
+# vectorized column operation. Per record and rule the status matches
+# control_checklists._eval_rule: "pass", "fail" or "unknown".
+
+DateFmt = "%Y-%m-%d"
+RULE_SETS = {"travel": "travel_rules", "bank": "bank_recon_rules", "credit": "credit_card_rules"}
+STATUS = {1: "pass", 0: "fail", -1: "unknown"}
+
+_TRUE = {"true", "t", "yes", "y", "1"}
+_FALSE = {"false", "f", "no", "n", "0", ""}
+
+
+@lru_cache(maxsize=16384)
+def _day(s: str) -> np.datetime64:
+    try:
+        return np.datetime64(datetime.strptime(s, DateFmt).date(), "D")
+    except ValueError:
+        return np.datetime64("NaT", "D")
+
+
+def date_column(values: List[Any]) -> np.ndarray:
+    """datetime64[D] array; NaT for missing, non-string or unparseable values."""
+    nat = np.datetime64("NaT", "D")
+    return np.array([_day(v) if isinstance(v, str) and v else nat for v in values], dtype="datetime64[D]")
+
+
+def _flag(v: Any) -> int:
+    if v is None:
+        return -1
+    if isinstance(v, str):
+        s = v.strip().lower()
+        if not s:
+            return -1  # empty CSV cell
+        if s in _TRUE:
+            return 1
+        if s in _FALSE:
+            return 0
+    return 1 if bool(v) else 0
+
+
+def flag_column(values: List[Any]) -> np.ndarray:
+    """int8 array: 1 true, 0 false, -1 missing. CSV text ("true", "no", "1", ...) is read as a boolean."""
+    return np.fromiter((_flag(v) for v in values), dtype=np.int8, count=len(values))
+
+
+def _compare(d: np.ndarray, op: Any, val: Any) -> Optional[np.ndarray]:
+    try:
+        v = float(val)
+    except (TypeError, ValueError):
+        return None
+    if op == "<=": return d <= v
+    if op == ">=": return d >= v
+    if op == "==": return d == v
+    return None
+
+
+class ChecklistBatch:
+    """A doc's control_rules (optionally one rule set) compiled for column-wise evaluation."""
+
+    def __init__(self, control_rules: Dict[str, Any], rule_set: str = "all"):
+        keys = list(RULE_SETS.values()) if rule_set == "all" else [RULE_SETS[rule_set]]
+        self.rules: List[Dict[str, Any]] = [r for k in keys for r in (control_rules.get(k) or [])]
+        # Codes key the per-record results and the summary, so repeats get a "#n" suffix.
+        self.codes: List[str] = []
+        for r in self.rules:
+            code, k = str(r.get("code", "")), 2
+            while code in self.codes:
+                code, k = f"{r.get('code', '')}#{k}", k + 1
+            self.codes.append(code)
+        self.date_fields: List[str] = []
+        self.flag_fields: List[str] = []
+        for r in self.rules:
+            logic = r.get("logic") or {}
+            kind = logic.get("kind")
+            if kind == "days_between":
+                self._need(self.date_fields, logic.get("from"), logic.get("to"))
+            elif kind == "due_within_days_after":
+                self._need(self.date_fields, logic.get("anchor"), logic.get("event"))
+            elif kind == "all_false":
+                self._need(self.flag_fields, *(logic.get("fields") or []))
+            elif kind == "bool_equals":
+                self._need(self.flag_fields, logic.get("field"))
+
+    @staticmethod
+    def _need(into: List[str], *fields: Any) -> None:
+        for f in fields:
+            if isinstance(f, str) and f not in into:
+                into.append(f)
+
+    def _rule(self, logic: Dict[str, Any], dates: Dict[str, np.ndarray], flags: Dict[str, np.ndarray], n: int) -> np.ndarray:
+        out = np.full(n, -1, dtype=np.int8)
+        kind = logic.get("kind")
+        if kind in ("days_between", "due_within_days_after"):
+            a, b = (logic.get("from"), logic.get("to")) if kind == "days_between" else (logic.get("anchor"), logic.get("event"))
+            if a not in dates or b not in dates:
+                return out
+            known = ~(np.isnat(dates[a]) | np.isnat(dates[b]))
+            days = (dates[b] - dates[a]).astype("timedelta64[D]").astype(np.float64)
+            ok = _compare(days, logic.get("op"), logic.get("value"))
+            if ok is not None:
+                out[known] = ok[known]
+        elif kind == "all_false":
+            fields = logic.get("fields") or []
+            if not fields or not all(isinstance(f, str) for f in fields):
+                return out
+            # Fields are checked in order: a missing value before any true one is unknown.
+            state = np.zeros(n, dtype=np.int8)  # 0 undecided, 1 a field was true, 2 missing
+            for f in fields:
+                col = flags[f]
+                undecided = state == 0
+                state[undecided & (col == -1)] = 2
+                state[undecided & (col == 1)] = 1
+            out[state == 0] = 1
+            out[state == 1] = 0
+        elif kind == "bool_equals":
+            f = logic.get("field")
+            if not isinstance(f, str):
+                return out
+            col = flags[f]
+            expect = 1 if bool(logic.get("value")) else 0
+            known = col != -1
+            out[known] = (col[known] == expect)
+        return out
+
+    def statuses(self, rows: List[Dict[str, Any]]) -> np.ndarray:
+        """(records x rules) int8 matrix: 1 pass, 0 fail, -1 unknown."""
+        n = len(rows)
+        dates = {f: date_column([r.get(f) for r in rows]) for f in self.date_fields}
+        flags = {f: flag_column([r.get(f) for r in rows]) for f in self.flag_fields}
+        if not self.rules:
+            return np.zeros((n, 0), dtype=np.int8)
+        return np.stack([self._rule(r.get("logic") or {}, dates, flags, n) for r in self.rules], axis=1)
+
+    def _records(self, rows: List[Dict[str, Any]], matrix: np.ndarray, start: int) -> List[Dict[str, Any]]:
+        failed = (matrix == 0).any(axis=1)
+        unknown = (matrix == -1).any(axis=1)
+        overall = np.where(failed, "FAIL", np.where(unknown, "UNKNOWN", "PASS")).tolist()
+        return [
+            {
+                "row": start + i,
+                "id": r.get("id"),
+                "status": status,
+                "rules": {code: STATUS[s] for code, s in zip(self.codes, statuses)},
+            }
+            for i, (r, status, statuses) in enumerate(zip(rows, overall, matrix.tolist()))
+        ]
+
+    def evaluate(self, rows: List[Dict[str, Any]], start: int = 0) -> List[Dict[str, Any]]:
+        """Results for one chunk of rows; `start` is the row number of rows[0]."""
+        return self._records(rows, self.statuses(rows), start)
+
+    def run(self, rows: Iterable[Dict[str, Any]], summary: Dict[str, Any], chunk_rows: int = CHUNK_ROWS) -> Iterator[Dict[str, Any]]:
+        """Per-record results; `summary` (see new_summary) is updated one chunk at a time."""
+        n = 0
+        for chunk in _chunks(rows, chunk_rows):
+            matrix = self.statuses(chunk)
+            failed = (matrix == 0).any(axis=1)
+            unknown = (matrix == -1).any(axis=1) & ~failed
+            summary["records"] += len(chunk)
+            summary["status"]["FAIL"] += int(failed.sum())
+            summary["status"]["UNKNOWN"] += int(unknown.sum())
+            summary["status"]["PASS"] += len(chunk) - int(failed.sum()) - int(unknown.sum())
+            for j, code in enumerate(self.codes):
+                for value, name in STATUS.items():
+                    summary["rules"][code][name] += int(np.count_nonzero(matrix[:, j] == value))
+            yield from self._records(chunk, matrix, n)
+            n += len(chunk)
+
+    def new_summary(self) -> Dict[str, Any]:
+        return {
+            "records": 0,
+            "status": {"PASS": 0, "FAIL": 0, "UNKNOWN": 0},
+            "rules": {code: {"pass": 0, "fail": 0, "unknown": 0} for code in self.codes},
+        }
+
+
+def failure_counts(summary: Dict[str, Any]) -> Dict[str, int]:
+    return {code: c["fail"] for code, c in summary["rules"].items()}
+
+
+def to_ndjson(results: Iterable[Dict[str, Any]], summary: Dict[str, Any]) -> Iterator[str]:
+    """One line per record, then a final {"summary": ...} line."""
+    for r in results:
+        yield json.dumps(r) + "\n"
+    yield json.dumps({"summary": dict(summary, failures=failure_counts(summary))}) + "\n"
+
+
+def to_csv(results: Iterable[Dict[str, Any]], codes: List[str]) -> Iterator[str]:
+    buf = io.StringIO()
+    w = csv.writer(buf)
+    w.writerow(["row", "id", "status", *codes])
+    for r in results:
+        w.writerow([r["row"], "" if r["id"] is None else r["id"], r["status"], *(r["rules"][c] for c in codes)])
+        yield buf.getvalue()
+        buf.seek(0)
+        buf.truncate()
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    ap = argparse.ArgumentParser(description="Evaluate a CSV/NDJSON file of travel/reconciliation records against control rules.")
+    ap.add_argument("input", help="records file ('-' for stdin)")
+    ap.add_argument("--format", choices=list(INPUT_FORMATS), help="input format (default: from the file extension)")
+    ap.add_argument("--output", choices=["ndjson", "csv", "summary"], default="ndjson")
+    ap.add_argument("--set", dest="rule_set", choices=["all", *RULE_SETS], default="all", help="which rule set to apply")
+    src = ap.add_mutually_exclusive_group(required=True)
+    src.add_argument("--doc-id", help="use this doc's control_rules facts")
+    src.add_argument("--rules", type=Path, help="JSON file with control_rules")
+    args = ap.parse_args(argv)
+
+    if args.doc_id:
+        from facts import store as facts_store
+        rules = facts_store.load(args.doc_id).get("control_rules") or {}
+    else:
+        rules = json.loads(args.rules.read_text(encoding="utf-8"))
+
+    batch = ChecklistBatch(rules, args.rule_set)
+    summary = batch.new_summary()
+    fmt = args.format or format_for(args.input)
+    stream = sys.stdin if args.input == "-" else open(args.input, "r", encoding="utf-8", newline="")
+    with stream:
+        results = batch.run(read_rows(stream, fmt), summary)
+        if args.output == "summary":
+            for _ in results:
+                pass
+            print(json.dumps(dict(summary, failures=failure_counts(summary)), indent=2))
+        else:
+            lines = to_csv(results, batch.codes) if args.output == "csv" else to_ndjson(results, summary)
+            for line in lines:
+                sys.stdout.write(line)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
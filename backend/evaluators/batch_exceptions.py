@@ -0,0 +1,168 @@
+from __future__ import annotations
+import argparse
+import csv
+import io
+import json
+import random
+import sys
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+from evaluators.batch_spend import INPUT_FORMATS, format_for, read_rows
+from evaluators.exceptions import REQUIREMENT_KINDS, ExceptionMatcher, item_status, parse_amount
+
+# Bulk waiver requests against one or more docs' exception policies.
+#
+# Each request ({keywords, amount, id?} and, in NDJSON, optional
+# approvals/documentation/reporting state dicts) is resolved through the
+# compiled ExceptionMatcher as it is read; results stream out and the
+# summary (required items per kind, requests per policy) is aggregated
+# along the way.
+
+
+def library(doc_ids: List[str]) -> List[Dict[str, Any]]:
+    """exception_policies of several docs as one list; each policy is tagged with its doc_id."""
+    from facts import store as facts_store
+    out: List[Dict[str, Any]] = []
+    for doc_id in doc_ids:
+        rules = facts_store.load(doc_id).get("exception_rules") or {}
+        out.extend(dict(pol, doc_id=doc_id) for pol in (rules.get("exception_policies") or []))
+    return out
+
+
+def new_summary() -> Dict[str, Any]:
+    return {
+        "requests": 0,
+        "unmatched": 0,
+        "policies": {},
+        **{kind: {} for kind in REQUIREMENT_KINDS},
+    }
+
+
+def resolve_rows(matcher: ExceptionMatcher, rows: Iterable[Dict[str, Any]], summary: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+    for n, r in enumerate(rows):
+        applicable = matcher.applicable(r.get("keywords"), parse_amount(r.get("amount")))
+        required = matcher.requirements(applicable)
+        names = [matcher.policies[k].get("name") or f"policy {k}" for k in applicable]
+        res: Dict[str, Any] = {"row": n, "id": r.get("id"), "policies": names, **required}
+        states = {kind: r.get(kind) for kind in REQUIREMENT_KINDS if isinstance(r.get(kind), dict)}
+        if states:
+            res["status"] = {kind: item_status(required[kind], states.get(kind) or {}) for kind in REQUIREMENT_KINDS}
+
+        summary["requests"] += 1
+        if not applicable:
+            summary["unmatched"] += 1
+        for name in map(str, names):
+            summary["policies"][name] = summary["policies"].get(name, 0) + 1
+        for kind in REQUIREMENT_KINDS:
+            for item in required[kind]:
+                key = item if isinstance(item, str) else json.dumps(item)
+                summary[kind][key] = summary[kind].get(key, 0) + 1
+        yield res
+
+
+def to_ndjson(results: Iterable[Dict[str, Any]], summary: Dict[str, Any]) -> Iterator[str]:
+    """One line per request, then a final {"summary": ...} line."""
+    for r in results:
+        yield json.dumps(r) + "\n"
+    yield json.dumps({"summary": summary}) + "\n"
+
+
+def to_csv(results: Iterable[Dict[str, Any]]) -> Iterator[str]:
+    buf = io.StringIO()
+    w = csv.writer(buf)
+    w.writerow(["row", "id", "policies", *REQUIREMENT_KINDS])
+    for r in results:
+        w.writerow([
+            r["row"], "" if r["id"] is None else r["id"], ";".join(map(str, r["policies"])),
+            *(";".join(map(str, r[kind])) for kind in REQUIREMENT_KINDS),
+        ])
+        yield buf.getvalue()
+        buf.seek(0)
+        buf.truncate()
+
+
+# ---- benchmark ----
+
+def synthetic_policies(n: int, rnd: random.Random, words: List[str]) -> List[Dict[str, Any]]:
+    return [
+        {"name": f"p{k}", "when": {"keyword": " ".join(rnd.sample(words, rnd.randint(1, 2)))}}
+        for k in range(n)
+    ]
+
+
+def _per_policy(policies: List[Dict[str, Any]], keywords: str) -> List[int]:
+    text = keywords.strip().lower()
+    return [k for k, pol in enumerate(policies) if str(pol["when"]["keyword"]).strip().lower() in text]
+
+
+def benchmark(sizes: List[int], requests: int = 500, words_per_request: int = 40, seed: int = 7) -> List[Dict[str, Any]]:
+    """Per-request keyword matching time of ExceptionMatcher vs a per-policy substring loop, per policy count."""
+    rnd = random.Random(seed)
+    vocab = ["".join(rnd.choice("abcdefghijklmnopqrstuvwxyz") for _ in range(rnd.randint(3, 9))) for _ in range(3000)]
+    texts = [" ".join(rnd.choices(vocab, k=words_per_request)) for _ in range(requests)]
+    out = []
+    for n in sizes:
+        policies = synthetic_policies(n, rnd, vocab)
+        matcher = ExceptionMatcher(policies)
+
+        t0 = time.perf_counter()
+        baseline = [_per_policy(policies, t) for t in texts]
+        t_loop = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        compiled = [sorted(matcher.by_keyword(t)) for t in texts]
+        t_matcher = time.perf_counter() - t0
+
+        out.append({
+            "policies": n,
+            "per_policy_us": round(t_loop / requests * 1e6, 1),
+            "matcher_us": round(t_matcher / requests * 1e6, 1),
+            "speedup": round(t_loop / t_matcher, 2),
+            "mismatches": sum(1 for a, b in zip(baseline, compiled) if a != b),
+        })
+    return out
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    ap = argparse.ArgumentParser(description="Resolve a CSV/NDJSON file of waiver requests against exception policies.")
+    ap.add_argument("input", nargs="?", help="requests file ('-' for stdin)")
+    ap.add_argument("--format", choices=list(INPUT_FORMATS), help="input format (default: from the file extension)")
+    ap.add_argument("--output", choices=["ndjson", "csv", "summary"], default="ndjson")
+    src = ap.add_mutually_exclusive_group()
+    src.add_argument("--doc-id", action="append", help="use this doc's exception_rules facts (repeatable)")
+    src.add_argument("--rules", type=Path, help="JSON file with exception_rules")
+    ap.add_argument("--bench", type=int, nargs="+", metavar="N",
+                    help="benchmark keyword matching against N synthetic policies (several sizes allowed)")
+    args = ap.parse_args(argv)
+
+    if args.bench:
+        print(json.dumps(benchmark(args.bench), indent=2))
+        return 0
+    if not args.input or not (args.doc_id or args.rules):
+        ap.error("input file and --doc-id or --rules required (or --bench N)")
+
+    if args.doc_id:
+        policies = library(args.doc_id)
+    else:
+        policies = json.loads(args.rules.read_text(encoding="utf-8")).get("exception_policies") or []
+
+    matcher = ExceptionMatcher(policies)
+    summary = new_summary()
+    fmt = args.format or format_for(args.input)
+    stream = sys.stdin if args.input == "-" else open(args.input, "r", encoding="utf-8", newline="")
+    with stream:
+        results = resolve_rows(matcher, read_rows(stream, fmt), summary)
+        if args.output == "summary":
+            for _ in results:
+                pass
+            print(json.dumps(summary, indent=2))
+        else:
+            for line in (to_csv(results) if args.output == "csv" else to_ndjson(results, summary)):
+                sys.stdout.write(line)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,114 +1,516 @@
 from __future__ import annotations
-from typing import Any, Dict, List, Tuple, Optional
+from typing import Any, Dict, Hashable, Iterable, List, Tuple, Optional, Set
 from datetime import datetime
+from functools import lru_cache
 
-DateFmt = "%Y-%m-%d"  
+from evaluators.intervals import INF, IntervalTree, compiled
 
-def _parse_date(s: str) -> Optional[datetime]:
+DateFmt = "%Y-%m-%d"
+SOD_CODES = ("ConflictRolePair", "ReconIndependence")
+
+@lru_cache(maxsize=8192)
+def _parse_date_str(s: str) -> Optional[datetime]:
     try:
         return datetime.strptime(s, DateFmt)
     except Exception:
         return None
 
-def validate_delegation(delegation_state: Dict[str, Any], rules: Dict[str, Any]) -> List[Dict[str, Any]]:
+def _parse_date(s: str) -> Optional[datetime]:
+    # strptime is slow and grants are revalidated often; the same few dates recur.
+    return _parse_date_str(s) if isinstance(s, str) else None
+
+def _member(x: Any, s: Set[Any]) -> bool:
+    try:
+        return x in s
+    except TypeError:  # unhashable (malformed) values are never members
+        return False
+
+
+class ConflictGraph:
     """
-    Returns a list of violations: [{code, message, path?}]
-    - people: List[str]
-    - roles: List[str]
-    - assignments: { role -> person | null }
-    - acting: [{ person, role, from, to }]
+    Role-conflict adjacency: role -> indices of the SoD constraints naming it,
+    so a change to one role's holder only rechecks its own constraints and a
+    person's conflicts come from the roles they hold, not from every pair.
     """
-    violations: List[Dict[str, Any]] = []
 
-    people: List[str] = delegation_state.get("people", []) or []
-    roles_in_state: List[str] = delegation_state.get("roles", []) or []
-    assignments: Dict[str, Any] = delegation_state.get("assignments", {}) or {}
-    acting: List[Dict[str, Any]] = delegation_state.get("acting", []) or []
+    def __init__(self, constraints: List[Dict[str, Any]], codes: Iterable[str] = SOD_CODES):
+        self.constraints = constraints
+        self.pairs: Dict[int, Tuple[str, str]] = {}
+        self.adjacent: Dict[str, List[int]] = {}
+        codes = set(codes)
+        for k, c in enumerate(constraints):
+            pair = c.get("pair") or []
+            if c.get("code") not in codes or not isinstance(pair, list) or len(pair) != 2:
+                continue
+            if not all(isinstance(r, str) for r in pair):
+                continue
+            self.pairs[k] = (pair[0], pair[1])
+            for r in {pair[0], pair[1]}:
+                self.adjacent.setdefault(r, []).append(k)
 
-    roles_allowed: List[str] = rules.get("delegation", {}).get("roles", []) or []
-    constraints: List[Dict[str, Any]] = rules.get("delegation", {}).get("constraints", []) or []
-    acting_rules: Dict[str, Any] = rules.get("delegation", {}).get("acting_rules", {}) or {}
+    def touching(self, roles: Iterable[str]) -> Set[int]:
+        out: Set[int] = set()
+        for r in roles:
+            out.update(self.adjacent.get(r, ()))
+        return out
 
+    def violated(self, held: Set[str]) -> List[int]:
+        """Constraints (in policy order) whose two roles are both in `held`, i.e. held by one person."""
+        out: Set[int] = set()
+        for r in held:
+            for k in self.adjacent.get(r, ()):
+                a, b = self.pairs[k]
+                if a in held and b in held:
+                    out.add(k)
+        return sorted(out)
 
-    for r in roles_in_state:
-        if r not in roles_allowed:
-            violations.append({
-                "code": "UnknownRole",
-                "message": f"Role '{r}' is not defined in policy.",
-                "path": "/delegation/roles"
-            })
 
-    for role_key, person in (assignments.items()):
-        if role_key not in roles_allowed:
-            violations.append({
-                "code": "UnknownRole",
-                "message": f"Assignment uses unknown role '{role_key}'.",
-                "path": f"/delegation/assignments/{role_key}"
+class DelegationRules:
+    """Policy delegation rules with roles as a set and constraints as a ConflictGraph."""
+
+    def __init__(self, rules: Dict[str, Any]):
+        d = rules.get("delegation", {}) or {}
+        self.roles: Set[str] = {r for r in d.get("roles", []) or [] if isinstance(r, str)}
+        self.graph = ConflictGraph(d.get("constraints", []) or [])
+        acting_rules = d.get("acting_rules", {}) or {}
+        self.require_dates = bool(acting_rules.get("require_dates", False))
+        # Opt-in: at most one acting holder per role at any time. Rule sets
+        # that predate acting_rules.exclusive keep accepting overlapping grants.
+        self.exclusive = bool(acting_rules.get("exclusive", False))
+
+    def sod_violation(self, k: int, assignments: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        a, b = self.graph.pairs[k]
+        pa = assignments.get(a)
+        if pa is None or pa != assignments.get(b):
+            return None
+        c = self.graph.constraints[k]
+        return {
+            "code": c.get("code", "RoleConflict"),
+            "message": c.get("message", f"Roles {a} and {b} must be held by different people."),
+            "path": f"/delegation/assignments/{b}"
+        }
+
+def compile_rules(rules: Dict[str, Any]) -> DelegationRules:
+    return compiled(("delegation_rules", id(rules)), rules, lambda: DelegationRules(rules))
+
+
+def _role_violations(roles_in_state: List[str], rules: DelegationRules) -> List[Dict[str, Any]]:
+    return [{
+        "code": "UnknownRole",
+        "message": f"Role '{r}' is not defined in policy.",
+        "path": "/delegation/roles"
+    } for r in roles_in_state if not _member(r, rules.roles)]
+
+def _assignment_violations(role_key: str, person: Any, rules: DelegationRules, people: Set[str]) -> List[Dict[str, Any]]:
+    out: List[Dict[str, Any]] = []
+    if role_key not in rules.roles:
+        out.append({
+            "code": "UnknownRole",
+            "message": f"Assignment uses unknown role '{role_key}'.",
+            "path": f"/delegation/assignments/{role_key}"
+        })
+    if person is not None and not _member(person, people):
+        out.append({
+            "code": "UnknownAssignee",
+            "message": f"'{person}' is not in people list.",
+            "path": f"/delegation/assignments/{role_key}"
+        })
+    return out
+
+def _acting_violations(idx: int, a: Dict[str, Any], rules: DelegationRules, people: Set[str],
+                       assignments: Dict[str, Any]) -> List[Dict[str, Any]]:
+    out: List[Dict[str, Any]] = []
+    person = a.get("person")
+    role = a.get("role")
+    from_s = a.get("from")
+    to_s = a.get("to")
+
+    if not _member(role, rules.roles):
+        out.append({
+            "code": "ActingUnknownRole",
+            "message": f"Acting grant uses unknown role '{role}'.",
+            "path": f"/delegation/acting/{idx}"
+        })
+    if not _member(person, people):
+        out.append({
+            "code": "ActingUnknownPerson",
+            "message": f"Acting grant names unknown person '{person}'.",
+            "path": f"/delegation/acting/{idx}"
+        })
+
+    if rules.require_dates:
+        d_from = _parse_date(from_s) if from_s else None
+        d_to = _parse_date(to_s) if to_s else None
+        if not d_from or not d_to:
+            out.append({
+                "code": "ActingDatesMissing",
+                "message": "Acting grant must include valid 'from' and 'to' dates (YYYY-MM-DD).",
+                "path": f"/delegation/acting/{idx}"
             })
-        if person is not None and person not in people:
-            violations.append({
-                "code": "UnknownAssignee",
-                "message": f"'{person}' is not in people list.",
-                "path": f"/delegation/assignments/{role_key}"
+        elif d_from > d_to:
+            out.append({
+                "code": "ActingDateRangeInvalid",
+                "message": "'from' date must be on/before 'to' date.",
+                "path": f"/delegation/acting/{idx}"
             })
 
-    def _same_person(role_a: str, role_b: str) -> bool:
-        pa = assignments.get(role_a)
-        pb = assignments.get(role_b)
-        return (pa is not None) and (pa == pb)
-
-    for c in constraints:
-        if c.get("code") in ("ConflictRolePair", "ReconIndependence"):
-            pair = c.get("pair") or []
-            if len(pair) == 2 and _same_person(pair[0], pair[1]):
-                violations.append({
-                    "code": c.get("code", "RoleConflict"),
-                    "message": c.get("message", f"Roles {pair[0]} and {pair[1]} must be held by different people."),
-                    "path": f"/delegation/assignments/{pair[1]}"
-                })
+    try:
+        redundant = assignments.get(role) == person
+    except TypeError:
+        redundant = False
+    if redundant:
+        out.append({
+            "code": "ActingRedundant",
+            "message": f"Acting grant redundant: '{person}' already holds '{role}'.",
+            "path": f"/delegation/acting/{idx}"
+        })
+    return out
 
-    if acting:
-        require_dates = bool(acting_rules.get("require_dates", False))
-        for idx, a in enumerate(acting):
-            person = a.get("person")
-            role = a.get("role")
-            from_s = a.get("from")
-            to_s = a.get("to")
-
-            if role not in roles_allowed:
-                violations.append({
-                    "code": "ActingUnknownRole",
-                    "message": f"Acting grant uses unknown role '{role}'.",
-                    "path": f"/delegation/acting/{idx}"
-                })
-            if person not in people:
-                violations.append({
-                    "code": "ActingUnknownPerson",
-                    "message": f"Acting grant names unknown person '{person}'.",
-                    "path": f"/delegation/acting/{idx}"
-                })
 
+def grant_span(a: Dict[str, Any], require_dates: bool) -> Optional[Tuple[float, float]]:
+    """
+    A grant's closed [from, to] range as day ordinals, or None if it has no
+    usable range. Without require_dates a missing bound is open-ended.
+    """
+    bounds = []
+    for s, open_end in ((a.get("from"), -INF), (a.get("to"), INF)):
+        if not s:
             if require_dates:
-                d_from = _parse_date(from_s) if from_s else None
-                d_to = _parse_date(to_s) if to_s else None
-                if not d_from or not d_to:
-                    violations.append({
-                        "code": "ActingDatesMissing",
-                        "message": "Acting grant must include valid 'from' and 'to' dates (YYYY-MM-DD).",
-                        "path": f"/delegation/acting/{idx}"
-                    })
-                elif d_from > d_to:
-                    violations.append({
-                        "code": "ActingDateRangeInvalid",
-                        "message": "'from' date must be on/before 'to' date.",
+                return None
+            bounds.append(open_end)
+            continue
+        d = _parse_date(s)
+        if d is None:
+            return None
+        bounds.append(float(d.toordinal()))
+    lo, hi = bounds
+    return None if lo > hi else (lo, hi)
+
+def day(s: str) -> Optional[float]:
+    d = _parse_date(s)
+    return None if d is None else float(d.toordinal())
+
+
+class ActingTimeline:
+    """
+    Acting grants indexed by role: one IntervalTree of [from, to] day ranges
+    per role, keyed by the grant's index in `acting`, plus a person -> grant
+    index. Grants without a usable range are not indexed.
+    """
+
+    def __init__(self, require_dates: bool = False):
+        self.require_dates = require_dates
+        self.trees: Dict[str, IntervalTree] = {}
+        self.grants: Dict[int, Tuple[str, Any, float, float]] = {}  # idx -> (role, person, lo, hi)
+        self.by_person: Dict[Any, Set[int]] = {}
+
+    def remove(self, idx: int) -> Optional[Tuple[str, Any, float, float]]:
+        g = self.grants.pop(idx, None)
+        if g is not None:
+            self.trees[g[0]].remove(idx)
+            self.by_person[g[1]].discard(idx)
+        return g
+
+    def put(self, idx: int, a: Any) -> Optional[Tuple[str, Any, float, float]]:
+        """Index (or re-index) grant `idx`; returns what was indexed, if anything."""
+        self.remove(idx)
+        if not isinstance(a, dict):
+            return None
+        role, person = a.get("role"), a.get("person")
+        span = grant_span(a, self.require_dates)
+        if span is None or not isinstance(role, str) or not isinstance(person, Hashable):
+            return None
+        g = (role, person, span[0], span[1])
+        self.grants[idx] = g
+        self.trees.setdefault(role, IntervalTree()).add(span[0], span[1], idx)
+        self.by_person.setdefault(person, set()).add(idx)
+        return g
+
+    def overlapping(self, role: str, lo: float, hi: float) -> List[int]:
+        tree = self.trees.get(role)
+        return [] if tree is None else [k for _, _, k in tree.overlapping(lo, hi)]
+
+    def holders(self, role: str, on: float) -> List[int]:
+        """Grants that make someone acting `role` on day `on`."""
+        return self.overlapping(role, on, on)
+
+    def overlaps(self, role: Optional[str] = None) -> List[Tuple[str, int, int]]:
+        """(role, i, j) for every pair of overlapping grants for the same role, i < j."""
+        out: List[Tuple[str, int, int]] = []
+        for rl in ([role] if role is not None else sorted(self.trees)):
+            tree = self.trees.get(rl)
+            if tree is not None:
+                out.extend((rl, min(i, j), max(i, j)) for i, j in tree.overlap_pairs())
+        return sorted(out)
+
+
+class DelegationEngine:
+    """
+    Incremental validate_delegation for one delegation state as it evolves.
+
+    Each call diffs the new state against the last one it validated and
+    rechecks only what a change can affect: the changed assignments, the SoD
+    constraints adjacent to their roles, and the acting grants that name a
+    changed role or person, or share a date range or holder with a changed
+    grant. People are kept as a set (rebuilt only when the list object
+    changes; states are copy-on-write, so an unchanged list is the same
+    object) and acting grants in an ActingTimeline. The result is identical
+    to a full validate_delegation, in the same order. The delegation subtree
+    itself is copy-on-write too: called again with the same object (e.g.
+    derived state recomputed after a /spend edit), the last result is
+    returned without rechecking anything.
+    """
+
+    def __init__(self):
+        self.rules: Optional[DelegationRules] = None
+        self.full_builds = 0
+        self.rechecked = 0
+        self.reused = 0
+        self._reset()
+
+    def _reset(self) -> None:
+        self._state_src: Any = None
+        self._violations: List[Dict[str, Any]] = []
+        self._people_src: Any = None
+        self._people: Set[str] = set()
+        self._roles_src: Any = None
+        self._role_v: List[Dict[str, Any]] = []
+        self._assign: Dict[str, Any] = {}
+        self._assign_v: Dict[str, List[Dict[str, Any]]] = {}
+        self._holders: Dict[Any, Set[str]] = {}  # person -> roles assigned to them
+        self._sod: Dict[int, Dict[str, Any]] = {}
+        self._acting: List[Any] = []
+        self._acting_v: List[List[Dict[str, Any]]] = []
+        self._acting_by_key: Dict[Tuple[str, Any], Set[int]] = {}  # ("person"|"role", value) -> grant indices
+        self.timeline = ActingTimeline(self.rules.require_dates if self.rules else False)
+
+    def _index_acting(self, idx: int, a: Any, add: bool) -> None:
+        if not isinstance(a, dict):
+            return
+        for key in (("person", a.get("person")), ("role", a.get("role"))):
+            try:
+                bucket = self._acting_by_key.setdefault(key, set()) if add else self._acting_by_key.get(key)
+            except TypeError:
+                continue
+            if bucket is None:
+                continue
+            if add:
+                bucket.add(idx)
+            else:
+                bucket.discard(idx)
+
+    def _related(self, idx: int, a: Any, g: Optional[Tuple[str, Any, float, float]], out: Set[int]) -> None:
+        """Grants whose timeline checks may involve grant `idx` (as `a`, indexed as `g`)."""
+        if g is not None:
+            out.update(self.timeline.overlapping(g[0], g[2], g[3]))
+        if isinstance(a, dict):
+            try:
+                out.update(self._acting_by_key.get(("person", a.get("person")), ()))
+            except TypeError:
+                pass
+
+    def _timeline_violations(self, idx: int, a: Dict[str, Any], assignments: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """ActingOverlap / ActingConflict for grant `idx` against the grants before it."""
+        r, t = self.rules, self.timeline
+        out: List[Dict[str, Any]] = []
+        person, role = a.get("person"), a.get("role")
+        g = t.grants.get(idx)
+        if r.exclusive and g is not None:
+            for i in sorted(t.overlapping(g[0], g[2], g[3])):
+                if i < idx:
+                    out.append({
+                        "code": "ActingOverlap",
+                        "message": f"Acting grant for '{role}' overlaps acting grant {i} ('{t.grants[i][1]}').",
                         "path": f"/delegation/acting/{idx}"
                     })
-
-            if assignments.get(role) == person:
-                violations.append({
-                    "code": "ActingRedundant",
-                    "message": f"Acting grant redundant: '{person}' already holds '{role}'.",
+        if not isinstance(role, str) or person is None or not isinstance(person, Hashable):
+            return out
+        for k in r.graph.adjacent.get(role, ()):
+            a_role, b_role = r.graph.pairs[k]
+            other = b_role if a_role == role else a_role
+            if other == role:
+                continue
+            hit = assignments.get(other) == person
+            if not hit and g is not None:
+                hit = any(
+                    i < idx and t.grants[i][0] == other and t.grants[i][2] <= g[3] and g[2] <= t.grants[i][3]
+                    for i in t.by_person.get(person, ())
+                )
+            if hit:
+                c = r.graph.constraints[k]
+                out.append({
+                    "code": "ActingConflict",
+                    "message": f"'{person}' would act as '{role}' while also holding '{other}': "
+                               + c.get("message", f"Roles {a_role} and {b_role} must be held by different people."),
                     "path": f"/delegation/acting/{idx}"
                 })
+        return out
+
+    def validate(self, delegation_state: Dict[str, Any], rules: Dict[str, Any]) -> List[Dict[str, Any]]:
+        compiled_rules = compile_rules(rules)
+        if compiled_rules is not self.rules:
+            self.rules = compiled_rules
+            self._reset()
+            self.full_builds += 1
+        elif delegation_state is self._state_src:
+            self.reused += 1
+            return list(self._violations)
+        r = self.rules
+
+        people = delegation_state.get("people", []) or []
+        roles_in_state = delegation_state.get("roles", []) or []
+        assignments: Dict[str, Any] = delegation_state.get("assignments", {}) or {}
+        acting: List[Dict[str, Any]] = delegation_state.get("acting", []) or []
+
+        changed_people: Set[Any] = set()
+        if people is not self._people_src:
+            new_people = {p for p in people if isinstance(p, Hashable)}
+            changed_people = new_people ^ self._people
+            self._people, self._people_src = new_people, people
+
+        if roles_in_state is not self._roles_src:
+            self._role_v = _role_violations(roles_in_state, r)
+            self._roles_src = roles_in_state
+
+        # --- assignments: changed roles plus roles held by people who joined/left
+        changed_roles = {k for k in assignments.keys() | self._assign.keys()
+                         if k not in assignments or k not in self._assign or assignments[k] != self._assign[k]}
+        recheck = set(changed_roles)
+        for p in changed_people:
+            recheck.update(self._holders.get(p, ()))
+        changed_holders: Set[Any] = set()  # old and new holders of changed roles (for ActingConflict)
+        for k in changed_roles:
+            old = self._assign.get(k)
+            for p in (old, assignments.get(k)):
+                if p is not None and isinstance(p, Hashable):
+                    changed_holders.add(p)
+            if old is not None:
+                try:
+                    self._holders.get(old, set()).discard(k)
+                except TypeError:
+                    pass
+            if k in assignments and assignments[k] is not None:
+                try:
+                    self._holders.setdefault(assignments[k], set()).add(k)
+                except TypeError:
+                    pass
+        for k in recheck:
+            if k in assignments:
+                self._assign_v[k] = _assignment_violations(k, assignments[k], r, self._people)
+            else:
+                self._assign_v.pop(k, None)
+        self._assign = dict(assignments)
+
+        for k in r.graph.touching(changed_roles):
+            v = r.sod_violation(k, assignments)
+            if v is None:
+                self._sod.pop(k, None)
+            else:
+                self._sod[k] = v
+
+        # --- acting grants: changed entries plus those naming a changed role or person
+        grants: Set[int] = set()
+        old_acting = self._acting
+        # Overlap/conflict checks only look at earlier grants, so a changed grant
+        # also rechecks the later grants that shared its role range or its person.
+        later: Dict[int, Set[int]] = {}
+        for idx in range(max(len(acting), len(old_acting))):
+            if idx >= len(acting) or idx >= len(old_acting) or (
+                acting[idx] is not old_acting[idx] and acting[idx] != old_acting[idx]
+            ):
+                touched = later.setdefault(idx, set())
+                if idx < len(old_acting):
+                    self._index_acting(idx, old_acting[idx], add=False)
+                    self._related(idx, old_acting[idx], self.timeline.remove(idx), touched)
+                if idx < len(acting):
+                    self._index_acting(idx, acting[idx], add=True)
+                    self._related(idx, acting[idx], self.timeline.put(idx, acting[idx]), touched)
+                    grants.add(idx)
+        for idx, touched in later.items():
+            grants.update(j for j in touched if j > idx)
+        for k in changed_roles:
+            grants.update(self._acting_by_key.get(("role", k), ()))
+        for p in changed_people | changed_holders:
+            grants.update(self._acting_by_key.get(("person", p), ()))
+        grants = {j for j in grants if j < len(acting)}
+        del self._acting_v[len(acting):]
+        self._acting_v.extend([] for _ in range(len(acting) - len(self._acting_v)))
+        for idx in grants:
+            a = acting[idx]
+            self._acting_v[idx] = (
+                _acting_violations(idx, a, r, self._people, assignments) + self._timeline_violations(idx, a, assignments)
+                if isinstance(a, dict) else []
+            )
+        self._acting = list(acting)
+
+        self.rechecked += len(recheck) + len(grants)
+        violations = list(self._role_v)
+        for k in assignments:
+            violations.extend(self._assign_v.get(k, ()))
+        violations.extend(self._sod[k] for k in sorted(self._sod))
+        for v in self._acting_v:
+            violations.extend(v)
+        self._state_src, self._violations = delegation_state, violations
+        return list(violations)
+
+    def stats(self) -> Dict[str, int]:
+        return {"full_builds": self.full_builds, "rechecked": self.rechecked, "reused": self.reused, "people": len(self._people)}
+
+
+def validate_delegation(delegation_state: Dict[str, Any], rules: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """
+    Returns a list of violations: [{code, message, path?}]
+    - people: List[str]
+    - roles: List[str]
+    - assignments: { role -> person | null }
+    - acting: [{ person, role, from, to }]
+    Acting grants are also checked against each other:
+    - ActingOverlap: two grants for one role overlap; only reported when
+      acting_rules.exclusive is true (default false).
+    - ActingConflict: the person holds, or is acting in, an SoD-conflicting
+      role at the same time.
+    """
+    return DelegationEngine().validate(delegation_state, rules)
+
+
+def check_org(rows: Iterable[Dict[str, Any]], rules: Dict[str, Any], people: Optional[Set[str]] = None) -> Dict[str, Any]:
+    """
+    Every conflict in an org assignment file of {person, role, unit?} rows, in
+    one pass plus one adjacency walk per person: UnknownRole, UnknownAssignee
+    (only when a `people` roster is given) and the SoD pairs a person holds
+    within one unit (or across the org when rows have no unit).
+    """
+    r = compile_rules(rules)
+    conflicts: List[Dict[str, Any]] = []
+    held: Dict[Tuple[Any, str], Dict[str, int]] = {}  # (unit, person) -> role -> first row
+    n = 0
+    for n, row in enumerate(rows, start=1):
+        person = str(row.get("person") or "").strip()
+        role = str(row.get("role") or "").strip()
+        unit = row.get("unit") or None
+        if not person or not role:
+            conflicts.append({"code": "InvalidRow", "message": "Row needs a person and a role.", "row": n - 1})
+            continue
+        if role not in r.roles:
+            conflicts.append({"code": "UnknownRole", "message": f"Assignment uses unknown role '{role}'.", "row": n - 1})
+        if people is not None and person not in people:
+            conflicts.append({"code": "UnknownAssignee", "message": f"'{person}' is not in people list.", "row": n - 1})
+        held.setdefault((unit, person), {}).setdefault(role, n - 1)
+
+    for (unit, person), roles in held.items():
+        for k in r.graph.violated(set(roles)):
+            a, b = r.graph.pairs[k]
+            c = r.graph.constraints[k]
+            conflicts.append({
+                "code": c.get("code", "RoleConflict"),
+                "message": c.get("message", f"Roles {a} and {b} must be held by different people."),
+                "person": person,
+                "unit": unit,
+                "pair": [a, b],
+                "rows": sorted({roles[a], roles[b]}),
+            })
 
-    return violations
+    counts: Dict[str, int] = {}
+    for c in conflicts:
+        counts[c["code"]] = counts.get(c["code"], 0) + 1
+    return {"rows": n, "holders": len(held), "counts": counts, "conflicts": conflicts}
@@ -0,0 +1,125 @@
+from __future__ import annotations
+import math
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from evaluators.intervals import INF, Interval, IntervalTable
+from evaluators.substrings import SubstringMatcher
+
+# Exception/waiver policies ({"when": {"keyword", "amount": {op, value}},
+# "requires": {...}}) compiled for matching many requests: keywords go into
+# one Aho-Corasick automaton (SubstringMatcher) and amount conditions into
+# an IntervalTable, so a request resolves to its policies in time
+# proportional to its text length instead of one substring test and one
+# comparison per policy.
+
+REQUIREMENT_KINDS = ("approvals", "documentation", "reporting")
+
+
+def _amount_interval(amt: Dict[str, Any]) -> Optional[Interval]:
+    """Interval for {op, value}; raises ValueError for conditions that match any amount."""
+    try:
+        v = float(amt.get("value"))
+    except Exception:
+        raise ValueError("unparseable value")
+    op = (amt.get("op") or "").strip()
+    if op not in ("<", "<=", ">", ">=", "=="):
+        raise ValueError("unknown op")
+    if math.isnan(v):
+        return None  # every comparison with NaN is false
+    if op == "<":  return Interval(-INF, v, True, False)
+    if op == "<=": return Interval(-INF, v, True, True)
+    if op == ">":  return Interval(v, INF, False, True)
+    if op == ">=": return Interval(v, INF, True, True)
+    return Interval(v, v, True, True)
+
+
+class ExceptionMatcher:
+    """
+    Compiled exception_policies. `applicable(keywords, amount)` returns the
+    indices of the matching policies, in policy order: a keyword matches when
+    it is a substring of the request's (lower-cased) keywords, and an amount
+    condition compares the amount with `op` exactly as float comparison would,
+    infinite amounts included.
+    """
+
+    def __init__(self, policies: List[Dict[str, Any]]):
+        self.policies = policies
+        keyword_any: List[int] = []
+        keywords: List[Tuple[str, int]] = []
+        self._amount_any: List[int] = []  # no amount condition
+        self._amount_known: List[int] = []  # condition that any given amount satisfies
+        intervals: List[Optional[Interval]] = []
+        for k, pol in enumerate(policies):
+            when = pol.get("when") or {}
+            if not isinstance(when, dict):
+                when = {}
+            want = str(when.get("keyword") or "").strip().lower()
+            if want:
+                keywords.append((want, k))
+            else:
+                keyword_any.append(k)
+
+            amt = when.get("amount")
+            iv = None
+            if not amt:
+                self._amount_any.append(k)
+            elif not isinstance(amt, dict):
+                self._amount_known.append(k)
+            else:
+                try:
+                    iv = _amount_interval(amt)
+                except ValueError:
+                    self._amount_known.append(k)
+            intervals.append(iv)
+
+        self._keyword_any = set(keyword_any)
+        self._keywords = SubstringMatcher(keywords)
+        self._amounts = IntervalTable(intervals, lambda idx: frozenset(idx))
+
+    def by_keyword(self, keywords: Any) -> Set[int]:
+        text = str(keywords or "").strip().lower()
+        out = set(self._keyword_any)
+        out.update(self._keywords.match(text))
+        return out
+
+    def by_amount(self, amount: Optional[float]) -> Set[int]:
+        out = set(self._amount_any)
+        if amount is not None:
+            out.update(self._amount_known)
+            out.update(self._amounts.lookup(amount))
+        return out
+
+    def applicable(self, keywords: Any, amount: Optional[float]) -> List[int]:
+        return sorted(self.by_keyword(keywords) & self.by_amount(amount))
+
+    def requirements(self, indices: Iterable[int]) -> Dict[str, List[str]]:
+        """Required items per kind from the given policies, de-duplicated in policy order."""
+        out: Dict[str, List[str]] = {kind: [] for kind in REQUIREMENT_KINDS}
+        for k in indices:
+            req = self.policies[k].get("requires", {}) or {}
+            for kind in REQUIREMENT_KINDS:
+                for item in (req.get(kind) or []):
+                    if item not in out[kind]:
+                        out[kind].append(item)
+        return out
+
+
+def parse_amount(amount: Any) -> Optional[float]:
+    try:
+        return None if amount in (None, "",) else float(amount)
+    except Exception:
+        return None
+
+
+def item_status(reqs: List[str], state: Dict[str, Any]) -> List[Dict[str, Any]]:
+    out = []
+    for item in reqs:
+        got = state.get(item)
+        if got is True:
+            status = "PASS"
+        elif got is False:
+            status = "FAIL"
+        else:
+            status = "UNKNOWN"
+        out.append({"item": item, "status": status})
+    return out
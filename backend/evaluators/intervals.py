@@ -0,0 +1,297 @@
+from __future__ import annotations
+import heapq
+import math
+import random
+import threading
+from bisect import bisect_left
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, List, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+
+INF = float("inf")
+
+
+class Interval(NamedTuple):
+    lo: float
+    hi: float
+    lo_closed: bool = True
+    hi_closed: bool = True
+
+    def covers_point(self, x: float) -> bool:
+        return (self.lo < x or (self.lo_closed and self.lo == x)) and (x < self.hi or (self.hi_closed and self.hi == x))
+
+
+def _num(v: Any, default: float) -> Optional[float]:
+    if v is None:
+        return default
+    if v == "inf":
+        return INF
+    try:
+        f = float(v)
+    except (TypeError, ValueError):
+        return None
+    return None if math.isnan(f) else f
+
+
+def from_range(rng: Dict[str, Any]) -> Optional[Interval]:
+    """{"min": a, "max": b|"inf"|None} -> closed [a, b]; None if unparseable."""
+    lo, hi = _num(rng.get("min"), -INF), _num(rng.get("max"), INF)
+    if lo is None or hi is None or lo > hi:
+        return None
+    return Interval(lo, hi)
+
+
+def from_condition(cond: Dict[str, Any]) -> Optional[Interval]:
+    """An amount condition {"op": "<"|"<="|">"|">="|"=="|"between", "value"|"range"} as an Interval."""
+    op = cond.get("op")
+    if op == "between":
+        return from_range(cond.get("range") or {})
+    raw = cond.get("value", 0)
+    v = None if raw is None else _num(raw, 0.0)
+    if v is None:
+        return None
+    if op == "<":  return Interval(-INF, v, True, False)
+    if op == "<=": return Interval(-INF, v, True, True)
+    if op == ">":  return Interval(v, INF, False, True)
+    if op == ">=": return Interval(v, INF, True, True)
+    if op == "==": return Interval(v, v, True, True)
+    return None
+
+
+class IntervalTable:
+    """
+    Piecewise-constant lookup over a set of (possibly overlapping) intervals.
+
+    The distinct bounds b0 < b1 < ... < bn split the line into elementary
+    segments (-inf, b0), [b0], (b0, b1), [b1], ..., (bn, inf); no interval
+    bound falls inside one, so each segment is covered by a fixed set of
+    intervals. Infinite bounds are break points too, so an amount of +-inf
+    lands on its own point segment and open ends at infinity exclude it. `combine(indices)` (indices in input order) is
+    evaluated once per segment at build time, and `lookup(x)` is a binary
+    search: segment 2i+1 if x == b_i, else segment 2i with i = bisect(x).
+    """
+
+    def __init__(self, intervals: Sequence[Optional[Interval]], combine: Callable[[Tuple[int, ...]], Any]):
+        points = set()
+        for iv in intervals:
+            if iv is not None:
+                points.update((iv.lo, iv.hi))
+        self.breaks: List[float] = sorted(points)
+
+        values: List[Any] = []
+        edges = [-INF] + self.breaks + [INF]
+        for i in range(len(self.breaks) + 1):
+            a, b = edges[i], edges[i + 1]
+            # open segment (a, b): covered iff the interval spans all of it
+            values.append(combine(tuple(
+                k for k, iv in enumerate(intervals)
+                if iv is not None and iv.lo <= a and iv.hi >= b
+            )))
+            if i < len(self.breaks):
+                values.append(combine(tuple(
+                    k for k, iv in enumerate(intervals) if iv is not None and iv.covers_point(b)
+                )))
+        self.values = values
+        self.empty = combine(())
+
+    def segment(self, x: Any) -> int:
+        """Index into `values` for amount `x`; -1 if it is missing or not a number."""
+        x = _num(x, None) if x is not None else None
+        if x is None:
+            return -1
+        i = bisect_left(self.breaks, x)
+        if i < len(self.breaks) and self.breaks[i] == x:
+            return 2 * i + 1
+        return 2 * i
+
+    def lookup(self, x: Any) -> Any:
+        seg = self.segment(x)
+        return self.empty if seg < 0 else self.values[seg]
+
+
+    def segments(self, xs: "np.ndarray") -> "np.ndarray":
+        """Vectorized segment index per amount (`values[i]`); -1 where the amount is NaN."""
+        xs = np.asarray(xs, dtype=float)
+        breaks = np.asarray(self.breaks, dtype=float)
+        i = np.searchsorted(breaks, xs, side="left")
+        if len(breaks):
+            exact = (i < len(breaks)) & (breaks[np.minimum(i, len(breaks) - 1)] == xs)
+        else:
+            exact = np.zeros(xs.shape, dtype=bool)
+        seg = 2 * i + exact
+        seg[np.isnan(xs)] = -1
+        return seg
+
+
+class _TreeNode:
+    __slots__ = ("lo", "hi", "key", "prio", "left", "right", "max_hi")
+
+    def __init__(self, lo: float, hi: float, key: Hashable, prio: float):
+        self.lo, self.hi, self.key, self.prio = lo, hi, key, prio
+        self.left: Optional[_TreeNode] = None
+        self.right: Optional[_TreeNode] = None
+        self.max_hi = hi
+
+
+def _fix(n: _TreeNode) -> _TreeNode:
+    m = n.hi
+    if n.left is not None and n.left.max_hi > m:
+        m = n.left.max_hi
+    if n.right is not None and n.right.max_hi > m:
+        m = n.right.max_hi
+    n.max_hi = m
+    return n
+
+
+class IntervalTree:
+    """
+    Dynamic set of closed intervals [lo, hi] with hashable keys: a treap
+    ordered by (lo, key) where every node also stores the largest `hi` in
+    its subtree. Insert/remove are O(log n) expected; stabbing and range
+    queries are O(log n + k) since subtrees that end before the query are
+    skipped. Keys are unique; re-adding a key replaces its interval.
+    """
+
+    def __init__(self, seed: int = 0):
+        self._root: Optional[_TreeNode] = None
+        self._spans: Dict[Hashable, Tuple[float, float]] = {}
+        self._rnd = random.Random(seed)
+
+    def __len__(self) -> int:
+        return len(self._spans)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._spans
+
+    def span(self, key: Hashable) -> Optional[Tuple[float, float]]:
+        return self._spans.get(key)
+
+    @staticmethod
+    def _order(key: Hashable) -> Tuple[str, Any]:
+        # Keys of mixed types still need a total order among equal `lo`s.
+        return (type(key).__name__, key)
+
+    def _split(self, n: Optional[_TreeNode], lo: float, okey: Tuple[str, Any]) -> Tuple[Optional[_TreeNode], Optional[_TreeNode]]:
+        """(nodes ordered before (lo, key), the rest)."""
+        if n is None:
+            return None, None
+        if (n.lo, self._order(n.key)) < (lo, okey):
+            n.right, right = self._split(n.right, lo, okey)
+            return _fix(n), right
+        left, n.left = self._split(n.left, lo, okey)
+        return left, _fix(n)
+
+    def _merge(self, a: Optional[_TreeNode], b: Optional[_TreeNode]) -> Optional[_TreeNode]:
+        if a is None:
+            return b
+        if b is None:
+            return a
+        if a.prio > b.prio:
+            a.right = self._merge(a.right, b)
+            return _fix(a)
+        b.left = self._merge(a, b.left)
+        return _fix(b)
+
+    def add(self, lo: float, hi: float, key: Hashable) -> None:
+        if key in self._spans:
+            self.remove(key)
+        node = _TreeNode(lo, hi, key, self._rnd.random())
+        left, right = self._split(self._root, lo, self._order(key))
+        self._root = self._merge(self._merge(left, node), right)
+        self._spans[key] = (lo, hi)
+
+    def remove(self, key: Hashable) -> bool:
+        span = self._spans.pop(key, None)
+        if span is None:
+            return False
+        okey = self._order(key)
+        left, rest = self._split(self._root, span[0], okey)
+        # `rest` starts with the node itself; drop it
+        parent, n = None, rest
+        while n.left is not None:
+            parent, n = n, n.left
+        if parent is None:
+            rest = n.right
+        else:
+            path = []
+            m = rest
+            while m is not n:
+                path.append(m)
+                m = m.left
+            path[-1].left = n.right
+            for m in reversed(path):
+                _fix(m)
+        self._root = self._merge(left, rest)
+        return True
+
+    def overlapping(self, lo: float, hi: float) -> List[Tuple[float, float, Hashable]]:
+        """Intervals intersecting [lo, hi], ordered by start."""
+        out: List[Tuple[float, float, Hashable]] = []
+        stack: List[Tuple[_TreeNode, bool]] = [(self._root, False)] if self._root is not None else []
+        while stack:
+            n, expanded = stack.pop()
+            if expanded:
+                if n.hi >= lo:
+                    out.append((n.lo, n.hi, n.key))
+                continue
+            if n.max_hi < lo:
+                continue
+            if n.right is not None and n.lo <= hi:
+                stack.append((n.right, False))
+            if n.lo <= hi:
+                stack.append((n, True))
+            if n.left is not None:
+                stack.append((n.left, False))
+        return out
+
+    def stab(self, x: float) -> List[Tuple[float, float, Hashable]]:
+        """Intervals containing `x`."""
+        return self.overlapping(x, x)
+
+    def items(self) -> List[Tuple[float, float, Hashable]]:
+        return self.overlapping(-INF, INF)
+
+    def overlap_pairs(self) -> List[Tuple[Hashable, Hashable]]:
+        """Every pair of intersecting intervals (earlier start first), by one sweep: O(n log n + pairs)."""
+        out: List[Tuple[Hashable, Hashable]] = []
+        active: List[Tuple[float, int, Hashable]] = []
+        for n, (lo, hi, key) in enumerate(self.items()):
+            while active and active[0][0] < lo:
+                heapq.heappop(active)
+            out.extend((k, key) for _, _, k in active)
+            heapq.heappush(active, (hi, n, key))
+        return out
+
+
+def merged(payloads: Sequence[Sequence[Any]]) -> Callable[[Tuple[int, ...]], Tuple[Any, ...]]:
+    """`combine` for "concatenate the payloads of every matching rule, de-duplicated, in rule order"."""
+    def combine(indices: Tuple[int, ...]) -> Tuple[Any, ...]:
+        out: List[Any] = []
+        for k in indices:
+            for item in payloads[k]:
+                if item not in out:
+                    out.append(item)
+        return tuple(out)
+    return combine
+
+
+# Compiled tables keyed by e.g. (kind, doc_id, facts version); an entry is
+# only reused while it was built from the very same source object.
+_COMPILED: "OrderedDict[Hashable, Tuple[Any, Any]]" = OrderedDict()
+_COMPILED_MAX = 256
+_COMPILED_LOCK = threading.Lock()
+
+
+def compiled(key: Hashable, source: Any, build: Callable[[], Any]) -> Any:
+    with _COMPILED_LOCK:
+        hit = _COMPILED.get(key)
+        if hit is not None and hit[0] is source:
+            _COMPILED.move_to_end(key)
+            return hit[1]
+    table = build()
+    with _COMPILED_LOCK:
+        _COMPILED[key] = (source, table)
+        if len(_COMPILED) > _COMPILED_MAX:
+            _COMPILED.popitem(last=False)
+    return table
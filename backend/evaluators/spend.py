@@ -1,15 +1,47 @@
 from __future__ import annotations
-from typing import Any, Dict, List
+from typing import Any, Dict, List, Tuple
+
+from evaluators.intervals import IntervalTable, compiled, from_condition, from_range, merged
+
+def _tier_table(tiers: List[Dict[str, Any]]) -> IntervalTable:
+    # First matching tier wins, as with the linear scan this replaces.
+    return compiled(
+        ("spend_tiers", id(tiers)),
+        tiers,
+        lambda: IntervalTable(
+            [from_range(t.get("range") or {}) for t in tiers],
+            lambda idx: idx[0] if idx else None,
+        ),
+    )
 
 def _pick_tier(amount: float | None, tiers: List[Dict[str, Any]]) -> Dict[str, Any] | None:
     if amount is None:
         return None
+    k = _tier_table(tiers).lookup(amount)
+    return None if k is None else tiers[k]
+
+def compile_spending_rules(rules: Dict[str, Any]) -> Tuple[List[str], IntervalTable, Dict[str, List[str]]]:
+    """
+    Compile a doc's `spending_rules` facts into (unconditional steps,
+    amount -> tier steps table, lowercased category -> exception steps).
+    """
+    tiers = rules.get("tiers") or []
+    always: List[str] = []
+    intervals: List[Any] = []
+    payloads: List[List[str]] = []
     for t in tiers:
-        _min = t["range"]["min"]
-        _max = float("inf") if t["range"]["max"] == "inf" else t["range"]["max"]
-        if _min <= float(amount) <= _max:
-            return t
-    return None
+        cond = t.get("condition") or {}
+        if (cond.get("op") or "").lower() == "any":
+            always.extend(t.get("required_steps") or [])
+        elif cond.get("field") == "amount" and cond.get("op") not in (None, "between"):
+            intervals.append(from_condition(cond) if cond.get("value") is not None else None)
+            payloads.append(t.get("required_steps") or [])
+    by_category: Dict[str, List[str]] = {}
+    for ex in rules.get("exceptions") or []:
+        cat = ((ex.get("if") or {}).get("category") or "").lower()
+        if cat:
+            by_category.setdefault(cat, []).extend(ex.get("then_add_steps") or [])
+    return always, IntervalTable(intervals, merged(payloads)), by_category
 
 def derive_requirements(spend: Dict[str, Any], policy: Dict[str, Any]) -> Dict[str, Any]:
     """
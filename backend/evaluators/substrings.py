@@ -0,0 +1,84 @@
+from __future__ import annotations
+from collections import deque
+from typing import Dict, Iterable, List, Set, Tuple
+
+# Multi-pattern substring matching shared by the rule evaluators (approval
+# triggers by instrument, exception policies by keyword): many patterns
+# against one short text.
+#
+# An Aho-Corasick automaton (trie of the patterns plus failure links) finds
+# every pattern occurring in the text in one pass over it, so the cost of a
+# lookup grows with the text, not with the number of patterns. Transitions
+# that go through failure links are resolved once and remembered per
+# (state, character), so after warm-up each character is one dict lookup.
+
+
+class AhoCorasick:
+    """`search(text)` returns the indices of every pattern occurring in `text`."""
+
+    def __init__(self, patterns: Iterable[str]):
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._out: List[Tuple[int, ...]] = [()]
+        for pid, p in enumerate(patterns):
+            node = 0
+            for ch in p:
+                nxt = self._goto[node].get(ch)
+                if nxt is None:
+                    nxt = len(self._goto)
+                    self._goto[node][ch] = nxt
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._out.append(())
+                node = nxt
+            self._out[node] += (pid,)
+
+        # Breadth-first: fail links point to the longest proper suffix that is
+        # also a trie prefix; outputs inherit the fail target's outputs.
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for ch, nxt in self._goto[node].items():
+                queue.append(nxt)
+                self._fail[nxt] = self._step(self._fail[node], ch) if node else 0
+                self._out[nxt] += self._out[self._fail[nxt]]
+        self._delta: List[Dict[str, int]] = [dict(g) for g in self._goto]
+
+    def _step(self, node: int, ch: str) -> int:
+        while node and ch not in self._goto[node]:
+            node = self._fail[node]
+        return self._goto[node].get(ch, 0)
+
+    def search(self, text: str) -> Set[int]:
+        found: Set[int] = set()
+        delta, out = self._delta, self._out
+        node = 0
+        for ch in text:
+            nxt = delta[node].get(ch)
+            if nxt is None:
+                nxt = delta[node][ch] = self._step(node, ch)
+            node = nxt
+            if out[node]:
+                found.update(out[node])
+        return found
+
+
+class SubstringMatcher:
+    """Ids of the (pattern, id) pairs whose pattern is a substring of a text; empty patterns are ignored."""
+
+    def __init__(self, pairs: Iterable[Tuple[str, int]]):
+        self.by_pattern: Dict[str, List[int]] = {}
+        for p, k in pairs:
+            if p:
+                self.by_pattern.setdefault(p, []).append(k)
+        self._ids = list(self.by_pattern.values())
+        self._automaton = AhoCorasick(self.by_pattern)
+
+    def match(self, text: str) -> List[int]:
+        """Ids of the matching patterns, sorted."""
+        if not self._ids or not text:
+            return []
+        hit: Set[int] = set()
+        for pid in self._automaton.search(text):
+            hit.update(self._ids[pid])
+        return sorted(hit)
@@ -0,0 +1,173 @@
+# facts/sqlite_store.py
+from __future__ import annotations
+import argparse
+import json
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+# SQLite backend for facts/store.py (FACTS_BACKEND=sqlite).
+#
+# One row per (doc_id, key) in a WAL-mode database, so an agent writing its
+# key never rewrites (or clobbers) another agent's key, readers never block
+# writers, and every write is a single transaction. Each doc has a version
+# bumped on every write; a row's version is the doc version it was last
+# written at. Parsed facts are cached per doc and revalidated against that
+# version with one indexed lookup, which also sees writes from other workers.
+
+FACTS_DIR = Path(__file__).resolve().parent
+DB_PATH = Path(os.getenv("FACTS_DB", str(FACTS_DIR / "facts.db")))
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS docs (
+    doc_id  TEXT PRIMARY KEY,
+    version INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS facts (
+    doc_id     TEXT NOT NULL,
+    key        TEXT NOT NULL,
+    value      TEXT NOT NULL,
+    version    INTEGER NOT NULL,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (doc_id, key)
+);
+"""
+
+_local = threading.local()
+_cache_lock = threading.Lock()
+# doc_id -> (version, data)
+_cache: Dict[str, Tuple[int, Dict[str, Any]]] = {}
+_listeners: List[Callable[[Optional[str]], None]] = []
+
+
+def _conn() -> sqlite3.Connection:
+    conn = getattr(_local, "conn", None)
+    if conn is None or getattr(_local, "path", None) != DB_PATH:
+        DB_PATH.parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(str(DB_PATH), timeout=30.0, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.executescript(_SCHEMA)
+        _local.conn, _local.path = conn, DB_PATH
+    return conn
+
+
+def _bump(conn: sqlite3.Connection, doc_id: str) -> int:
+    conn.execute(
+        "INSERT INTO docs (doc_id, version) VALUES (?, 1) "
+        "ON CONFLICT(doc_id) DO UPDATE SET version = version + 1",
+        (doc_id,),
+    )
+    return conn.execute("SELECT version FROM docs WHERE doc_id = ?", (doc_id,)).fetchone()[0]
+
+
+def _write(doc_id: str, items: Dict[str, Any], replace: bool) -> None:
+    conn = _conn()
+    now = time.time()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        ver = _bump(conn, doc_id)
+        if replace:
+            keep = list(items)
+            conn.execute(
+                f"DELETE FROM facts WHERE doc_id = ? AND key NOT IN ({','.join('?' * len(keep))})",
+                (doc_id, *keep),
+            )
+        conn.executemany(
+            "INSERT INTO facts (doc_id, key, value, version, updated_at) VALUES (?, ?, ?, ?, ?) "
+            "ON CONFLICT(doc_id, key) DO UPDATE SET value = excluded.value, "
+            "version = excluded.version, updated_at = excluded.updated_at",
+            [(doc_id, k, json.dumps(v), ver, now) for k, v in items.items()],
+        )
+        conn.execute("COMMIT")
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    with _cache_lock:
+        _cache.pop(doc_id, None)
+    _notify(doc_id)
+
+
+def on_change(fn: Callable[[Optional[str]], None]) -> None:
+    _listeners.append(fn)
+
+
+def _notify(doc_id: Optional[str]) -> None:
+    for fn in list(_listeners):
+        fn(doc_id)
+
+
+def version(doc_id: str) -> int:
+    row = _conn().execute("SELECT version FROM docs WHERE doc_id = ?", (doc_id,)).fetchone()
+    return row[0] if row else 0
+
+
+def load(doc_id: str) -> Dict[str, Any]:
+    ver = version(doc_id)
+    with _cache_lock:
+        hit = _cache.get(doc_id)
+    if hit is None or hit[0] != ver:
+        conn = _conn()
+        # Read the rows and their doc version in one snapshot.
+        conn.execute("BEGIN")
+        try:
+            ver = version(doc_id)
+            rows = conn.execute("SELECT key, value FROM facts WHERE doc_id = ?", (doc_id,)).fetchall()
+        finally:
+            conn.execute("COMMIT")
+        hit = (ver, {k: json.loads(v) for k, v in rows})
+        with _cache_lock:
+            _cache[doc_id] = hit
+    return dict(hit[1])
+
+
+def save(doc_id: str, data: Dict[str, Any]) -> None:
+    _write(doc_id, data, replace=True)
+
+
+def upsert(doc_id: str, key: str, value: Any) -> None:
+    _write(doc_id, {key: value}, replace=False)
+
+
+def row_version(doc_id: str, key: str) -> int:
+    row = _conn().execute("SELECT version FROM facts WHERE doc_id = ? AND key = ?", (doc_id, key)).fetchone()
+    return row[0] if row else 0
+
+
+def invalidate(doc_id: Optional[str] = None) -> None:
+    with _cache_lock:
+        if doc_id is None:
+            _cache.clear()
+        else:
+            _cache.pop(doc_id, None)
+    _notify(doc_id)
+
+
+def migrate(src_dir: Path = FACTS_DIR, overwrite: bool = False) -> Dict[str, int]:
+    """Import every `<doc_id>.json` in `src_dir`; returns {doc_id: keys imported}."""
+    out: Dict[str, int] = {}
+    for p in sorted(src_dir.glob("*.json")):
+        doc_id = p.name[: -len(".json")]
+        if version(doc_id) and not overwrite:
+            continue
+        data = json.loads(p.read_text(encoding="utf-8"))
+        save(doc_id, data)
+        out[doc_id] = len(data)
+    return out
+
+
+if __name__ == "__main__":
+    # python -m facts.sqlite_store [--src DIR] [--db PATH] [--overwrite]
+    ap = argparse.ArgumentParser(description="Import facts/*.json into the SQLite facts store.")
+    ap.add_argument("--src", type=Path, default=FACTS_DIR)
+    ap.add_argument("--db", type=Path, default=DB_PATH)
+    ap.add_argument("--overwrite", action="store_true", help="re-import docs already in the database")
+    args = ap.parse_args()
+    DB_PATH = args.db
+    imported = migrate(args.src, overwrite=args.overwrite)
+    for doc_id, n in imported.items():
+        print(f"{doc_id}: {n} keys")
+    print(f"imported {len(imported)} doc(s) into {DB_PATH}")
@@ -1,24 +1,91 @@
 from __future__ import annotations
+import itertools
 import json
+import os
+import threading
+import time
 from pathlib import Path
-from typing import Dict, Any, Optional
+from typing import Any, Callable, Dict, List, Optional, Tuple
 
 FACTS_DIR = Path(__file__).resolve().parent.parent / "facts"
 FACTS_DIR.mkdir(parents=True, exist_ok=True)
 
+# Parsed facts are cached per doc id. Every save/upsert bumps the doc's
+# version; files edited behind our back are picked up by mtime, checked at
+# most every FACTS_STAT_INTERVAL seconds so hot reads do no disk I/O at all.
+STAT_INTERVAL = float(os.getenv("FACTS_STAT_INTERVAL", "1.0"))
+
+_versions = itertools.count(1)
+_lock = threading.RLock()
+# doc_id -> (version, mtime_ns, last_checked, data)
+_cache: Dict[str, Tuple[int, int, float, Dict[str, Any]]] = {}
+# Called with the doc id after each save/upsert/invalidate (None: every doc).
+_listeners: List[Callable[[Optional[str]], None]] = []
+
 def _path(doc_id: str) -> Path:
     return FACTS_DIR / f"{doc_id}.json"
 
+def _mtime(doc_id: str) -> int:
+    try:
+        return _path(doc_id).stat().st_mtime_ns
+    except OSError:
+        return 0
+
+def _entry(doc_id: str) -> Tuple[int, int, float, Dict[str, Any]]:
+    now = time.monotonic()
+    with _lock:
+        hit = _cache.get(doc_id)
+        if hit is not None and now - hit[2] < STAT_INTERVAL:
+            return hit
+        mtime = _mtime(doc_id)
+        if hit is not None and hit[1] == mtime:
+            hit = (hit[0], mtime, now, hit[3])
+        else:
+            data: Dict[str, Any] = {}
+            if mtime:
+                data = json.loads(_path(doc_id).read_text(encoding="utf-8"))
+            hit = (next(_versions), mtime, now, data)
+        _cache[doc_id] = hit
+        return hit
+
 def load(doc_id: str) -> Dict[str, Any]:
-    p = _path(doc_id)
-    if p.exists():
-        return json.loads(p.read_text(encoding="utf-8"))
-    return {}
+    # Shallow copy: callers may set top-level keys before save(), but must not mutate nested values.
+    return dict(_entry(doc_id)[3])
 
 def save(doc_id: str, data: Dict[str, Any]) -> None:
-    _path(doc_id).write_text(json.dumps(data, indent=2), encoding="utf-8")
+    with _lock:
+        _path(doc_id).write_text(json.dumps(data, indent=2), encoding="utf-8")
+        _cache[doc_id] = (next(_versions), _mtime(doc_id), time.monotonic(), dict(data))
+    _notify(doc_id)
 
 def upsert(doc_id: str, key: str, value: Any) -> None:
-    d = load(doc_id)
-    d[key] = value
-    save(doc_id, d)
+    with _lock:
+        d = load(doc_id)
+        d[key] = value
+        save(doc_id, d)
+
+def on_change(fn: Callable[[Optional[str]], None]) -> None:
+    """Register `fn(doc_id)` to drop derived caches when a doc's facts are rewritten."""
+    _listeners.append(fn)
+
+def _notify(doc_id: Optional[str]) -> None:
+    for fn in list(_listeners):
+        fn(doc_id)
+
+def version(doc_id: str) -> int:
+    """Changes whenever the doc's facts change; key downstream caches on it."""
+    return _entry(doc_id)[0]
+
+def invalidate(doc_id: Optional[str] = None) -> None:
+    """Forget cached facts (all docs if `doc_id` is None); the next read goes to disk."""
+    with _lock:
+        if doc_id is None:
+            _cache.clear()
+        else:
+            _cache.pop(doc_id, None)
+    _notify(doc_id)
+
+# FACTS_BACKEND=sqlite swaps in the transactional per-key store (same API);
+# import existing JSON facts with `python -m facts.sqlite_store`.
+if os.getenv("FACTS_BACKEND", "json").strip().lower() == "sqlite":
+    from facts.sqlite_store import invalidate, load, on_change, row_version, save, upsert, version  # noqa: F401,E402
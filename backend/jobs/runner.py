@@ -0,0 +1,108 @@
+# jobs/runner.py
+from __future__ import annotations
+import asyncio
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Coroutine, Dict, Optional, Set
+from uuid import uuid4
+
+Notify = Callable[[str, Dict[str, Any]], Awaitable[None]]
+
+
+@dataclass
+class Job:
+    id: str
+    kind: str
+    notify: Notify
+    status: str = "queued"          # queued | running | finished | failed
+    stage: Optional[str] = None
+    created: float = field(default_factory=time.time)
+    started: Optional[float] = None
+    finished: Optional[float] = None
+    result: Any = None
+    error: Optional[str] = None
+    done: asyncio.Event = field(default_factory=asyncio.Event)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "job_id": self.id,
+            "kind": self.kind,
+            "status": self.status,
+            "stage": self.stage,
+            "created": self.created,
+            "started": self.started,
+            "finished": self.finished,
+            "result": self.result,
+            "error": self.error,
+        }
+
+
+class JobBusy(Exception):
+    pass
+
+
+class JobRunner:
+    """
+    Runs agent jobs without blocking the event loop.
+
+    Each job is an asyncio task that reports RUN_STARTED / RUN_PROGRESS /
+    RUN_FINISHED through its `notify` callback; blocking work inside it (LLM
+    calls, facts I/O) goes through `run_blocking`, which uses a bounded thread
+    pool. At most `max_pending` jobs may be queued or running at once, and
+    the last `history` jobs are kept for polling.
+    """
+
+    def __init__(self, max_workers: int = 4, max_pending: int = 64, history: int = 256):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="agent")
+        self.max_pending = max_pending
+        self.history = history
+        self.jobs: "OrderedDict[str, Job]" = OrderedDict()
+        self._tasks: Set[asyncio.Task] = set()
+
+    def get(self, job_id: str) -> Optional[Job]:
+        return self.jobs.get(job_id)
+
+    def pending(self) -> int:
+        return sum(1 for j in self.jobs.values() if j.status in ("queued", "running"))
+
+    async def run_blocking(self, fn: Callable[..., Any], *args: Any) -> Any:
+        return await asyncio.get_running_loop().run_in_executor(self.executor, fn, *args)
+
+    async def progress(self, job: Job, stage: str, **info: Any) -> None:
+        job.stage = stage
+        await job.notify("RUN_PROGRESS", {"job_id": job.id, "kind": job.kind, "stage": stage, **info})
+
+    def submit(self, kind: str, notify: Notify, work: Callable[[Job], Coroutine[Any, Any, Any]]) -> Job:
+        """Start `work(job)` in the background and return the job immediately."""
+        if self.pending() >= self.max_pending:
+            raise JobBusy(f"Too many agent runs in flight ({self.max_pending})")
+        job = Job(id=uuid4().hex[:12], kind=kind, notify=notify)
+        self.jobs[job.id] = job
+        while len(self.jobs) > self.history:
+            oldest = next(iter(self.jobs.values()))
+            if oldest.status in ("queued", "running"):
+                break
+            self.jobs.popitem(last=False)
+        task = asyncio.create_task(self._run(job, work))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return job
+
+    async def _run(self, job: Job, work: Callable[[Job], Coroutine[Any, Any, Any]]) -> None:
+        job.status = "running"
+        job.started = time.time()
+        await job.notify("RUN_STARTED", {"job_id": job.id, "kind": job.kind, "ts": job.started})
+        try:
+            job.result = await work(job)
+            job.status = "finished"
+        except Exception as e:
+            job.status = "failed"
+            job.error = f"{type(e).__name__}: {e}"
+        job.finished = time.time()
+        job.done.set()
+        await job.notify("RUN_FINISHED", {
+            "job_id": job.id, "kind": job.kind, "status": job.status,
+            "error": job.error, "ts": job.finished,
+        })
@@ -0,0 +1,180 @@
+# retrieval/analyzer.py
+from __future__ import annotations
+import os
+import re
+import unicodedata
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Tuple
+
+# Text -> index terms, applied identically to chunks and queries.
+#
+# "simple" is the original lower().split(). "standard" normalizes unicode
+# (NFKC) and case, splits on punctuation, drops English stopwords and
+# rewrites numbers in a canonical form: "20,000", "20000.00" and "$20,000"
+# all yield "20000", and money amounts additionally yield "$20000" so
+# currency mentions still rank above bare numbers. "english" adds a light
+# suffix stemmer (plurals, -ing, -ed, -ly, final -e); on the AFOA sample it
+# lowers recall of the agents' queries (python -m retrieval.bench recall),
+# so it is opt-in. An index stores the spec of the analyzer it was built
+# with and analyzes queries with the same one.
+#
+# Analyzed tokens are cached per distinct text, so re-indexing a doc (or
+# adding it to a corpus index) does not analyze its chunks again.
+
+STOPWORDS = frozenset("""
+a about above after again against all am an and any are as at be because been before being below between
+both but by can could did do does doing down during each few for from further had has have having he her
+here hers herself him himself his how i if in into is it its itself just me more most my myself no nor not
+of off on once only or other our ours ourselves out over own same she should so some such than that the
+their theirs them themselves then there these they this those through to too under until up very was we
+were what when where which while who whom why will with would you your yours yourself yourselves
+""".split())
+
+_TOKEN = re.compile(
+    r"(?P<money>\$\s?\d[\d,]*(?:\.\d+)?(?:\s?[km]\b)?)"
+    r"|(?P<word>[^\W_]*[^\W\d_][^\W_]*(?:['’][^\W\d_]+)*)"  # at least one letter: "cfo", "t4", "2nd"
+    r"|(?P<number>\d[\d,]*(?:\.\d+)?%?)"
+)
+_WHITESPACE = re.compile(r"\S+")
+_VOWEL = re.compile(r"[aeiouy]")
+
+
+def canonical_number(raw: str) -> str:
+    """'20,000.00' -> '20000', '1.50' -> '1.5', '007' -> '7' (digits, commas and one '.')."""
+    s = raw.replace(",", "")
+    if "." in s:
+        whole, frac = s.split(".", 1)
+        frac = frac.rstrip("0")
+        whole = whole.lstrip("0") or "0"
+        return f"{whole}.{frac}" if frac else whole
+    return s.lstrip("0") or "0"
+
+
+def _money(raw: str) -> Optional[str]:
+    s = raw[1:].strip().lower()
+    mult = 1
+    if s.endswith("k") or s.endswith("m"):
+        mult = 1000 if s[-1] == "k" else 1000000
+        s = s[:-1].strip()
+    num = canonical_number(s)
+    if mult != 1:
+        try:
+            value = float(num) * mult
+        except ValueError:
+            return None
+        num = canonical_number(f"{value:.2f}")
+    return num
+
+
+@lru_cache(maxsize=65536)
+def stem(word: str) -> str:
+    """Light English suffix stripping; conservative so distinct policy terms stay distinct."""
+    w = word
+    if len(w) <= 3:
+        return w
+    if w.endswith("ies") and len(w) > 4:
+        w = w[:-3] + "y"
+    elif w.endswith("sses"):
+        w = w[:-2]
+    elif w.endswith("es") and (w[-3:-2] in ("s", "x", "z") or w[-4:-2] in ("ch", "sh")):
+        w = w[:-2]
+    elif w.endswith("s") and not w.endswith(("ss", "us", "is")):
+        w = w[:-1]
+    for suffix in ("ing", "ed"):
+        base = w[:-len(suffix)]
+        if w.endswith(suffix) and len(base) >= 3 and _VOWEL.search(base):
+            w = base
+            if len(w) > 3 and w[-1] == w[-2] and w[-1] not in "lsz":
+                w = w[:-1]  # running -> run, submitted -> submit
+            break
+    if w.endswith("ly") and len(w) > 5:
+        w = w[:-2]
+    if w.endswith("e") and len(w) > 4:
+        w = w[:-1]  # complete / completed -> complet
+    return w
+
+
+class Analyzer:
+    def __init__(self, name: str = "standard", lowercase: bool = True, stem: bool = False,
+                 stopwords: bool = True, numbers: bool = True, cache_size: int = 65536):
+        self.name = name
+        self.lowercase = lowercase
+        self.stem = stem
+        self.stopwords = stopwords
+        self.numbers = numbers
+        self._cached = lru_cache(maxsize=cache_size)(self._analyze)
+
+    @property
+    def spec(self) -> Dict[str, Any]:
+        return {"name": self.name, "lowercase": self.lowercase, "stem": self.stem,
+                "stopwords": self.stopwords, "numbers": self.numbers}
+
+    def __call__(self, text: str) -> List[str]:
+        return list(self._cached(text))
+
+    def cache_info(self) -> Any:
+        return self._cached.cache_info()
+
+    def spans(self, text: str) -> List[Tuple[int, int, Tuple[str, ...]]]:
+        """(start, end, terms) of each token of `text` in original offsets, for highlighting."""
+        pattern = _WHITESPACE if self.name == "simple" else _TOKEN
+        lowered = text.lower() if self.lowercase else text
+        out = []
+        for m in pattern.finditer(lowered if len(lowered) == len(text) else text):
+            terms = self._cached(m.group(0))
+            if terms:
+                out.append((m.start(), m.end(), terms))
+        return out
+
+    def _analyze(self, text: str) -> Tuple[str, ...]:
+        if self.name == "simple":
+            return tuple((text.lower() if self.lowercase else text).split())
+        text = unicodedata.normalize("NFKC", text)
+        if self.lowercase:
+            text = text.lower()
+        out: List[str] = []
+        for m in _TOKEN.finditer(text):
+            kind, raw = m.lastgroup, m.group(0)
+            if kind == "word":
+                w = raw.replace("’", "'")
+                if w.endswith("'s"):
+                    w = w[:-2]
+                w = w.replace("'", "")
+                if self.stopwords and w in STOPWORDS:
+                    continue
+                out.append(stem(w) if self.stem else w)
+            elif not self.numbers:
+                out.append(raw)
+            elif kind == "money":
+                num = _money(raw)
+                if num is not None:
+                    out.extend(("$" + num, num))
+            else:
+                pct = raw.endswith("%")
+                num = canonical_number(raw[:-1] if pct else raw)
+                out.append(num + "%" if pct else num)
+        return tuple(out)
+
+
+_INSTANCES: Dict[Tuple[Tuple[str, Any], ...], Analyzer] = {}
+
+PRESETS: Dict[str, Dict[str, Any]] = {
+    "simple": {"name": "simple", "lowercase": True, "stem": False, "stopwords": False, "numbers": False},
+    "standard": {"name": "standard", "lowercase": True, "stem": False, "stopwords": True, "numbers": True},
+    "english": {"name": "english", "lowercase": True, "stem": True, "stopwords": True, "numbers": True},
+}
+
+
+def get_analyzer(spec: Any = None) -> Analyzer:
+    """Shared Analyzer for a preset name or spec dict (default: RETRIEVAL_ANALYZER, "standard")."""
+    if spec is None:
+        spec = os.getenv("RETRIEVAL_ANALYZER", "standard").strip().lower()
+    if isinstance(spec, str):
+        if spec not in PRESETS:
+            raise ValueError(f"unknown analyzer '{spec}' (expected one of {', '.join(PRESETS)})")
+        spec = PRESETS[spec]
+    key = tuple(sorted(spec.items()))
+    inst = _INSTANCES.get(key)
+    if inst is None:
+        inst = _INSTANCES[key] = Analyzer(**spec)
+    return inst
@@ -0,0 +1,256 @@
+# retrieval/bench.py
+from __future__ import annotations
+import argparse
+import random
+import re
+import statistics
+import sys
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+import numpy as np
+
+from retrieval.analyzer import PRESETS, get_analyzer
+from retrieval.corpus import CorpusIndex
+from retrieval.index import Chunk, DocIndex, chunk_text_to_paragraphs
+
+# Retrieval benchmarks over a real policy document.
+#
+# latency: query latency against corpus size for rank_bm25 (score every
+# chunk, sort all of them), DocIndex postings + argpartition and DocIndex
+# WAND, checking that all three return the same ranking. Corpora are grown
+# from the document: paragraph lengths and tokens are sampled from its
+# chunks, so term statistics stay realistic at tens of thousands of
+# paragraphs.
+#
+# corpus: CorpusIndex as documents are added one by one (each a synthetic
+# copy of the source's size): incremental add time, /search latency over the
+# whole corpus and filtered to one document, and, up to --baseline-max
+# chunks, whether its first page equals rank_bm25 over all chunks (up to
+# float ties).
+#
+# recall: recall@k of each agent's fixed query per analyzer, and the prompt
+# size of the context built from those k chunks. Relevant chunks are silver
+# labels: the chunks in which the agent's own candidate extractor (money
+# thresholds, SoD constraints, approval amounts, exception sentences) finds
+# something, or for control checklists a control-topic + time-limit regex.
+# recall@k = relevant chunks in the top k / min(k, relevant chunks).
+#
+#   python -m retrieval.bench latency docs/Sample_Financial_Policies_AFOA.pdf --sizes 1000 10000 50000
+#   python -m retrieval.bench corpus docs/Sample_Financial_Policies_AFOA.pdf --docs 1 10 50 200
+#   python -m retrieval.bench recall docs/Sample_Financial_Policies_AFOA.pdf
+
+
+def agent_queries() -> List[str]:
+    """Every agent's fixed retrieval query (the ones ingest pre-warms), read from the agents themselves."""
+    from agents import approval_chain, control_checklists, exceptions_tracker, roles_sod, spending_checker
+
+    return [m.RETRIEVAL_QUERY for m in (spending_checker, roles_sod, approval_chain, control_checklists, exceptions_tracker)]
+
+
+def load_chunks(path: Path) -> List[Chunk]:
+    if path.suffix.lower() == ".pdf":
+        from ingest import extract_text_from_pdf
+        text = extract_text_from_pdf(str(path))
+    else:
+        text = path.read_text(encoding="utf-8", errors="ignore")
+    return chunk_text_to_paragraphs(text, page_map=[])
+
+
+def synthetic_corpus(seed_chunks: List[Chunk], size: int, rng: random.Random) -> List[Chunk]:
+    tokens = [t for c in seed_chunks for t in c.text.split()]
+    lengths = [max(1, len(c.text.split())) for c in seed_chunks]
+    return [
+        Chunk(id=f"chunk_{i}", text=" ".join(rng.choices(tokens, k=rng.choice(lengths))), page=1, offset=0)
+        for i in range(size)
+    ]
+
+
+def _timed(fn: Callable[[], List[int]], repeat: int) -> float:
+    """Median wall time of `fn` in milliseconds."""
+    runs = []
+    for _ in range(repeat):
+        t = time.perf_counter()
+        fn()
+        runs.append((time.perf_counter() - t) * 1000)
+    return statistics.median(runs)
+
+
+def latency(args: argparse.Namespace) -> int:
+    rng = random.Random(args.seed)
+    analyzer = get_analyzer(args.analyzer)
+    seed_chunks = load_chunks(args.source)
+    vocab = sorted({t for c in seed_chunks for t in analyzer(c.text)})
+    queries = [analyzer(q) for q in agent_queries()]
+    queries += [rng.sample(vocab, rng.randint(2, 6)) for _ in range(args.queries)]
+
+    print(f"{'chunks':>8} {'build ms':>9} {'rank_bm25 ms':>13} {'postings ms':>12} {'wand ms':>8} {'same ranking':>13}")
+    mismatches = 0
+    for size in args.sizes:
+        chunks = synthetic_corpus(seed_chunks, size, rng)
+        t = time.perf_counter()
+        index = DocIndex("bench", chunks, analyzer)
+        build_ms = (time.perf_counter() - t) * 1000
+
+        baseline = None
+        if size <= args.baseline_max:
+            from rank_bm25 import BM25Okapi
+            bm25 = BM25Okapi([analyzer(c.text) for c in chunks])
+
+            def baseline(q: List[str]) -> List[int]:
+                scores = bm25.get_scores(q)
+                return sorted(range(len(scores)), key=lambda i: scores[i], reverse=True)[:args.k]
+
+        same = True
+        for q in queries:
+            got = index.top_indices(q, args.k)
+            if index.top_indices(q, args.k, wand=True) != got or (baseline and baseline(q) != got):
+                same = False
+                mismatches += 1
+
+        def per_query(fn: Callable[[List[str]], List[int]]) -> float:
+            return statistics.mean(_timed(lambda: fn(q), args.repeat) for q in queries)
+
+        base_ms = f"{per_query(baseline):13.2f}" if baseline else f"{'-':>13}"
+        post_ms = per_query(lambda q: index.top_indices(q, args.k))
+        wand_ms = per_query(lambda q: index.top_indices(q, args.k, wand=True))
+        print(f"{size:>8} {build_ms:9.0f} {base_ms} {post_ms:12.2f} {wand_ms:8.2f} {str(same):>13}")
+    return 1 if mismatches else 0
+
+
+def corpus(args: argparse.Namespace) -> int:
+    rng = random.Random(args.seed)
+    analyzer = get_analyzer(args.analyzer)
+    seed_chunks = load_chunks(args.source)
+    vocab = sorted({t for c in seed_chunks for t in analyzer(c.text)})
+    queries = agent_queries() + [" ".join(rng.sample(vocab, rng.randint(2, 6))) for _ in range(args.queries)]
+
+    index = CorpusIndex(analyzer)
+    docs: List[DocIndex] = []
+    print(f"{'docs':>6} {'chunks':>8} {'add ms':>7} {'search ms':>10} {'1-doc ms':>9} {'same ranking':>13}")
+    mismatches = 0
+    for target in args.docs:
+        add_ms = []
+        while len(docs) < target:
+            doc = DocIndex(f"doc{len(docs)}", synthetic_corpus(seed_chunks, len(seed_chunks), rng), analyzer)
+            t = time.perf_counter()
+            index.add(doc)
+            add_ms.append((time.perf_counter() - t) * 1000)
+            docs.append(doc)
+        chunks = sum(len(d) for d in docs)
+
+        same: Any = "-"
+        if chunks <= args.baseline_max:
+            from rank_bm25 import BM25Okapi
+            flat = [(d.doc_id, i) for d in docs for i in range(len(d))]
+            bm25 = BM25Okapi([analyzer(c.text) for d in docs for c in d.chunks])
+            same = True
+            for q in queries:
+                scores = bm25.get_scores(analyzer(q))
+                want = [i for i in sorted(range(len(flat)), key=lambda i: -scores[i]) if scores[i] != 0][:args.k]
+                _, hits = index.search(q, 0, args.k)
+                got = [(h.doc_id, h.index) for h in hits]
+                # Scores are summed in a different order, so near-equal ones may swap.
+                if got != [flat[i] for i in want] and not np.allclose([h.score for h in hits], scores[want], rtol=1e-9):
+                    same = False
+                    mismatches += 1
+
+        one = docs[len(docs) // 2].doc_id
+        all_ms = statistics.mean(_timed(lambda: index.search(q, 0, args.k), args.repeat) for q in queries)
+        one_ms = statistics.mean(_timed(lambda: index.search(q, 0, args.k, doc_ids=[one]), args.repeat) for q in queries)
+        add = f"{statistics.mean(add_ms):7.1f}" if add_ms else f"{'-':>7}"
+        print(f"{len(docs):>6} {chunks:>8} {add} {all_ms:10.2f} {one_ms:9.2f} {str(same):>13}")
+    return 1 if mismatches else 0
+
+
+def _labels(chunks: List[Chunk]) -> Dict[str, Tuple[str, Set[str]]]:
+    """agent -> (its retrieval query, ids of the chunks its candidate extractor fires on)."""
+    from agents import approval_chain, control_checklists, exceptions_tracker, roles_sod, spending_checker
+
+    topic = re.compile(r"\b(travel|advance|reimburs|reconcil|credit card)", re.IGNORECASE)
+    limit = re.compile(r"\b(days?|weeks?|monthly|month)\b", re.IGNORECASE)
+    extractors: Dict[str, Tuple[str, Callable[[Chunk], Any]]] = {
+        "spending_checker": (spending_checker.RETRIEVAL_QUERY, lambda c: spending_checker._money_candidates([c])),
+        "roles_sod": (roles_sod.RETRIEVAL_QUERY, lambda c: roles_sod._constraint_candidates([c])),
+        "approval_chain": (approval_chain.RETRIEVAL_QUERY, lambda c: approval_chain._harvest_amount_candidates([c])),
+        "control_checklists": (control_checklists.RETRIEVAL_QUERY, lambda c: topic.search(c.text) and limit.search(c.text)),
+        "exceptions_tracker": (exceptions_tracker.RETRIEVAL_QUERY, lambda c: exceptions_tracker._exception_candidates([c])),
+    }
+    return {name: (query, {c.id for c in chunks if fires(c)}) for name, (query, fires) in extractors.items()}
+
+
+def prompt_tokens(chunks: List[Chunk]) -> int:
+    """Estimated tokens (chars / 4) of the agents' `[id p.N] text` context for these chunks."""
+    return len("\n\n".join(f"[{c.id} p.{c.page}] {c.text}" for c in chunks)) // 4
+
+
+def recall(args: argparse.Namespace) -> int:
+    chunks = load_chunks(args.source)
+    labels = _labels(chunks)
+    analyzers = args.analyzers or list(PRESETS)
+    indexes = {name: DocIndex("bench", chunks, get_analyzer(name)) for name in analyzers}
+    base, base_k = analyzers[0], args.baseline_k
+
+    ks = sorted(set(args.ks) | {base_k})
+    print(f"{len(chunks)} chunks; recall@k / est. prompt tokens; last column: smallest k matching {base}@{base_k}")
+    print(f"{'agent':<20} {'relevant':>8} {'analyzer':<10} " + " ".join(f"{'@' + str(k):>12}" for k in ks) + f" {'match k':>8} {'tokens':>7}")
+    totals = {name: [0.0, 0] for name in analyzers}
+    for agent, (query, relevant) in labels.items():
+        target = None
+        for name in analyzers:
+            index = indexes[name]
+            ranked = index.top_k(query, max(max(ks), args.max_k))
+            def at(k: int) -> float:
+                return sum(c.id in relevant for c in ranked[:k]) / max(1, min(k, len(relevant)))
+            cells = " ".join(f"{at(k):5.2f}/{prompt_tokens(ranked[:k]):<6}" for k in ks)
+            if target is None:
+                target = at(base_k)
+            match = next((k for k in range(1, len(ranked) + 1) if at(k) >= target), None) if target > 0 else None
+            tokens = prompt_tokens(ranked[:match]) if match else None
+            if match:
+                totals[name][0] += tokens
+                totals[name][1] += 1
+            print(f"{agent:<20} {len(relevant):>8} {name:<10} {cells} {match or '-':>8} {tokens if tokens is not None else '-':>7}")
+    for name in analyzers:
+        print(f"{'total tokens':<20} {'':>8} {name:<10} at matching k: {int(totals[name][0])} ({totals[name][1]} agents)")
+    return 0
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    ap = argparse.ArgumentParser(description="Benchmark BM25 retrieval: latency against corpus size and document count, recall and prompt size per analyzer.")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+
+    lat = sub.add_parser("latency", help="top-k latency against corpus size")
+    lat.add_argument("source", type=Path, help="PDF or text file whose paragraphs seed the corpora")
+    lat.add_argument("--sizes", type=int, nargs="+", default=[1000, 5000, 20000, 50000])
+    lat.add_argument("--queries", type=int, default=20, help="random queries per size (besides the agent queries)")
+    lat.add_argument("--k", type=int, default=8)
+    lat.add_argument("--repeat", type=int, default=3)
+    lat.add_argument("--baseline-max", type=int, default=50000, help="skip rank_bm25 above this many chunks")
+    lat.add_argument("--analyzer", choices=list(PRESETS), default=None)
+    lat.add_argument("--seed", type=int, default=0)
+
+    cor = sub.add_parser("corpus", help="corpus index add time and search latency against number of documents")
+    cor.add_argument("source", type=Path, help="PDF or text file each synthetic document is grown from")
+    cor.add_argument("--docs", type=int, nargs="+", default=[1, 10, 50, 100])
+    cor.add_argument("--queries", type=int, default=20, help="random queries (besides the agent queries)")
+    cor.add_argument("--k", type=int, default=10)
+    cor.add_argument("--repeat", type=int, default=3)
+    cor.add_argument("--baseline-max", type=int, default=20000, help="skip the rank_bm25 check above this many chunks")
+    cor.add_argument("--analyzer", choices=list(PRESETS), default=None)
+    cor.add_argument("--seed", type=int, default=0)
+
+    rec = sub.add_parser("recall", help="recall@k and prompt tokens of the agent queries per analyzer")
+    rec.add_argument("source", type=Path, help="PDF or text file to index")
+    rec.add_argument("--analyzers", choices=list(PRESETS), nargs="+", help="first one is the baseline (default: simple standard english)")
+    rec.add_argument("--ks", type=int, nargs="+", default=[4, 8, 12, 16, 24])
+    rec.add_argument("--baseline-k", type=int, default=8, help="k the agents retrieve with")
+    rec.add_argument("--max-k", type=int, default=64, help="deepest k searched for the matching-recall column")
+
+    args = ap.parse_args(argv)
+    return {"latency": latency, "corpus": corpus, "recall": recall}[args.cmd](args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,24 @@
+# retrieval/cache.py
+from __future__ import annotations
+import os
+from typing import Any, Callable, List, Tuple
+
+from state.lru import VersionedLRU
+
+# Top-k results per (doc_id, index version, normalized query, k).
+#
+# Agents retrieve with a handful of fixed queries, so the same rankings are
+# asked for on every run against a doc; ingest pre-warms them. The query is
+# keyed by its analyzed tokens, so spacing/case variants share an entry. A
+# re-indexed doc gets a new index version: its entries are dropped when the
+# doc is re-ingested (invalidate) and, for an index re-mapped from another
+# worker's file, on the first lookup that sees the new version.
+
+
+class RetrievalCache(VersionedLRU):
+    def get_or_compute(self, doc_id: Any, version: str, tokens: Tuple[str, ...], k: int, wand: bool,
+                       compute: Callable[[], List[int]]) -> List[int]:
+        return super().get_or_compute(doc_id, version, (tokens, k, wand), compute)
+
+
+RESULTS = RetrievalCache(max_entries=int(os.getenv("RETRIEVAL_CACHE_SIZE", "1024")))
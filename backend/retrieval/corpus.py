@@ -0,0 +1,327 @@
+# retrieval/corpus.py
+from __future__ import annotations
+import html
+import math
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple, Union
+
+import numpy as np
+
+from retrieval.analyzer import Analyzer, get_analyzer
+from retrieval.index import B, EPSILON, K1, Chunk, DocIndex, _stamp
+
+# One BM25 index over every ingested document.
+#
+# Each document stays a segment: its DocIndex (usually the mmap'd file
+# written at ingest), so adding or replacing a doc never rebuilds the others.
+# What makes the segments one index is shared collection statistics: the
+# corpus keeps, per term, the chunk counts of the segments containing it,
+# plus the total chunk count and length, all updated on add/remove. Scores
+# use those (idf over all chunks, length normalization by the corpus avgdl),
+# so they equal rank_bm25.BM25Okapi over the concatenated chunks up to float
+# rounding, and a chunk scores the same whichever filters are applied.
+#
+# Segments are laid out in one chunk id space (each gets the next free range
+# on add; a removed doc leaves a hole until the space is compacted). A query
+# term's postings across all docs are concatenated into that space once and
+# kept in an LRU until a doc containing the term is added or removed, so a
+# search is a few numpy passes over the matching postings with no per-doc
+# Python work: its latency follows the number of matching chunks, not the
+# number of docs. Filtering by doc gathers just those docs' postings; ties
+# keep add order, then chunk order.
+#
+# Other workers write indexes to the same directory; `sync` maps new or
+# rewritten files and drops deleted ones. It only lists the directory when
+# the directory itself changed (files are replaced by rename), so calling it
+# before every search is cheap.
+
+Postings = Tuple[np.ndarray, np.ndarray, np.ndarray]  # chunk ids, tfs, chunk lengths
+
+
+@dataclass
+class Hit:
+    doc_id: str
+    index: int  # chunk position in its document
+    score: float
+    chunk: Chunk
+
+
+def section_matches(section: str, wanted: str) -> bool:
+    """`wanted` is `section` or an ancestor of it: "2.2" matches "2.2.1" and "6.2/2.2.1"; "6.2" matches "6.2/2.2.1"."""
+    if not wanted:
+        return True
+    wanted = wanted.strip().rstrip(".")
+    for s in (section, section.rsplit("/", 1)[-1]):
+        if s == wanted or s.startswith(wanted + ".") or s.startswith(wanted + "/"):
+            return True
+    return False
+
+
+class _Segment:
+    def __init__(self, index: DocIndex, seq: int, stamp: Optional[Tuple[int, int]]):
+        self.index = index
+        self.seq = seq  # add order
+        self.stamp = stamp  # of the file the index came from (None if only in memory)
+        self.base = 0  # first id of its chunks in the corpus id space
+        self.vocab = index.vocabulary()
+        self.tids = {term: i for i, (term, _) in enumerate(self.vocab)}
+        self.length = int(index._doc_len.sum())
+
+    def postings(self, term: str) -> Optional[Postings]:
+        tid = self.tids.get(term)
+        if tid is None:
+            return None
+        docs, tfs = self.index.postings(tid)
+        return docs + self.base, tfs, self.index._doc_len[docs]
+
+    def section_mask(self, wanted: str) -> np.ndarray:
+        names = self.index.sections
+        ok = np.array([section_matches(s, wanted) for s in names], dtype=bool)
+        return ok[self.index.section_codes] if len(names) else np.zeros(len(self.index), dtype=bool)
+
+
+class CorpusIndex:
+    def __init__(self, analyzer: Optional[Analyzer] = None, max_terms: int = 4096):
+        self.analyzer = analyzer or get_analyzer()
+        self.max_terms = max_terms
+        self._lock = threading.Lock()
+        self._segments: Dict[str, _Segment] = {}
+        self._df: Dict[str, Dict[str, int]] = {}  # term -> {doc_id: chunks containing it}
+        self._df_total: Dict[str, int] = {}  # term -> chunks containing it, over all docs
+        self._chunks = 0
+        self._length = 0
+        self._seq = 0
+        self._space = 0  # size of the chunk id space (chunks + holes)
+        self._eps: Optional[float] = None  # idf floor; recomputed after a change
+        self._merged: "OrderedDict[str, Postings]" = OrderedDict()  # term -> postings over all docs
+        self._sections: "OrderedDict[str, np.ndarray]" = OrderedDict()  # section filter -> mask over the id space
+        self._layout: Optional[Tuple[np.ndarray, List[_Segment]]] = None  # (bases, segments) by base
+        self._dir_stamp: Optional[Tuple[int, int]] = None
+
+    # ---- segments ----
+
+    def add(self, index: DocIndex) -> None:
+        """Add or replace the document of `index`; a different analyzer's index is rebuilt from its chunks."""
+        stamp = index.stamp
+        if index.analyzer.spec != self.analyzer.spec:
+            index = DocIndex(index.doc_id, index.chunks, self.analyzer)
+        seg = _Segment(index, 0, stamp)
+        with self._lock:
+            self._remove(index.doc_id)
+            seg.seq, seg.base = self._seq, self._space
+            self._seq += 1
+            self._space += len(index)
+            self._segments[index.doc_id] = seg
+            for term, df in seg.vocab:
+                self._df.setdefault(term, {})[index.doc_id] = df
+                self._df_total[term] = self._df_total.get(term, 0) + df
+                self._merged.pop(term, None)
+            self._chunks += len(index)
+            self._length += seg.length
+            self._changed()
+
+    def remove(self, doc_id: str) -> None:
+        with self._lock:
+            self._remove(doc_id)
+            self._changed()
+
+    def _remove(self, doc_id: str) -> None:
+        seg = self._segments.pop(doc_id, None)
+        if seg is None:
+            return
+        for term, df in seg.vocab:
+            docs = self._df[term]
+            del docs[doc_id]
+            if docs:
+                self._df_total[term] -= df
+            else:
+                del self._df[term]
+                del self._df_total[term]
+            self._merged.pop(term, None)
+        self._chunks -= len(seg.index)
+        self._length -= seg.length
+
+    def _changed(self) -> None:
+        self._eps = None
+        self._sections.clear()
+        self._layout = None
+        if self._space > 2 * self._chunks + 1024:  # mostly holes: renumber in add order
+            self._space = 0
+            for seg in sorted(self._segments.values(), key=lambda s: s.seq):
+                seg.base = self._space
+                self._space += len(seg.index)
+            self._merged.clear()
+
+    def __contains__(self, doc_id: str) -> bool:
+        return doc_id in self._segments
+
+    def __len__(self) -> int:
+        return len(self._segments)
+
+    def sync(self, directory: Union[str, Path]) -> None:
+        """Map new or rewritten `<doc_id>.bm25` files in `directory`; drop file-backed docs whose file is gone."""
+        directory = Path(directory)
+        stamp = _stamp(directory)
+        if stamp is not None and stamp == self._dir_stamp:
+            return
+        seen = set()
+        for path in directory.glob("*.bm25"):
+            seen.add(path.stem)
+            seg = self._segments.get(path.stem)
+            if seg is not None and seg.stamp == _stamp(path):
+                continue
+            try:
+                self.add(DocIndex.open(path))
+            except (OSError, ValueError):
+                continue
+        for doc_id, seg in list(self._segments.items()):
+            if doc_id not in seen and seg.stamp is not None:
+                self.remove(doc_id)
+        self._dir_stamp = stamp
+
+    # ---- lazily built views (callers hold the lock) ----
+
+    def _idf(self, term: str) -> float:
+        df, n = self._df_total[term], self._chunks
+        if self._eps is None:
+            dfs = np.fromiter(self._df_total.values(), dtype=np.float64, count=len(self._df_total))
+            self._eps = EPSILON * float(np.mean(np.log(n - dfs + 0.5) - np.log(dfs + 0.5))) if len(dfs) else 0.0
+        v = math.log(n - df + 0.5) - math.log(df + 0.5)
+        return self._eps if v < 0 else v
+
+    def _term_postings(self, term: str) -> Postings:
+        hit = self._merged.get(term)
+        if hit is not None:
+            self._merged.move_to_end(term)
+            return hit
+        parts = [self._segments[d].postings(term) for d in self._df[term]]
+        merged = tuple(np.concatenate(a) for a in zip(*parts))
+        if self.max_terms > 0:
+            self._merged[term] = merged
+            while len(self._merged) > self.max_terms:
+                self._merged.popitem(last=False)
+        return merged
+
+    def _section_mask(self, wanted: str) -> np.ndarray:
+        mask = self._sections.get(wanted)
+        if mask is None:
+            mask = np.zeros(self._space, dtype=bool)
+            for seg in self._segments.values():
+                mask[seg.base:seg.base + len(seg.index)] = seg.section_mask(wanted)
+            self._sections[wanted] = mask
+            while len(self._sections) > 64:
+                self._sections.popitem(last=False)
+        return mask
+
+    def _bases(self) -> Tuple[np.ndarray, List[_Segment]]:
+        if self._layout is None:
+            segs = sorted(self._segments.values(), key=lambda s: s.base)
+            self._layout = (np.array([s.base for s in segs], dtype=np.int64), segs)
+        return self._layout
+
+    # ---- search ----
+
+    def search(self, query: str, offset: int = 0, limit: int = 10, doc_ids: Optional[Iterable[str]] = None,
+               section: Optional[str] = None) -> Tuple[int, List[Hit]]:
+        """(number of matching chunks, hits offset..offset+limit by score) over the filtered docs/sections."""
+        tokens = self.analyzer(query)
+        with self._lock:
+            terms = [t for t in tokens if t in self._df_total]
+            idf = {t: self._idf(t) for t in terms}
+            avgdl = self._length / self._chunks if self._chunks else 0.0
+            if doc_ids:
+                segs = [self._segments[d] for d in dict.fromkeys(doc_ids) if d in self._segments]
+                postings = [[p for p in (s.postings(t) for s in segs) if p is not None] for t in terms]
+                postings = [tuple(np.concatenate(a) for a in zip(*ps)) if ps else None for ps in postings]
+            else:
+                postings = [self._term_postings(t) for t in terms]
+            mask = self._section_mask(section) if section else None
+            bases, order = self._bases()
+            space = self._space
+
+        # Same per-chunk summation order as rank_bm25: query terms in order, duplicates again.
+        parts = [(p[0], idf[t] * (p[1] * (K1 + 1) / (p[1] + K1 * (1 - B + B * p[2] / avgdl))))
+                 for t, p in zip(terms, postings) if p is not None]
+        if sum(len(ids) for ids, _ in parts) * 16 < space:
+            # Few postings (a doc filter, rare terms): sum per distinct chunk instead of over the id space.
+            ids, inverse = np.unique(np.concatenate([ids for ids, _ in parts] or [np.zeros(0, np.int64)]), return_inverse=True)
+            scores = np.bincount(inverse, weights=np.concatenate([c for _, c in parts] or [np.zeros(0)]), minlength=len(ids))
+            if mask is not None:
+                ids, scores = ids[mask[ids]], scores[mask[ids]]
+            top = scores
+        else:
+            scores = np.zeros(space)
+            matched = np.zeros(space, dtype=bool)
+            for ids, contrib in parts:
+                scores[ids] += contrib
+                matched[ids] = True
+            if mask is not None:
+                matched &= mask
+            ids = np.flatnonzero(matched)
+            top = scores[ids]
+        total = len(ids)
+        depth = min(offset + limit, total)
+        if depth <= offset:
+            return total, []
+        if depth < len(ids):
+            keep = np.argpartition(-top, depth - 1)[:depth]
+            ids, top = ids[keep], top[keep]
+        ranked = np.lexsort((ids, -top))[offset:depth]
+        hits = []
+        for gid, score in zip(ids[ranked].tolist(), top[ranked].tolist()):
+            seg = order[int(np.searchsorted(bases, gid, side="right")) - 1]
+            hits.append(Hit(seg.index.doc_id, gid - seg.base, score, seg.index.chunk(gid - seg.base)))
+        return total, hits
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "docs": len(self._segments),
+                "chunks": self._chunks,
+                "terms": len(self._df_total),
+                "avgdl": round(self._length / self._chunks, 2) if self._chunks else 0.0,
+                "id_space": self._space,
+                "cached_terms": len(self._merged),
+                "analyzer": self.analyzer.name,
+            }
+
+
+def snippet(text: str, terms: Iterable[str], analyzer: Analyzer, width: int = 200) -> str:
+    """HTML-escaped window of about `width` chars around the densest query matches, matches in <mark>."""
+    wanted = set(terms)
+    hits = [(s, e) for s, e, toks in analyzer.spans(text) if wanted.intersection(toks)]
+    if not hits:
+        start, end = 0, min(len(text), width)
+    else:
+        # Window starting just before the hit that has the most hits within `width` after it.
+        best, count = 0, 0
+        j = 0
+        for i, (s, _) in enumerate(hits):
+            while j < len(hits) and hits[j][1] - s <= width:
+                j += 1
+            if j - i > count:
+                best, count = i, j - i
+        lead = min(width // 5, hits[best][0])
+        start = hits[best][0] - lead
+        end = min(len(text), start + width)
+        start = max(0, end - width)
+        if start > 0:
+            space = text.rfind(" ", max(0, start - 20), hits[best][0])
+            start = space + 1 if space >= 0 else start
+        if end < len(text):
+            space = text.find(" ", end, end + 20)
+            end = space if space >= 0 else end
+    out = ["…" if start > 0 else ""]
+    pos = start
+    for s, e in hits:
+        if s < start or e > end:
+            continue
+        out.append(html.escape(text[pos:s]))
+        out.append("<mark>" + html.escape(text[s:e]) + "</mark>")
+        pos = e
+    out.append(html.escape(text[pos:end]))
+    out.append("…" if end < len(text) else "")
+    return " ".join("".join(out).split())
@@ -1,8 +1,50 @@
 # retrieval/index.py
 from __future__ import annotations
-from typing import List, Dict, Any
+import heapq
+import json
+import math
+import mmap
+import os
+import re
+import struct
+import threading
+from pathlib import Path
+from typing import List, Dict, Any, Optional, Tuple, Union
 from dataclasses import dataclass
-from rank_bm25 import BM25Okapi
+from uuid import uuid4
+
+import numpy as np
+
+from retrieval.analyzer import Analyzer, get_analyzer
+from retrieval.cache import RESULTS
+
+# BM25 index in a flat, memory-mappable file.
+#
+#   magic (8 bytes) | header length (u64) | JSON header | sections...
+#
+# The header holds a build id (the index version retrieval caches key on),
+# the BM25 parameters, avgdl and {section: [offset, dtype,
+# count]}; every section is a little-endian array aligned to 8 bytes:
+# chunk texts/ids (utf-8 blobs + offsets), pages, char offsets, sections
+# (names blob + offsets, per-chunk codes), doc lengths,
+# the vocabulary (utf-8 sorted, + offsets) with its idf, and postings (doc
+# ids and term frequencies, + per-term offsets). An index built in memory is
+# serialized into the same layout, so built and opened indexes share one
+# code path; an opened one is a read-only mmap, so every worker process maps
+# the same page-cache pages and opening it costs no parsing.
+#
+# Terms come from the index's analyzer (retrieval/analyzer.py; its spec is
+# in the header, so queries are analyzed the same way). Scores are those of
+# rank_bm25.BM25Okapi (k1=1.5, b=0.75, epsilon=0.25) over the same tokens. A query only walks the postings of its terms into a
+# per-thread score buffer and selects the top k with argpartition; ties keep
+# document order, as the stable sort this replaces did. `wand=True` instead
+# runs document-at-a-time WAND over the postings, skipping documents whose
+# per-term score upper bounds ("term_max") cannot beat the current k-th
+# score; it falls back to the exhaustive path whenever the bounds do not
+# apply (negative idf, fewer than k matching documents).
+
+MAGIC = b"BM25IDX1"
+K1, B, EPSILON = 1.5, 0.75, 0.25
 
 @dataclass
 class Chunk:
@@ -10,39 +52,399 @@ class Chunk:
     text: str
     page: int
     offset: int
+    section: str = ""  # heading number it falls under, e.g. "2.2.1" or "6.2/2.2.1" inside "Sub-Module 6.2"
+
+
+def _blob(strings: List[str]) -> Tuple[bytes, np.ndarray]:
+    encoded = [s.encode("utf-8") for s in strings]
+    offsets = np.zeros(len(encoded) + 1, dtype="<i8")
+    np.cumsum([len(e) for e in encoded], out=offsets[1:])
+    return b"".join(encoded), offsets
+
+
+def _term_max(idf: np.ndarray, post_offsets: np.ndarray, docs: np.ndarray, tfs: np.ndarray, norm: np.ndarray) -> np.ndarray:
+    """Per term, the largest score contribution of one occurrence of it in a query (WAND upper bounds)."""
+    if len(idf) == 0:
+        return np.zeros(0)
+    contrib = np.repeat(idf, np.diff(post_offsets)) * (tfs * (K1 + 1) / (tfs + norm[docs]))
+    return np.maximum.reduceat(contrib, post_offsets[:-1])
+
+
+def build_index(doc_id: str, chunks: List[Chunk], analyzer: Analyzer) -> bytes:
+    """Serialize `chunks` and their BM25 statistics into the on-disk layout."""
+    tokenized = [analyzer(c.text) for c in chunks]
+    n = len(chunks)
+    doc_len = np.array([len(t) for t in tokenized], dtype="<i4")
+
+    # term -> ([doc ids], [tfs]) in first-occurrence order, as rank_bm25 sees them
+    postings: Dict[str, Tuple[List[int], List[int]]] = {}
+    for d, toks in enumerate(tokenized):
+        freqs: Dict[str, int] = {}
+        for t in toks:
+            freqs[t] = freqs.get(t, 0) + 1
+        for t, tf in freqs.items():
+            docs, tfs = postings.setdefault(t, ([], []))
+            docs.append(d)
+            tfs.append(tf)
+
+    # BM25Okapi idf, floored at epsilon * average idf (summed in the same order).
+    idf: Dict[str, float] = {}
+    idf_sum = 0.0
+    negative = []
+    for t, (docs, _) in postings.items():
+        v = math.log(n - len(docs) + 0.5) - math.log(len(docs) + 0.5)
+        idf[t] = v
+        idf_sum += v
+        if v < 0:
+            negative.append(t)
+    if idf:
+        eps = EPSILON * (idf_sum / len(idf))
+        for t in negative:
+            idf[t] = eps
+
+    terms = sorted(postings, key=lambda t: t.encode("utf-8"))
+    norm = K1 * (1 - B + B * doc_len / (int(doc_len.sum()) / n)) if n else np.zeros(0)
+    term_blob, term_offsets = _blob(terms)
+    text_blob, text_offsets = _blob([c.text for c in chunks])
+    id_blob, id_offsets = _blob([c.id for c in chunks])
+    section_names = sorted({c.section for c in chunks})
+    section_blob, section_offsets = _blob(section_names)
+    section_code = {name: i for i, name in enumerate(section_names)}
+    post_offsets = np.zeros(len(terms) + 1, dtype="<i8")
+    np.cumsum([len(postings[t][0]) for t in terms], out=post_offsets[1:])
+
+    sections: Dict[str, np.ndarray] = {
+        "text": np.frombuffer(text_blob, dtype=np.uint8),
+        "text_offsets": text_offsets,
+        "ids": np.frombuffer(id_blob, dtype=np.uint8),
+        "id_offsets": id_offsets,
+        "pages": np.array([c.page for c in chunks], dtype="<i4"),
+        "offsets": np.array([c.offset for c in chunks], dtype="<i8"),
+        "section_names": np.frombuffer(section_blob, dtype=np.uint8),
+        "section_name_offsets": section_offsets,
+        "section_codes": np.array([section_code[c.section] for c in chunks], dtype="<i4"),
+        "doc_len": doc_len,
+        "terms": np.frombuffer(term_blob, dtype=np.uint8),
+        "term_offsets": term_offsets,
+        "idf": np.array([idf[t] for t in terms], dtype="<f8"),
+        "term_max": np.zeros(0),
+        "post_offsets": post_offsets,
+        "post_docs": np.array([d for t in terms for d in postings[t][0]], dtype="<i4"),
+        "post_tfs": np.array([f for t in terms for f in postings[t][1]], dtype="<i4"),
+    }
+    sections["term_max"] = _term_max(sections["idf"], post_offsets, sections["post_docs"], sections["post_tfs"], norm).astype("<f8")
+    header: Dict[str, Any] = {
+        "doc_id": doc_id,
+        "build": uuid4().hex,
+        "analyzer": analyzer.spec,
+        "chunks": n,
+        "terms": len(terms),
+        "k1": K1, "b": B, "epsilon": EPSILON,
+        "avgdl": (int(doc_len.sum()) / n) if n else 0.0,
+        "sections": {},
+    }
+
+    # Section offsets depend on the header length, so lay out twice.
+    def layout(start: int) -> int:
+        pos = start
+        for name, arr in sections.items():
+            pos = (pos + 7) & ~7
+            header["sections"][name] = [pos, arr.dtype.str, int(arr.size)]
+            pos += arr.nbytes
+        return pos
+
+    head_len = 0
+    while True:
+        start = (len(MAGIC) + 8 + head_len + 7) & ~7
+        layout(start)
+        encoded = json.dumps(header, separators=(",", ":")).encode("utf-8")
+        if len(encoded) <= head_len:
+            break
+        head_len = len(encoded) + 64
+
+    out = bytearray(layout(start))
+    out[:len(MAGIC)] = MAGIC
+    out[len(MAGIC):len(MAGIC) + 8] = struct.pack("<Q", head_len)
+    out[len(MAGIC) + 8:len(MAGIC) + 8 + len(encoded)] = encoded
+    out[len(MAGIC) + 8 + len(encoded):start] = b" " * (start - len(MAGIC) - 8 - len(encoded))
+    for name, arr in sections.items():
+        pos = header["sections"][name][0]
+        out[pos:pos + arr.nbytes] = arr.tobytes()
+    return bytes(out)
+
+
+def _stamp(path: Union[str, Path]) -> Optional[Tuple[int, int]]:
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_ino, st.st_mtime_ns
+
 
 class DocIndex:
-    def __init__(self, doc_id: str, chunks: List[Chunk]):
-        self.doc_id = doc_id
-        self.chunks = chunks
-        # simple tokenization; you can swap for spaCy/regex improvements later
-        tokenized = [c.text.lower().split() for c in chunks]
-        self.bm25 = BM25Okapi(tokenized)
-        self._tokenized = tokenized
-
-    def top_k(self, query: str, k: int = 8) -> List[Chunk]:
-        scores = self.bm25.get_scores(query.lower().split())
-        # take top k indices
-        idxs = sorted(range(len(scores)), key=lambda i: scores[i], reverse=True)[:k]
-        return [self.chunks[i] for i in idxs]
+    def __init__(self, doc_id: str, chunks: List[Chunk], analyzer: Optional[Analyzer] = None):
+        self._attach(build_index(doc_id, chunks, analyzer or get_analyzer()))
+        self._chunks: Optional[List[Chunk]] = list(chunks)
+        self.stamp: Optional[Tuple[int, int]] = None  # (inode, mtime) of the file this index was opened from / saved to
+
+    @classmethod
+    def open(cls, path: Union[str, Path]) -> "DocIndex":
+        """Map an index written by `save`; raises ValueError if it is not one."""
+        with open(path, "rb") as f:
+            buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        index = cls.__new__(cls)
+        index._attach(buf)
+        index._chunks = None
+        index.stamp = _stamp(path)
+        return index
+
+    def _attach(self, buf: Union[bytes, mmap.mmap]) -> None:
+        if len(buf) < len(MAGIC) + 8 or buf[:len(MAGIC)] != MAGIC:
+            raise ValueError("not a BM25 index file")
+        (head_len,) = struct.unpack("<Q", buf[len(MAGIC):len(MAGIC) + 8])
+        header = json.loads(bytes(buf[len(MAGIC) + 8:len(MAGIC) + 8 + head_len]))
+        self._buf = buf
+        self.header = header
+        self.doc_id: str = header["doc_id"]
+        self.version: str = header.get("build") or uuid4().hex
+        self.analyzer = get_analyzer(header.get("analyzer") or "simple")
+        self.k1, self.b = header["k1"], header["b"]
+        self.avgdl: float = header["avgdl"]
+        for name, (pos, dtype, count) in header["sections"].items():
+            setattr(self, "_" + name, np.frombuffer(buf, dtype=np.dtype(dtype), count=count, offset=pos))
+        # Per-doc length normalization, computed as rank_bm25 does.
+        self._norm = self.k1 * (1 - self.b + self.b * self._doc_len / self.avgdl) if len(self._doc_len) else np.zeros(0)
+        if "section_codes" not in header["sections"]:  # written before sections were stored
+            self._section_names = np.zeros(0, dtype=np.uint8)
+            self._section_name_offsets = np.zeros(2, dtype=np.int64)
+            self._section_codes = np.zeros(len(self._doc_len), dtype=np.int32)
+        if "term_max" not in header["sections"]:  # written before WAND bounds were stored
+            self._term_max = _term_max(self._idf, self._post_offsets, self._post_docs, self._post_tfs, self._norm)
+        self._section_list: Optional[List[str]] = None
+        self._local = threading.local()
+
+    def save(self, path: Union[str, Path]) -> None:
+        """Write the index atomically (readers that mapped the old file keep it)."""
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+        with open(tmp, "wb") as f:
+            f.write(self._buf)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+        self.stamp = _stamp(path)
+
+    def stale(self, path: Union[str, Path]) -> bool:
+        """True if `path` was rewritten (e.g. by another worker) since this index was opened or saved."""
+        if self.stamp is None:
+            return False
+        current = _stamp(path)
+        return current is not None and current != self.stamp
+
+    def __len__(self) -> int:
+        return len(self._doc_len)
+
+    # ---- vocabulary / postings ----
+
+    def _term(self, i: int) -> bytes:
+        base = self.header["sections"]["terms"][0]
+        return self._buf[base + int(self._term_offsets[i]):base + int(self._term_offsets[i + 1])]
+
+    def term_id(self, term: str) -> int:
+        """Index of `term` in the sorted vocabulary, or -1."""
+        key = term.encode("utf-8")
+        lo, hi = 0, len(self._idf)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._term(mid) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo if lo < len(self._idf) and self._term(lo) == key else -1
+
+    def vocabulary(self) -> List[Tuple[str, int]]:
+        """(term, number of chunks containing it) for every term, in sorted order."""
+        base = self.header["sections"]["terms"][0]
+        offs = self._term_offsets.tolist()
+        dfs = np.diff(self._post_offsets).tolist()
+        return [(self._buf[base + offs[i]:base + offs[i + 1]].decode("utf-8"), dfs[i]) for i in range(len(dfs))]
+
+    @property
+    def sections(self) -> List[str]:
+        """Distinct section names; chunk i is in sections[section_codes[i]]."""
+        if self._section_list is None:
+            offs = self._section_name_offsets.tolist()
+            self._section_list = [self._section_names[offs[i]:offs[i + 1]].tobytes().decode("utf-8") for i in range(len(offs) - 1)]
+        return self._section_list
+
+    @property
+    def section_codes(self) -> np.ndarray:
+        return self._section_codes
+
+    def postings(self, tid: int) -> Tuple[np.ndarray, np.ndarray]:
+        a, b = int(self._post_offsets[tid]), int(self._post_offsets[tid + 1])
+        return self._post_docs[a:b], self._post_tfs[a:b]
+
+    def _query(self, tokens: List[str]) -> List[int]:
+        """Term ids of the query tokens in the vocabulary, in query order (duplicates kept)."""
+        return [tid for tid in map(self.term_id, tokens) if tid >= 0]
+
+    def _accumulate(self, tids: List[int]) -> np.ndarray:
+        """Scores of every chunk in this thread's reusable buffer (valid until the next query)."""
+        scores = getattr(self._local, "scores", None)
+        if scores is None:
+            scores = self._local.scores = np.zeros(len(self))
+        else:
+            scores.fill(0.0)
+        for tid in tids:
+            docs, tfs = self.postings(tid)
+            scores[docs] += self._idf[tid] * (tfs * (self.k1 + 1) / (tfs + self._norm[docs]))
+        return scores
+
+    def get_scores(self, tokens: List[str]) -> np.ndarray:
+        """BM25 score of every chunk for the query tokens (duplicates count again, as in rank_bm25)."""
+        return self._accumulate(self._query(tokens)).copy()
+
+    def top_indices(self, tokens: List[str], k: int = 8, wand: bool = False) -> List[int]:
+        """Indices of the k best-scoring chunks, best first; equal scores keep document order."""
+        n = len(self)
+        k = min(k, n)
+        if k <= 0:
+            return []
+        tids = self._query(tokens)
+        if wand and tids:
+            found = self._wand(tids, k)
+            if found is not None:
+                return found
+        scores = self._accumulate(tids)
+        if k == n:
+            return np.argsort(-scores, kind="stable").tolist()
+        kth = scores[np.argpartition(-scores, k - 1)[k - 1]]
+        above = np.flatnonzero(scores > kth)
+        ties = np.flatnonzero(scores == kth)[:k - len(above)]
+        idx = np.concatenate([above, ties])
+        return idx[np.lexsort((idx, -scores[idx]))].tolist()
+
+    def _wand(self, tids: List[int], k: int) -> Optional[List[int]]:
+        """Top k by WAND, or None if its bounds do not apply to this query."""
+        if any(self._idf[t] < 0 for t in tids):
+            return None
+        mult: Dict[int, int] = {}
+        for t in tids:
+            mult[t] = mult.get(t, 0) + 1
+        # [current position, posting doc ids, tfs, upper bound, term id]
+        cursors = []
+        for t, m in mult.items():
+            docs, tfs = self.postings(t)
+            if len(docs):
+                cursors.append([0, docs, tfs, m * float(self._term_max[t]), t])
+        idf, norm, k1 = self._idf, self._norm, self.k1
+        heap: List[Tuple[float, int]] = []  # (score, -doc): the root is the current k-th best
+        theta = -math.inf
+        while cursors:
+            cursors.sort(key=lambda c: c[1][c[0]])
+            # Pivot: first cursor at which the summed upper bounds could beat theta.
+            # Later docs lose ties to the ones already kept, so equal is not enough;
+            # the slack covers rounding between the bounds and the exact sum.
+            acc, pivot = 0.0, -1
+            for i, c in enumerate(cursors):
+                acc += c[3]
+                if acc * (1 + 1e-9) + 1e-12 > theta:
+                    pivot = i
+                    break
+            if pivot < 0:
+                break
+            d = int(cursors[pivot][1][cursors[pivot][0]])
+            if int(cursors[0][1][cursors[0][0]]) == d:
+                tf_at = {}
+                for c in cursors:
+                    if c[1][c[0]] != d:
+                        break
+                    tf_at[c[4]] = int(c[2][c[0]])
+                    c[0] += 1
+                score = 0.0
+                for t in tids:  # same terms, same order as _accumulate
+                    if t in tf_at:
+                        tf = tf_at[t]
+                        score += float(idf[t] * (tf * (k1 + 1) / (tf + norm[d])))
+                if len(heap) < k:
+                    heapq.heappush(heap, (score, -d))
+                elif (score, -d) > heap[0]:
+                    heapq.heapreplace(heap, (score, -d))
+                if len(heap) == k:
+                    theta = heap[0][0]
+            else:
+                for c in cursors[:pivot]:
+                    c[0] += int(np.searchsorted(c[1][c[0]:], d))
+            cursors = [c for c in cursors if c[0] < len(c[1])]
+        if len(heap) < k or heap[0][0] <= 0:
+            return None  # zero-score chunks would fill the rest in document order
+        return [-nd for _, nd in sorted(heap, key=lambda e: (-e[0], -e[1]))]
+
+    # ---- chunks ----
+
+    def chunk(self, i: int) -> Chunk:
+        if self._chunks is not None:
+            return self._chunks[i]
+        ts, te = int(self._text_offsets[i]), int(self._text_offsets[i + 1])
+        is_, ie = int(self._id_offsets[i]), int(self._id_offsets[i + 1])
+        return Chunk(
+            id=self._ids[is_:ie].tobytes().decode("utf-8"),
+            text=self._text[ts:te].tobytes().decode("utf-8"),
+            page=int(self._pages[i]),
+            offset=int(self._offsets[i]),
+            section=self.sections[int(self._section_codes[i])],
+        )
+
+    @property
+    def chunks(self) -> List[Chunk]:
+        if self._chunks is None:
+            self._chunks = [self.chunk(i) for i in range(len(self))]
+        return self._chunks
+
+    def top_k(self, query: str, k: int = 8, wand: bool = False) -> List[Chunk]:
+        tokens = tuple(self.analyzer(query))
+        idxs = RESULTS.get_or_compute(self.doc_id, self.version, tokens, k, wand, lambda: self.top_indices(list(tokens), k, wand))
+        return [self.chunk(i) for i in idxs]
+
+    def prewarm(self, queries: List[str], k: int = 8) -> None:
+        """Rank `queries` now so later top_k calls for them are cache hits."""
+        for q in queries:
+            self.top_k(q, k)
 
     def all_chunks(self) -> List[Chunk]:
         """Return all chunks in document order."""
         return list(self.chunks)
 
+_PART = re.compile(r"^(?:sub-?module|module|part|chapter|appendix)\s+(\d+(?:\.\d+)*|[a-z])\b", re.IGNORECASE)
+_HEADING = re.compile(r"^(\d{1,3}(?:\.\d{1,3})*)\.?(?:\s|$)")
+
+
 def chunk_text_to_paragraphs(text: str, page_map: List[int]) -> List[Chunk]:
     """
     text: full document text
     page_map: list mapping character offsets to page numbers (optional).
               If you don’t have page offsets, set page=1 for all.
+    A chunk's section is the last numbered heading ("2.2", "2.2.1.") that
+    started a chunk, prefixed by the enclosing "Sub-Module 6.2"/"Part 3"/...
     """
     chunks: List[Chunk] = []
     start = 0
+    part, section = "", ""
     for i, block in enumerate([b for b in text.split("\n\n") if b.strip()]):
         t = block.strip()
         page = 1
         if page_map and start < len(page_map):
             page = page_map[min(start, len(page_map)-1)]
-        chunks.append(Chunk(id=f"chunk_{i}", text=t, page=page, offset=start))
+        m = _PART.match(t)
+        if m:
+            part, section = m.group(1), ""
+        else:
+            m = _HEADING.match(t)
+            if m:
+                section = m.group(1)
+        label = f"{part}/{section}" if part and section else (section or part)
+        chunks.append(Chunk(id=f"chunk_{i}", text=t, page=page, offset=start, section=label))
         start += len(block) + 2
     return chunks
@@ -0,0 +1,149 @@
+# state/coalesce.py
+from __future__ import annotations
+import asyncio
+import time
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional, Tuple
+
+Ops = List[Dict[str, Any]]
+
+
+def _is_array_slot(path: str) -> bool:
+    last = path.rsplit("/", 1)[-1]
+    return last == "-" or last.isdigit()
+
+
+def _related(a: Optional[str], b: str) -> bool:
+    if not isinstance(a, str):
+        return False
+    return a == b or a.startswith(b + "/") or b.startswith(a + "/")
+
+
+def merge_ops(ops: Ops) -> Ops:
+    """
+    Collapse repeated writes to the same path, last write wins. An earlier
+    add/replace is dropped only if no op in between touches the same path,
+    one of its ancestors or descendants; array inserts are never merged.
+    """
+    out: Ops = []
+    for op in ops:
+        path = op.get("path", "")
+        if op.get("op") in ("add", "replace") and not _is_array_slot(path):
+            for k in range(len(out) - 1, -1, -1):
+                prev = out[k]
+                if prev.get("path") == path and prev.get("op") in ("add", "replace"):
+                    if prev.get("op") == "add":
+                        op = dict(op, op="add")
+                    del out[k]
+                    break
+                if _related(prev.get("path"), path) or _related(prev.get("from"), path):
+                    break
+        out.append(op)
+    return out
+
+
+def controls_panel(ops: Ops) -> Optional[str]:
+    """Panel id if every op is an add/replace under one panel's /controls, else None."""
+    panel: Optional[str] = None
+    for op in ops:
+        parts = (op.get("path") or "").split("/")
+        if op.get("op") not in ("add", "replace") or len(parts) < 5:
+            return None
+        if parts[1] != "panel_configs" or parts[3] != "controls":
+            return None
+        if panel is not None and parts[2] != panel:
+            return None
+        panel = parts[2]
+    return panel
+
+
+class _Window:
+    def __init__(self, target: Any):
+        self.target = target
+        self.batches: List[Tuple[Ops, Optional[Dict[str, Any]], asyncio.Future]] = []
+        self.n_ops = 0
+        self.first = self.last = time.monotonic()
+        self.task: Optional[asyncio.Task] = None
+
+
+class PatchCoalescer:
+    """
+    Buffers patch requests per key (e.g. session + panel) and commits them as
+    one merged batch once no new ops have arrived for `window` seconds, at
+    most `max_delay` seconds after the first one, or as soon as `max_ops`
+    ops are pending. Every caller receives the merged batch's result. If the
+    merged batch is rejected, the batches are re-applied one at a time so
+    each caller gets its own outcome.
+
+    `apply(target, ops, audits)` does the actual commit and returns its result
+    as a (status_code, content) pair; `audits` holds the `audit` each caller
+    submitted with its ops (who made the edit), one per batch in the commit.
+    """
+
+    def __init__(
+        self,
+        apply: Callable[[Any, Ops, List[Optional[Dict[str, Any]]]], Awaitable[Tuple[int, Dict[str, Any]]]],
+        window: float = 0.05,
+        max_delay: float = 0.25,
+        max_ops: int = 256,
+    ):
+        self.apply = apply
+        self.window = window
+        self.max_delay = max(max_delay, window)
+        self.max_ops = max_ops
+        self.windows: Dict[Hashable, _Window] = {}
+
+    async def submit(self, key: Hashable, target: Any, ops: Ops, audit: Optional[Dict[str, Any]] = None) -> Tuple[int, Dict[str, Any]]:
+        w = self.windows.get(key)
+        if w is None:
+            w = self.windows[key] = _Window(target)
+        fut = asyncio.get_running_loop().create_future()
+        w.batches.append((ops, audit, fut))
+        w.n_ops += len(ops)
+        w.last = time.monotonic()
+        if w.n_ops >= self.max_ops:
+            if w.task is not None:
+                w.task.cancel()
+            w.task = asyncio.create_task(self._flush(key, w))
+        elif w.task is None:
+            w.task = asyncio.create_task(self._timer(key, w))
+        return await fut
+
+    async def flush_matching(self, match: Callable[[Hashable], bool]) -> None:
+        """Commit pending windows whose key matches now (keeps ordering with direct patches)."""
+        for key, w in list(self.windows.items()):
+            if match(key):
+                if w.task is not None:
+                    w.task.cancel()
+                await self._flush(key, w)
+
+    async def _timer(self, key: Hashable, w: _Window) -> None:
+        while True:
+            deadline = min(w.last + self.window, w.first + self.max_delay)
+            delay = deadline - time.monotonic()
+            if delay <= 0:
+                break
+            await asyncio.sleep(delay)
+        await self._flush(key, w)
+
+    async def _flush(self, key: Hashable, w: _Window) -> None:
+        if self.windows.get(key) is not w:
+            return
+        del self.windows[key]
+
+        merged = merge_ops([op for ops, _, _ in w.batches for op in ops])
+        try:
+            status, content = await self.apply(w.target, merged, [audit for _, audit, _ in w.batches])
+            if status != 200 and len(w.batches) > 1:
+                for ops, audit, fut in w.batches:
+                    res = await self.apply(w.target, ops, [audit])
+                    if not fut.done():
+                        fut.set_result(res)
+                return
+            content = dict(content, coalesced=len(w.batches))
+            for _, _, fut in w.batches:
+                if not fut.done():
+                    fut.set_result((status, content))
+        except Exception as e:
+            for _, _, fut in w.batches:
+                if not fut.done():
+                    fut.set_exception(e)
@@ -0,0 +1,210 @@
+# state/derived.py
+from __future__ import annotations
+import json
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+from jsonpointer import JsonPointer
+
+from state.patching import assign, diff, set_in
+
+Ops = List[Dict[str, Any]]
+
+# Declarative derived state.
+#
+# Each Node names the state paths it reads (`inputs`), the other nodes whose
+# results it needs (`deps`), the context keys it depends on (doc id, facts
+# version, ...) and how to turn its result into state writes (`outputs`).
+# A node is recomputed only when an applied op touches one of its inputs or
+# one of its deps was recomputed; results are memoized by a fingerprint of
+# their inputs so flipping a control back to an earlier value is a cache hit.
+#
+# Panel nodes are templates: "{panel}" in a path is bound to every panel id
+# in /panel_configs whose `type` equals the node's `panel_type`.
+
+PANEL = "{panel}"
+_MISSING = object()
+
+
+def _related(a: Optional[str], b: str) -> bool:
+    """True if pointer `a` is `b`, an ancestor of it or a descendant of it."""
+    if not isinstance(a, str):
+        return False
+    return a == b or a.startswith(b + "/") or b.startswith(a + "/")
+
+
+def _lookup(root: Any, path: str) -> Any:
+    node = root
+    for part in JsonPointer(path).parts:
+        if isinstance(node, dict) and part in node:
+            node = node[part]
+        elif isinstance(node, list) and part.isdigit() and int(part) < len(node):
+            node = node[int(part)]
+        else:
+            return _MISSING
+    return node
+
+
+def _bind(path: str, panel_id: Optional[str]) -> str:
+    if panel_id is None:
+        return path
+    return path.replace(PANEL, JsonPointer.from_parts([panel_id]).path[1:])
+
+
+class Node:
+    def __init__(
+        self,
+        name: str,
+        compute: Callable[..., Any],
+        inputs: Sequence[str] = (),
+        deps: Sequence[str] = (),
+        context: Sequence[str] = (),
+        outputs: Optional[Callable[[Any], Dict[str, Any]]] = None,
+        panel_type: Optional[str] = None,
+        memo: bool = True,
+    ):
+        """
+        `compute(ctx, *input_values, *dep_results)` returns the node's result;
+        missing inputs are passed as None. `outputs(result)` maps it to
+        {pointer: value} writes ("{panel}" is bound for panel nodes).
+        `memo=False` skips the memo (and fingerprinting the inputs) for nodes
+        that are cheaper to recompute, e.g. ones that are incremental themselves.
+        """
+        self.name = name
+        self.compute = compute
+        self.inputs = tuple(inputs)
+        self.deps = tuple(deps)
+        self.context = tuple(context)
+        self.outputs = outputs
+        self.panel_type = panel_type
+        self.memo = memo
+
+
+class DerivedGraph:
+    def __init__(self, memo_size: int = 512):
+        self.nodes: Dict[str, Node] = {}
+        self.order: List[str] = []
+        self.memo_size = memo_size
+        self._memo: "OrderedDict[Tuple[str, Optional[str], str], Any]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def register(self, node: Node) -> Node:
+        for d in node.deps:
+            if d not in self.nodes:
+                raise ValueError(f"Node '{node.name}' depends on unknown node '{d}'")
+        if node.deps and node.panel_type is not None:
+            raise ValueError(f"Panel node '{node.name}' cannot have deps")
+        self.nodes[node.name] = node
+        self.order.append(node.name)
+        return node
+
+    def clear(self) -> None:
+        """Drop memoized results (call when something outside `context` changes, e.g. a policy reload)."""
+        self._memo.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        return {"nodes": len(self.nodes), "memo": len(self._memo), "hits": self.hits, "misses": self.misses}
+
+    # ---- evaluation ----
+
+    def _panels_for(self, state: Dict[str, Any], ops: Ops, panel_type: str) -> Iterable[str]:
+        configs = state.get("panel_configs") or {}
+        touched_all = False
+        ids = set()
+        for op in ops:
+            for p in (op.get("path"), op.get("from")):
+                if not isinstance(p, str):
+                    continue
+                if _related(p, "/panel_configs") and not p.startswith("/panel_configs/"):
+                    touched_all = True
+                elif p.startswith("/panel_configs/"):
+                    ids.add(JsonPointer(p).parts[1])
+        candidates = configs.keys() if touched_all else ids
+        return [pid for pid in candidates if (configs.get(pid) or {}).get("type") == panel_type]
+
+    def _dirty(self, node: Node, panel_id: Optional[str], ops: Ops, dirty: Set[str]) -> bool:
+        if any(d in dirty for d in node.deps):
+            return True
+        paths = [_bind(i, panel_id) for i in node.inputs]
+        for op in ops:
+            for p in (op.get("path"), op.get("from")):
+                if any(_related(p, ip) for ip in paths):
+                    return True
+        return False
+
+    def _result(self, node: Node, panel_id: Optional[str], state: Dict[str, Any],
+                ctx: Dict[str, Any], results: Dict[str, Any]) -> Any:
+        values = []
+        for i in node.inputs:
+            v = _lookup(state, _bind(i, panel_id))
+            values.append(None if v is _MISSING else v)
+        dep_results = [results[d] for d in node.deps]
+        if not node.memo:
+            return node.compute(ctx, *values, *dep_results)
+        fingerprint = json.dumps(
+            [values, dep_results, [ctx.get(k) for k in node.context]],
+            sort_keys=True, default=str, separators=(",", ":"),
+        )
+        key = (node.name, panel_id, fingerprint)
+        if key in self._memo:
+            self._memo.move_to_end(key)
+            self.hits += 1
+            return self._memo[key]
+        self.misses += 1
+        out = node.compute(ctx, *values, *dep_results)
+        self._memo[key] = out
+        if len(self._memo) > self.memo_size:
+            self._memo.popitem(last=False)
+        return out
+
+    def run(self, state: Dict[str, Any], ops: Ops, ctx: Dict[str, Any]) -> Tuple[Dict[str, Any], Ops]:
+        """
+        Recompute the nodes made dirty by `ops` over `state` (ops already
+        applied) and return (new_state, a minimal patch for the outputs
+        whose value actually changed).
+        """
+        globals_ = [n for n in self.order if self.nodes[n].panel_type is None]
+        dirty = set()
+        for name in globals_:
+            if self._dirty(self.nodes[name], None, ops, dirty):
+                dirty.add(name)
+        # Clean deps of dirty nodes are still resolved (normally from the memo).
+        needed = set(dirty)
+        for name in reversed(globals_):
+            if name in needed:
+                needed.update(self.nodes[name].deps)
+
+        results: Dict[str, Any] = {}
+        writes: List[Tuple[str, Any]] = []
+        for name in globals_:
+            if name not in needed:
+                continue
+            node = self.nodes[name]
+            results[name] = self._result(node, None, state, ctx, results)
+            if name in dirty and node.outputs:
+                writes.extend(node.outputs(results[name]).items())
+
+        for name in self.order:
+            node = self.nodes[name]
+            if node.panel_type is None:
+                continue
+            for pid in self._panels_for(state, ops, node.panel_type):
+                if not self._dirty(node, pid, ops, dirty):
+                    continue
+                res = self._result(node, pid, state, ctx, results)
+                if node.outputs:
+                    writes.extend((_bind(p, pid), v) for p, v in node.outputs(res).items())
+
+        extra: Ops = []
+        for path, value in writes:
+            old = _lookup(state, path)
+            if old is _MISSING:
+                state, op = assign(state, path, value)
+                extra.append(op)
+                continue
+            ops_ = diff(old, value, path)
+            if ops_:
+                state = set_in(state, path, value)
+                extra.extend(ops_)
+        return state, extra
@@ -0,0 +1,86 @@
+# state/hub.py
+from __future__ import annotations
+import asyncio
+import time
+from typing import Any, Dict, Set
+
+STATE_EVENTS = ("STATE_DELTA", "STATE_SNAPSHOT")
+
+# Queued in place of a lagging client's dropped state events; the SSE
+# generator answers it with a fresh STATE_SNAPSHOT.
+RESYNC: Dict[str, Any] = {"event": "STATE_SNAPSHOT"}
+
+
+class Client:
+    def __init__(self, maxsize: int = 256) -> None:
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=maxsize)
+        self.last_seen = time.monotonic()
+        self.closed = False
+
+    def touch(self) -> None:
+        self.last_seen = time.monotonic()
+
+
+class ClientHub:
+    """
+    SSE subscriber set with non-blocking fan-out.
+
+    Every client queue is bounded. A client whose backlog reaches
+    `lag_threshold` has its pending state events collapsed into a single
+    RESYNC marker; a client that is still full, has been closed, or has not
+    pulled from its queue for `idle_timeout` seconds is evicted.
+    """
+
+    def __init__(self, queue_size: int = 256, lag_threshold: int = 64, idle_timeout: float = 60.0):
+        self.clients: Set[Client] = set()
+        self.queue_size = queue_size
+        self.lag_threshold = min(lag_threshold, queue_size)
+        self.idle_timeout = idle_timeout
+        self.coalesced = 0
+        self.evicted = 0
+
+    def connect(self) -> Client:
+        client = Client(maxsize=self.queue_size)
+        self.clients.add(client)
+        return client
+
+    def disconnect(self, client: Client) -> None:
+        client.closed = True
+        self.clients.discard(client)
+
+    def _evict(self, client: Client) -> None:
+        self.evicted += 1
+        self.disconnect(client)
+
+    def _coalesce(self, client: Client) -> None:
+        kept = []
+        while not client.queue.empty():
+            m = client.queue.get_nowait()
+            if m is not RESYNC and m.get("event") not in STATE_EVENTS:
+                kept.append(m)
+        for m in kept:
+            client.queue.put_nowait(m)
+        client.queue.put_nowait(RESYNC)
+        self.coalesced += 1
+
+    def publish(self, message: Dict[str, Any]) -> None:
+        """Enqueue `message` for every live client without awaiting any of them."""
+        now = time.monotonic()
+        for c in list(self.clients):
+            if c.closed or now - c.last_seen > self.idle_timeout:
+                self._evict(c)
+                continue
+            try:
+                if message.get("event") in STATE_EVENTS and c.queue.qsize() >= self.lag_threshold:
+                    self._coalesce(c)
+                else:
+                    c.queue.put_nowait(message)
+            except asyncio.QueueFull:
+                self._evict(c)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "clients": len(self.clients),
+            "coalesced": self.coalesced,
+            "evicted": self.evicted,
+        }
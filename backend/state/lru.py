@@ -0,0 +1,86 @@
+# state/lru.py
+from __future__ import annotations
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+# Bounded LRU of values derived from a versioned document (panel results from
+# a doc's facts, rankings from a doc's index).
+#
+# Entries are keyed by (doc_id, version, key). A doc keeps entries for one
+# version only: they are dropped by invalidate(doc_id) when the doc is
+# rewritten here, or on the first lookup that sees a different version (a
+# write from another worker, or a file edited behind our back). Hits and
+# misses are counted per caller-chosen tag.
+
+_MISSING = object()
+
+
+class VersionedLRU:
+    def __init__(self, max_entries: int = 1024):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[Tuple[Any, Any, Hashable], Any]" = OrderedDict()
+        self._versions: Dict[Hashable, Any] = {}  # doc_id -> version of its entries
+        self.hits: Dict[str, int] = {}
+        self.misses: Dict[str, int] = {}
+        self.evictions = 0
+        self.invalidations = 0
+
+    def _drop_doc(self, doc_id: Any) -> None:
+        stale = [k for k in self._entries if k[0] == doc_id]
+        for k in stale:
+            del self._entries[k]
+        self._versions.pop(doc_id, None)
+        self.invalidations += len(stale)
+
+    def get_or_compute(self, doc_id: Any, version: Any, key: Hashable, compute: Callable[[], Any], tag: str = "") -> Any:
+        full = (doc_id, version, key)
+        with self._lock:
+            if self._versions.get(doc_id, version) != version:
+                self._drop_doc(doc_id)
+            hit = self._entries.get(full, _MISSING)
+            if hit is not _MISSING:
+                self._entries.move_to_end(full)
+                self.hits[tag] = self.hits.get(tag, 0) + 1
+                return hit
+            self.misses[tag] = self.misses.get(tag, 0) + 1
+
+        # Compute outside the lock; a concurrent miss on the same key just computes it twice.
+        out = compute()
+        if self.max_entries <= 0:
+            return out
+        with self._lock:
+            if self._versions.get(doc_id, version) != version:
+                self._drop_doc(doc_id)
+            self._versions[doc_id] = version
+            self._entries[full] = out
+            self._entries.move_to_end(full)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        return out
+
+    def invalidate(self, doc_id: Optional[Any] = None) -> None:
+        """Drop the entries of `doc_id` (all docs if None)."""
+        with self._lock:
+            if doc_id is None:
+                self.invalidations += len(self._entries)
+                self._entries.clear()
+                self._versions.clear()
+            else:
+                self._drop_doc(doc_id)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            hits, misses = sum(self.hits.values()), sum(self.misses.values())
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "docs": len(self._versions),
+                "hits": hits,
+                "misses": misses,
+                "hit_rate": round(hits / (hits + misses), 4) if hits + misses else None,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
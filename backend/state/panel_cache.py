@@ -0,0 +1,35 @@
+# state/panel_cache.py
+from __future__ import annotations
+import hashlib
+import json
+from typing import Any, Callable, Dict
+
+from state.lru import VersionedLRU
+
+# Bounded LRU of panel evaluations.
+#
+# A panel's result depends only on the doc's facts and the panel's controls,
+# so entries are keyed by (doc_id, facts version, panel type, hash of the
+# canonical controls JSON) rather than by panel id: toggling a control back,
+# or the same doc open in several sessions, is a hit. A doc's entries are
+# dropped as soon as its facts are rewritten (facts_store.on_change) or a
+# lookup sees a newer facts version.
+
+
+def controls_hash(controls: Any) -> str:
+    canonical = json.dumps(controls, sort_keys=True, default=str, separators=(",", ":"))
+    return hashlib.blake2b(canonical.encode("utf-8"), digest_size=16).hexdigest()
+
+
+class PanelCache(VersionedLRU):
+    def get_or_compute(self, doc_id: Any, version: Any, panel_type: str, controls: Any, compute: Callable[[], Any]) -> Any:
+        return super().get_or_compute(doc_id, version, (panel_type, controls_hash(controls)), compute, tag=panel_type)
+
+    def stats(self) -> Dict[str, Any]:
+        out = super().stats()
+        with self._lock:
+            out["by_type"] = {
+                t: {"hits": self.hits.get(t, 0), "misses": self.misses.get(t, 0)}
+                for t in sorted(set(self.hits) | set(self.misses))
+            }
+        return out
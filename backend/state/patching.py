@@ -0,0 +1,296 @@
+# state/patching.py
+from __future__ import annotations
+from typing import Any, Callable, Dict, List, Tuple
+
+from jsonpatch import InvalidJsonPatch, JsonPatchConflict, JsonPatchTestFailed
+from jsonpointer import JsonPointer, JsonPointerException, escape
+
+# Copy-on-write JSON Patch application.
+#
+# Committed state trees are never mutated. Applying an op copies only the
+# containers on the path from the root to the touched node; every other
+# subtree is shared with the previous root. Values carried by ops are
+# inserted as-is (no deep copy), so callers must not mutate them afterwards.
+
+
+def _parts(path: str) -> List[str]:
+    try:
+        return JsonPointer(path).parts
+    except JsonPointerException as e:
+        raise InvalidJsonPatch(str(e))
+
+
+def _index(seq: List[Any], part: str, allow_end: bool = False) -> int:
+    if part == "-" and allow_end:
+        return len(seq)
+    if not part.isdigit() or (len(part) > 1 and part[0] == "0"):
+        raise JsonPatchConflict(f"invalid array index '{part}'")
+    idx = int(part)
+    limit = len(seq) if allow_end else len(seq) - 1
+    if idx > limit:
+        raise JsonPatchConflict(f"array index '{part}' out of range")
+    return idx
+
+
+def _child(node: Any, part: str) -> Any:
+    if isinstance(node, dict):
+        if part not in node:
+            raise JsonPatchConflict(f"can't resolve '{part}': no such member")
+        return node[part]
+    if isinstance(node, list):
+        return node[_index(node, part)]
+    raise JsonPatchConflict(f"can't resolve '{part}' inside a scalar")
+
+
+def get_in(root: Any, path: str) -> Any:
+    """Resolve a JSON pointer against `root`; raises JsonPatchConflict if missing."""
+    node = root
+    for part in _parts(path):
+        node = _child(node, part)
+    return node
+
+
+def _update(root: Any, parts: List[str], edit: Callable[[Any, str], None]) -> Any:
+    """
+    Return a new root where the parent container of `parts` has been copied
+    and passed to `edit(copy, last_part)`. Ancestors are shallow-copied, all
+    siblings are shared.
+    """
+    def rec(node: Any, i: int) -> Any:
+        if i == len(parts) - 1:
+            if not isinstance(node, (dict, list)):
+                raise JsonPatchConflict(f"can't resolve '{parts[i]}' inside a scalar")
+            new = dict(node) if isinstance(node, dict) else list(node)
+            edit(new, parts[i])
+            return new
+        child = _child(node, parts[i])
+        if isinstance(node, dict):
+            new = dict(node)
+            new[parts[i]] = rec(child, i + 1)
+        else:
+            new = list(node)
+            new[_index(node, parts[i])] = rec(child, i + 1)
+        return new
+
+    return rec(root, 0)
+
+
+def _add(root: Any, path: str, value: Any) -> Any:
+    parts = _parts(path)
+    if not parts:
+        return value
+
+    def edit(parent: Any, part: str) -> None:
+        if isinstance(parent, dict):
+            parent[part] = value
+        else:
+            parent.insert(_index(parent, part, allow_end=True), value)
+
+    return _update(root, parts, edit)
+
+
+def _remove(root: Any, path: str) -> Any:
+    parts = _parts(path)
+    if not parts:
+        raise JsonPatchConflict("can't remove the whole document")
+
+    def edit(parent: Any, part: str) -> None:
+        if isinstance(parent, dict):
+            if part not in parent:
+                raise JsonPatchConflict(f"can't remove a non-existent object '{part}'")
+            del parent[part]
+        else:
+            del parent[_index(parent, part)]
+
+    return _update(root, parts, edit)
+
+
+def _replace(root: Any, path: str, value: Any) -> Any:
+    parts = _parts(path)
+    if not parts:
+        return value
+
+    def edit(parent: Any, part: str) -> None:
+        if isinstance(parent, dict):
+            if part not in parent:
+                raise JsonPatchConflict(f"can't replace a non-existent object '{part}'")
+            parent[part] = value
+        else:
+            if part == "-":
+                raise InvalidJsonPatch("'path' with '-' can't be applied to 'replace' operation")
+            parent[_index(parent, part)] = value
+
+    return _update(root, parts, edit)
+
+
+def apply_op(root: Any, op: Dict[str, Any]) -> Any:
+    kind = op.get("op")
+    path = op.get("path")
+    if not isinstance(path, str):
+        raise InvalidJsonPatch("Operation must have a string 'path' member")
+
+    if kind in ("add", "replace", "test") and "value" not in op:
+        raise InvalidJsonPatch("The operation does not contain a 'value' member")
+
+    if kind == "add":
+        return _add(root, path, op["value"])
+    if kind == "remove":
+        return _remove(root, path)
+    if kind == "replace":
+        return _replace(root, path, op["value"])
+    if kind == "test":
+        if get_in(root, path) != op["value"]:
+            raise JsonPatchTestFailed(f"{get_in(root, path)!r} is not equal to tested value {op['value']!r}")
+        return root
+    if kind in ("move", "copy"):
+        src = op.get("from")
+        if not isinstance(src, str):
+            raise InvalidJsonPatch(f"The '{kind}' operation must contain a 'from' member")
+        value = get_in(root, src)
+        if kind == "move":
+            if path == src:
+                return root
+            if path.startswith(src + "/"):
+                raise JsonPatchConflict("Cannot move values into their own children")
+            root = _remove(root, src)
+        return _add(root, path, value)
+    raise InvalidJsonPatch(f"Unknown operation {kind!r}")
+
+
+def apply_ops(root: Any, ops: List[Dict[str, Any]]) -> Any:
+    """
+    Apply a JSON Patch to `root` without mutating it and return the new root.
+    Raises the same exception types as `jsonpatch.apply_patch`.
+    """
+    for op in ops:
+        root = apply_op(root, op)
+    return root
+
+
+def set_in(root: Any, path: str, value: Any) -> Any:
+    """
+    Copy-on-write assignment of `value` at `path`, creating missing objects
+    along the way (the equivalent of chained `setdefault(...)[key] = value`).
+    """
+    parts = _parts(path)
+    if not parts:
+        return value
+
+    def rec(node: Any, i: int) -> Any:
+        part = parts[i]
+        if isinstance(node, list):
+            new = list(node)
+            idx = _index(node, part)
+            new[idx] = value if i == len(parts) - 1 else rec(node[idx], i + 1)
+            return new
+        new = dict(node) if isinstance(node, dict) else {}
+        new[part] = value if i == len(parts) - 1 else rec(new.get(part), i + 1)
+        return new
+
+    return rec(root, 0)
+
+
+def assign(root: Any, path: str, value: Any) -> Tuple[Any, Dict[str, Any]]:
+    """
+    `set_in` plus the single op a client needs to replay it: "replace" if the
+    member exists, otherwise "add" at the first missing ancestor carrying
+    the nested objects `set_in` created.
+    """
+    parts = _parts(path)
+    node = root
+    for i, part in enumerate(parts):
+        if isinstance(node, dict) and part in node:
+            node = node[part]
+            continue
+        if isinstance(node, list) and i == len(parts) - 1:
+            break
+        if isinstance(node, list):
+            node = node[_index(node, part)]
+            continue
+        sub: Any = value
+        for p in reversed(parts[i + 1:]):
+            sub = {p: sub}
+        ptr = JsonPointer.from_parts(parts[: i + 1]).path
+        return set_in(root, path, value), {"op": "add", "path": ptr, "value": sub}
+    return set_in(root, path, value), {"op": "replace", "path": path, "value": value}
+
+
+_MISSING = object()
+
+
+def _same(a: Any, b: Any) -> bool:
+    return a == b and isinstance(a, bool) == isinstance(b, bool)
+
+
+def diff(old: Any, new: Any, path: str = "") -> List[Dict[str, Any]]:
+    """
+    Minimal-ish JSON Patch turning `old` into `new`. Shared subtrees are
+    skipped by identity; objects are diffed per member, lists element-wise
+    with appends/truncation at the end (a list where more than half the
+    elements would need an op is replaced whole).
+    """
+    if old is new:
+        return []
+    if isinstance(old, dict) and isinstance(new, dict):
+        ops: List[Dict[str, Any]] = []
+        for k in old:
+            if k not in new:
+                ops.append({"op": "remove", "path": f"{path}/{escape(k)}"})
+        for k, v in new.items():
+            p = f"{path}/{escape(k)}"
+            if k in old:
+                ops.extend(diff(old[k], v, p))
+            else:
+                ops.append({"op": "add", "path": p, "value": v})
+        return ops
+    if isinstance(old, list) and isinstance(new, list):
+        n = min(len(old), len(new))
+        ops = []
+        changed = 0
+        for i in range(n):
+            sub = diff(old[i], new[i], f"{path}/{i}")
+            changed += bool(sub)
+            ops.extend(sub)
+        ops.extend({"op": "add", "path": f"{path}/{i}", "value": new[i]} for i in range(n, len(new)))
+        ops.extend({"op": "remove", "path": f"{path}/{i}"} for i in range(len(old) - 1, n - 1, -1))
+        edits = changed + abs(len(new) - len(old))
+        if edits > 1 and edits * 2 > len(new):
+            return [{"op": "replace", "path": path, "value": new}]
+        return ops
+    if _same(old, new):
+        return []
+    return [{"op": "replace", "path": path, "value": new}]
+
+
+def effective_ops(root: Any, ops: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    `ops` minus the ones that would not change `root`: `test` ops and
+    add/replace of a member with the value it already holds. Array inserts
+    are always kept. `ops` must already be known to apply cleanly.
+    """
+    out: List[Dict[str, Any]] = []
+    node = root
+    for op in ops:
+        kind = op.get("op")
+        if kind == "test":
+            continue
+        if kind in ("add", "replace"):
+            parts = _parts(op["path"])
+            if parts:
+                try:
+                    parent = get_in(node, JsonPointer.from_parts(parts[:-1]).path)
+                except JsonPatchConflict:
+                    parent = None
+                is_insert = kind == "add" and isinstance(parent, list)
+                if not is_insert and isinstance(parent, (dict, list)):
+                    try:
+                        current = _child(parent, parts[-1])
+                    except JsonPatchConflict:
+                        current = _MISSING
+                    if current is not _MISSING and _same(current, op.get("value")):
+                        continue
+            elif _same(node, op.get("value")):
+                continue
+        node = apply_op(node, op)
+        out.append(op)
+    return out
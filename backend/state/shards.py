@@ -0,0 +1,191 @@
+# state/shards.py
+from __future__ import annotations
+import json
+import re
+import shutil
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional
+
+from state.hub import ClientHub
+from state.store import StateStore
+from state.wal import OpLog
+
+DEFAULT_SHARD = "default"
+_SHARD_ID = re.compile(r"^[A-Za-z0-9_\-]{1,64}$")
+
+
+class Shard:
+    """One session's (or workspace's) state: its own store, lock, revision log and SSE subscribers."""
+
+    def __init__(self, shard_id: str, store: StateStore, hub: ClientHub, fresh: bool = False):
+        self.id = shard_id
+        self.store = store
+        self.hub = hub
+        self.fresh = fresh  # started from scratch: nothing of it is on disk
+        self.last_used = time.monotonic()
+        # Incremental evaluators that track this shard's state between commits (rebuilt after a spill).
+        self.evaluators: Dict[str, Any] = {}
+
+    def touch(self) -> None:
+        self.last_used = time.monotonic()
+
+    @property
+    def unused(self) -> bool:
+        """Fresh and never committed to: nothing to keep once it goes idle."""
+        return self.fresh and self.store.revision == 0
+
+    def is_idle(self, now: float, ttl: float) -> bool:
+        return (
+            now - self.last_used > ttl
+            and not self.hub.clients
+            and not self.store.lock.locked()
+        )
+
+
+class ShardRegistry:
+    """
+    Lazily creates shards by id and spills idle ones to `spill_dir` as JSON.
+
+    A shard is idle once it has been unused for `ttl` seconds, has no SSE
+    subscribers and no writer in flight. Spilled shards are restored on their
+    next use (with a new store epoch, so reconnecting clients resync from a
+    snapshot). Idle sweeps run opportunistically from `get`. A shard that
+    was never committed to is dropped instead of spilled, so sessions that
+    are opened and abandoned cost no disk.
+
+    With a `journal_factory` every shard gets a write-ahead OpLog: shards are
+    recovered from it (snapshot + log tail) instead of from `spill_dir`, and
+    spilling just snapshots and closes the journal. Journals are written from
+    the first commit on. `journal_dir` (where the factory puts journals) is
+    used to count spilled shards and, on sweeps, to delete journals that
+    never got past revision 0 once they are older than `ttl`.
+    """
+
+    def __init__(
+        self,
+        initial_state: Callable[[], Dict[str, Any]],
+        spill_dir: Path,
+        ttl: float = 1800.0,
+        sweep_interval: float = 60.0,
+        log_size: int = 1024,
+        hub_factory: Callable[[], ClientHub] = ClientHub,
+        journal_factory: Optional[Callable[[str], OpLog]] = None,
+        journal_dir: Optional[Path] = None,
+    ):
+        self.initial_state = initial_state
+        self.spill_dir = spill_dir
+        self.spill_dir.mkdir(parents=True, exist_ok=True)
+        self.ttl = ttl
+        self.sweep_interval = sweep_interval
+        self.log_size = log_size
+        self.hub_factory = hub_factory
+        self.journal_factory = journal_factory
+        self.journal_dir = journal_dir
+        self.shards: Dict[str, Shard] = {}
+        self._last_sweep = time.monotonic()
+
+    @staticmethod
+    def valid_id(shard_id: Optional[str]) -> bool:
+        return bool(shard_id) and bool(_SHARD_ID.match(shard_id))
+
+    def _spill_path(self, shard_id: str) -> Path:
+        return self.spill_dir / f"{shard_id}.json"
+
+    def _load(self, shard_id: str, seed: Optional[Dict[str, Any]] = None) -> Shard:
+        journal = self.journal_factory(shard_id) if self.journal_factory else None
+        recovered = journal.recover(self.initial_state) if journal else None
+        rev = 0
+        fresh = False
+        p = self._spill_path(shard_id)
+        if recovered is not None:
+            rev, root = recovered
+        elif p.exists():
+            root = json.loads(p.read_text(encoding="utf-8"))
+            p.unlink()
+        else:
+            root = seed if seed is not None else self.initial_state()
+            fresh = True
+        store = StateStore(root, log_size=self.log_size, revision=rev, journal=journal)
+        return Shard(shard_id, store, self.hub_factory(), fresh=fresh)
+
+    def get(self, shard_id: Optional[str] = None, seed: Optional[Dict[str, Any]] = None) -> Shard:
+        """The shard `shard_id` (default shard if None); `seed` is the root of one that has no state yet."""
+        shard_id = shard_id or DEFAULT_SHARD
+        if not self.valid_id(shard_id):
+            raise ValueError(f"Invalid session id '{shard_id}'")
+        self.maybe_sweep()
+        shard = self.shards.get(shard_id)
+        if shard is None:
+            shard = self._load(shard_id, seed)
+            self.shards[shard_id] = shard
+        shard.touch()
+        return shard
+
+    def spill(self, shard: Shard) -> None:
+        journal = shard.store.journal
+        if shard.unused:
+            if journal is not None:
+                journal.close()
+        elif journal is not None:
+            rev, root = shard.store.head
+            if rev > journal.snapshot_rev:
+                journal.snapshot(rev, root)
+            journal.close()
+        else:
+            self._spill_path(shard.id).write_text(json.dumps(shard.store.root), encoding="utf-8")
+        self.shards.pop(shard.id, None)
+
+    def sync(self) -> None:
+        """fsync every active shard's journal (run periodically to bound the fsync window)."""
+        for s in list(self.shards.values()):
+            if s.store.journal is not None:
+                s.store.journal.sync()
+
+    def close(self) -> None:
+        for s in list(self.shards.values()):
+            if s.store.journal is not None:
+                s.store.journal.close()
+
+    def maybe_sweep(self) -> int:
+        now = time.monotonic()
+        if now - self._last_sweep < self.sweep_interval:
+            return 0
+        self._last_sweep = now
+        idle = [s for s in self.shards.values() if s.is_idle(now, self.ttl)]
+        for s in idle:
+            self.spill(s)
+        self.prune_journals()
+        return len(idle)
+
+    def prune_journals(self) -> int:
+        """Delete inactive journals older than `ttl` that hold nothing past revision 0."""
+        if self.journal_dir is None or not self.journal_dir.is_dir():
+            return 0
+        cutoff = time.time() - self.ttl
+        pruned = 0
+        for d in self.journal_dir.iterdir():
+            if not d.is_dir() or d.name in self.shards:
+                continue
+            try:
+                names = {f.name for f in d.iterdir()}
+                if names - {"snapshot.json"} or d.stat().st_mtime > cutoff:
+                    continue
+                if names and json.loads((d / "snapshot.json").read_text(encoding="utf-8")).get("rev") != 0:
+                    continue
+                shutil.rmtree(d)
+                pruned += 1
+            except (OSError, ValueError):
+                continue
+        return pruned
+
+    def stats(self) -> Dict[str, Any]:
+        spilled = sum(1 for _ in self.spill_dir.glob("*.json"))
+        if self.journal_dir is not None and self.journal_dir.is_dir():
+            spilled += sum(1 for d in self.journal_dir.iterdir() if d.is_dir() and d.name not in self.shards)
+        out: Dict[str, Any] = {"active": len(self.shards), "spilled": spilled}
+        if self.journal_factory:
+            out["recovery"] = {
+                s.id: s.store.journal.recovery for s in self.shards.values() if s.store.journal and s.store.journal.recovery
+            }
+        return out
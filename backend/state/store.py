@@ -0,0 +1,102 @@
+# state/store.py
+from __future__ import annotations
+import asyncio
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Tuple
+from uuid import uuid4
+
+from state.patching import apply_ops
+from state.wal import OpLog
+
+Ops = List[Dict[str, Any]]
+
+
+class StateStore:
+    """
+    Holds the current application state as an immutable root.
+
+    Writers serialize on `lock`, build a new root with `apply_ops` (only the
+    touched path is copied) and `commit` it. Readers use `root` directly and
+    never take the lock: a committed root is never mutated, and swapping the
+    reference is atomic.
+
+    Every commit bumps `revision` and records its ops in a bounded delta log,
+    so a reconnecting SSE client can be sent just the batches it missed. An
+    optional `journal` makes commits durable across restarts.
+    Event ids are "<epoch>-<revision>"; the epoch changes on every process
+    start so ids from a previous process never match.
+    """
+
+    def __init__(
+        self,
+        initial: Dict[str, Any],
+        log_size: int = 1024,
+        revision: int = 0,
+        journal: Optional[OpLog] = None,
+    ):
+        self._head: Tuple[int, Dict[str, Any]] = (revision, initial)
+        self.journal = journal
+        self._log: Deque[Tuple[int, Ops]] = deque(maxlen=log_size)
+        self.epoch = uuid4().hex[:8]
+        self.lock = asyncio.Lock()
+
+    @property
+    def root(self) -> Dict[str, Any]:
+        return self._head[1]
+
+    @property
+    def revision(self) -> int:
+        return self._head[0]
+
+    @property
+    def head(self) -> Tuple[int, Dict[str, Any]]:
+        """(revision, root) read as one consistent pair."""
+        return self._head
+
+    def preview(self, ops: Ops) -> Dict[str, Any]:
+        """Apply `ops` to the current root without committing the result."""
+        return apply_ops(self._head[1], ops)
+
+    def commit(
+        self,
+        new_root: Dict[str, Any],
+        ops: Optional[Ops] = None,
+        audit: Optional[Dict[str, Any]] = None,
+    ) -> int:
+        """
+        Publish `new_root` and return its revision. `ops` is the delta from the
+        previous root; pass None for a wholesale replacement, which clears the
+        log so older clients resync from a snapshot. With a journal the commit
+        is written ahead (with `audit` fields) and a journal error aborts it.
+        """
+        rev = self._head[0] + 1
+        if self.journal is not None:
+            self.journal.append(rev, ops, new_root, audit)
+        self._head = (rev, new_root)
+        if ops is None:
+            self._log.clear()
+        else:
+            self._log.append((rev, ops))
+        return rev
+
+    def event_id(self, rev: int) -> str:
+        return f"{self.epoch}-{rev}"
+
+    def parse_event_id(self, event_id: Optional[str]) -> Optional[int]:
+        """Revision encoded in `event_id`, or None if it is not from this store."""
+        epoch, _, rev = (event_id or "").strip().partition("-")
+        if epoch != self.epoch or not rev.isdigit():
+            return None
+        return int(rev)
+
+    def deltas_since(self, rev: int) -> Optional[List[Tuple[int, Ops]]]:
+        """
+        Logged (revision, ops) batches committed after `rev`, or None when the
+        log no longer reaches back that far and a snapshot is required.
+        """
+        current = self._head[0]
+        if rev == current:
+            return []
+        if rev > current or not self._log or self._log[0][0] > rev + 1:
+            return None
+        return [(r, ops) for r, ops in self._log if r > rev]
@@ -0,0 +1,79 @@
+# state/validation.py
+from __future__ import annotations
+from typing import Any, Dict, List, Optional, Set
+
+from pydantic import TypeAdapter
+
+from state_models import AppState
+
+# Incremental validation of a patched state.
+#
+# A committed root is always a normalized `AppState.model_dump()`, so after a
+# patch only the top-level subtrees named by the ops can be invalid. Each of
+# those is validated and dumped through the sub-model that owns it
+# (`/spend/*` -> SpendState, `/delegation/*` -> DelegationState, ...); the
+# other subtrees are carried over by reference. Anything the shortcut cannot
+# reason about (root replacement, added/removed top-level keys, any failure)
+# falls back to full validation, so results and error payloads are identical
+# to `AppState.model_validate(candidate).model_dump()`.
+
+_ADAPTERS: Dict[str, TypeAdapter] = {
+    name: TypeAdapter(field.annotation) for name, field in AppState.model_fields.items()
+}
+
+# Values typed `Any` are dumped unchanged, so these subtrees need no work
+# beyond checking that they are still dicts.
+_PASSTHROUGH: Set[str] = {
+    name for name, field in AppState.model_fields.items() if field.annotation == Dict[str, Any]
+}
+
+
+def _top_key(path: Optional[str]) -> Optional[str]:
+    if not isinstance(path, str):
+        return None
+    parts = path.split("/", 2)
+    if len(parts) < 2 or parts[0] != "":
+        return ""
+    return parts[1].replace("~1", "/").replace("~0", "~")
+
+
+def touched_keys(ops: List[Dict[str, Any]]) -> Optional[Set[str]]:
+    """Top-level state keys touched by `ops`, or None if an op targets the root."""
+    keys: Set[str] = set()
+    for op in ops:
+        for field in ("path", "from"):
+            if field == "from" and op.get("op") not in ("move", "copy"):
+                continue
+            key = _top_key(op.get(field))
+            if not key:
+                return None
+            keys.add(key)
+    return keys
+
+
+def validate_full(candidate: Dict[str, Any]) -> Dict[str, Any]:
+    return AppState.model_validate(candidate).model_dump()
+
+
+def validate_incremental(base: Dict[str, Any], candidate: Dict[str, Any], ops: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Validate only the subtrees of `candidate` touched by `ops`; `base` must be
+    the normalized root the ops were applied to. Raises ValidationError
+    exactly like `validate_full`.
+    """
+    keys = touched_keys(ops)
+    if keys is None or not isinstance(candidate, dict) or candidate.keys() != base.keys():
+        return validate_full(candidate)
+    if any(k not in _ADAPTERS for k in keys):
+        return validate_full(candidate)
+
+    out = dict(candidate)
+    try:
+        for key in keys:
+            if key in _PASSTHROUGH and isinstance(candidate[key], dict):
+                continue
+            adapter = _ADAPTERS[key]
+            out[key] = adapter.dump_python(adapter.validate_python(candidate[key]))
+    except Exception:
+        return validate_full(candidate)
+    return out
@@ -0,0 +1,322 @@
+# state/wal.py
+from __future__ import annotations
+import json
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from state.patching import apply_ops
+
+Ops = List[Dict[str, Any]]
+
+
+def _write_atomic(path: Path, text: str) -> None:
+    tmp = path.with_suffix(path.suffix + ".tmp")
+    with tmp.open("w", encoding="utf-8") as f:
+        f.write(text)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+    _fsync_dir(path.parent)
+
+
+def _fsync_dir(directory: Path) -> None:
+    try:
+        fd = os.open(directory, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+# Snapshots are serialized and fsync'd here, off the event loop: the roots
+# handed to `append` are never mutated after commit, so they can be written
+# later. One thread, so a journal's snapshots land in revision order.
+_SNAPSHOTS = ThreadPoolExecutor(max_workers=1, thread_name_prefix="wal-snapshot")
+
+
+def _segment_range(path: Path) -> Tuple[int, int]:
+    """(first, last) revision in the name of a rotated `audit-<first>-<last>.ndjson` segment."""
+    _, first, last = path.stem.split("-")
+    return int(first), int(last)
+
+
+class OpLog:
+    """
+    Write-ahead journal for one shard.
+
+    Every commit is appended to `log.ndjson` as one JSON line
+    {"rev", "ts", "ops", ...audit fields} *before* it becomes visible.
+    Lines are flushed immediately; `sync()` fsyncs them and is run
+    periodically by the owner (off the event loop), so at most that window
+    is lost on power failure, never on a process crash.
+
+    Every `snapshot_every` revisions (and on wholesale commits) the current
+    log segment is rotated to `audit-<first>-<last>.ndjson` and the full
+    state is written to `snapshot.json` in the background. Recovery reads
+    the snapshot plus every journaled record after it, from the rotated
+    segments (should a crash beat the snapshot write) and the log; the
+    rotated segments are kept as an audit trail. A wholesale commit carries
+    its state in the record, so it does not depend on that write either.
+
+    Nothing is written until the first commit: the directory is created
+    then, and the first record of a journal also carries its state, so a
+    journal needs no base snapshot and a shard that never commits leaves
+    nothing on disk.
+    """
+
+    def __init__(self, directory: Path, snapshot_every: int = 200):
+        self.dir = directory
+        self.snapshot_every = max(1, snapshot_every)
+        self.snapshot_rev = 0  # revision the current log segment starts after
+        self.recovery: Dict[str, Any] = {}
+        self._fh = None
+        self._fresh = True  # no record journaled yet: the next one carries its state
+        self._dirty = False
+        self._unsynced: List[Path] = []  # rotated segments not yet fsync'd
+        self._written_rev = -1  # revision of snapshot.json
+        self._pending: Optional[Future] = None
+        self._lock = threading.Lock()
+        self._snapshot_lock = threading.Lock()
+
+    @property
+    def log_path(self) -> Path:
+        return self.dir / "log.ndjson"
+
+    @property
+    def snapshot_path(self) -> Path:
+        return self.dir / "snapshot.json"
+
+    # ---- recovery ----
+
+    def recover(self, initial: Optional[Callable[[], Dict[str, Any]]] = None) -> Optional[Tuple[int, Dict[str, Any]]]:
+        """
+        Latest (revision, root) from the snapshot plus the journaled records
+        after it, or None if nothing was journaled. Without a snapshot, replay
+        starts from `initial()` at revision 0. Only a torn or unparseable last
+        line (crash mid-write) is truncated; records that cannot be replayed
+        (a gap, corruption before the tail) are moved aside to
+        `unreplayed-*.ndjson`, never deleted.
+        """
+        t0 = time.perf_counter()
+        rev, root = 0, None
+        if self.snapshot_path.exists():
+            snap = json.loads(self.snapshot_path.read_text(encoding="utf-8"))
+            rev, root = int(snap["rev"]), snap["state"]
+            self._written_rev = rev
+        base = rev
+        segments = sorted(self.dir.glob("audit-*.ndjson"))
+        self.snapshot_rev = max([rev] + [_segment_range(p)[1] for p in segments])
+
+        replayed = 0
+        from_segments = 0
+        stopped = False
+        unreplayed = None
+
+        def replay(rec: Dict[str, Any]) -> bool:
+            nonlocal rev, root, replayed
+            if rec["rev"] <= rev:
+                return True
+            if rec["rev"] != rev + 1 and not (root is None and rec.get("state") is not None):
+                return False
+            if rec.get("state") is not None:
+                root = rec["state"]
+            else:
+                if root is None:
+                    if initial is None:
+                        return False
+                    root = initial()
+                root = apply_ops(root, rec["ops"])
+            rev = rec["rev"]
+            replayed += 1
+            return True
+
+        for seg in segments:
+            if stopped or _segment_range(seg)[1] <= rev:
+                continue
+            with seg.open("rb") as f:
+                for line in f:
+                    try:
+                        ok = replay(json.loads(line))
+                    except Exception:
+                        ok = False
+                    if not ok:
+                        stopped = True
+                        break
+        from_segments = replayed
+
+        if self.log_path.exists():
+            with self.log_path.open("rb") as f:
+                lines = f.readlines()
+            good = 0
+            for i, line in enumerate(lines):
+                if not stopped:
+                    try:
+                        if not line.endswith(b"\n"):
+                            raise ValueError("torn record")
+                        rec = json.loads(line)
+                    except ValueError:
+                        if i == len(lines) - 1:
+                            break  # torn tail: dropped below
+                        stopped = True
+                    else:
+                        try:
+                            stopped = not replay(rec)
+                        except Exception:
+                            stopped = True
+                if stopped:
+                    break
+                good += len(line)
+            if stopped:
+                unreplayed = self.dir / f"unreplayed-{rev + 1:010d}-{int(time.time())}.ndjson"
+                self.log_path.rename(unreplayed)
+                _fsync_dir(self.dir)
+            elif good < sum(map(len, lines)):
+                with self.log_path.open("r+b") as f:
+                    f.truncate(good)
+
+        if stopped:
+            self.snapshot_rev = rev  # the next log segment starts after what was replayed
+        if root is not None and (stopped or from_segments):
+            # Replay needed records that the log no longer holds (moved aside,
+            # or rotated before the snapshot write landed): make it the base.
+            self._write_snapshot(rev, root)
+
+        self._fresh = root is None
+        self.recovery = {
+            "rev": rev,
+            "snapshot_rev": base,
+            "replayed": replayed,
+            "ms": round((time.perf_counter() - t0) * 1000, 3),
+        }
+        if unreplayed is not None:
+            self.recovery["unreplayed"] = unreplayed.name
+        return None if root is None else (rev, root)
+
+    # ---- writing ----
+
+    def _file(self):
+        if self._fh is None:
+            self.dir.mkdir(parents=True, exist_ok=True)
+            self._fh = self.log_path.open("a", encoding="utf-8")
+        return self._fh
+
+    def append(self, rev: int, ops: Optional[Ops], root: Dict[str, Any], audit: Optional[Dict[str, Any]] = None) -> None:
+        """
+        Journal the commit of `root` at `rev`; `ops` None means a wholesale
+        replacement. Only writes and flushes a line (plus, when a snapshot is
+        due, a rename); fsync and the snapshot happen off the caller's thread.
+        """
+        rec = {"rev": rev, "ts": time.time(), **(audit or {})}
+        if ops is None:
+            rec["snapshot"] = True
+            rec["ops"] = []
+            rec["state"] = root
+        else:
+            rec["ops"] = ops
+            if self._fresh:
+                rec["state"] = root
+        with self._lock:
+            f = self._file()
+            f.write(json.dumps(rec, separators=(",", ":")) + "\n")
+            f.flush()
+            self._dirty = True
+            self._fresh = False
+        if ops is None or rev - self.snapshot_rev >= self.snapshot_every:
+            self._rotate(rev)
+            self.checkpoint(rev, root)
+
+    def sync(self) -> None:
+        """fsync pending appends and rotated segments (cheap no-op when there are none)."""
+        with self._lock:
+            if self._fh is not None and self._dirty:
+                os.fsync(self._fh.fileno())
+                self._dirty = False
+            rotated, self._unsynced = self._unsynced, []
+        for path in rotated:
+            try:
+                with path.open("rb") as f:
+                    os.fsync(f.fileno())
+            except OSError:
+                pass
+        if rotated:
+            _fsync_dir(self.dir)
+
+    def _rotate(self, rev: int) -> None:
+        """Close the log segment after `rev` and keep it as `audit-<first>-<rev>.ndjson`."""
+        with self._lock:
+            if self._fh is not None:
+                self._fh.close()
+                self._fh = None
+                self._dirty = False
+            if rev > self.snapshot_rev and self.log_path.exists() and self.log_path.stat().st_size > 0:
+                rotated = self.dir / f"audit-{self.snapshot_rev + 1:010d}-{rev:010d}.ndjson"
+                self.log_path.rename(rotated)
+                self._unsynced.append(rotated)
+            self.snapshot_rev = max(self.snapshot_rev, rev)
+
+    def _write_snapshot(self, rev: int, root: Dict[str, Any]) -> None:
+        with self._snapshot_lock:
+            if rev <= self._written_rev:
+                return
+            self.dir.mkdir(parents=True, exist_ok=True)
+            _write_atomic(self.snapshot_path, json.dumps({"rev": rev, "state": root}))
+            self._written_rev = rev
+
+    def checkpoint(self, rev: int, root: Dict[str, Any]) -> None:
+        """Write `root` as the snapshot at `rev` in the background (`root` must not be mutated afterwards)."""
+        self._pending = _SNAPSHOTS.submit(self._write_snapshot, rev, root)
+
+    def snapshot(self, rev: int, root: Dict[str, Any]) -> None:
+        """Write a compacted snapshot at `rev` now and rotate the log segment into the audit trail."""
+        self._rotate(rev)
+        self._write_snapshot(rev, root)
+        self.sync()
+
+    def close(self) -> None:
+        pending = self._pending
+        if pending is not None:
+            pending.result()
+        self.sync()
+        with self._lock:
+            if self._fh is not None:
+                self._fh.close()
+                self._fh = None
+
+    # ---- audit ----
+
+    def _records(self) -> Iterator[Dict[str, Any]]:
+        segments = sorted(self.dir.glob("audit-*.ndjson")) + [self.log_path]
+        for seg in segments:
+            if not seg.exists():
+                continue
+            with seg.open("r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        yield json.loads(line)
+                    except ValueError:
+                        break
+
+    def history(self, since: int = 0, limit: int = 100, path_prefix: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Journaled commits after revision `since`, oldest first, optionally only those touching `path_prefix`."""
+        out: List[Dict[str, Any]] = []
+        for rec in self._records():
+            if rec.get("rev", 0) <= since:
+                continue
+            rec.pop("state", None)
+            if path_prefix:
+                ops = [o for o in rec.get("ops") or [] if str(o.get("path", "")).startswith(path_prefix)]
+                if not ops:
+                    continue
+                rec = dict(rec, ops=ops)
+            out.append(rec)
+            if len(out) >= limit:
+                break
+        return out
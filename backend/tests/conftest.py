@@ -0,0 +1,5 @@
+# Tests import the backend's top-level packages (state, retrieval, ...) as the app does.
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
@@ -0,0 +1,34 @@
+import io
+import json
+from pathlib import Path
+
+import pytest
+
+from evaluators.batch_spend import SpendBatch, format_for, read_rows
+from evaluators.spend import derive_requirements
+
+POLICY = json.loads((Path(__file__).resolve().parent.parent / "policy" / "spend_policy.json").read_text())
+
+
+@pytest.mark.parametrize("name, fmt", [("ledger.csv", "csv"), ("LEDGER.TSV", "tsv"), ("ledger.ndjson", "ndjson"), ("", "ndjson")])
+def test_format_from_extension(name, fmt):
+    assert format_for(name) == fmt
+
+
+def test_tsv_rows_split_on_tabs():
+    text = "amount\tcategory\trequester\n1,200.50\tTravel, local\tAlex\n"
+    rows = list(read_rows(io.StringIO(text), format_for("ledger.tsv")))
+    assert rows == [{"amount": "1,200.50", "category": "Travel, local", "requester": "Alex"}]
+
+
+def test_unknown_format_is_rejected():
+    with pytest.raises(ValueError):
+        list(read_rows(io.StringIO(""), "xlsx"))
+
+
+def test_sod_compares_raw_ids_like_derive_requirements():
+    pairs = [(1, "1"), (1, 1), (2, 2.0), ("a", "a"), ("a", "b"), (None, None), ("", ""), (0, 0)]
+    rows = [{"amount": 100, "requester": r, "approver": a} for r, a in pairs]
+    batch = [res["violations"] for res in SpendBatch(POLICY).evaluate(rows)]
+    assert batch == [derive_requirements(r, POLICY)["violations"] for r in rows]
+    assert [bool(v) for v in batch] == [False, True, True, True, False, False, False, False]
@@ -0,0 +1,42 @@
+import asyncio
+
+from state.coalesce import PatchCoalescer
+
+
+def test_each_batch_keeps_its_audit():
+    calls = []
+
+    async def apply(target, ops, audits):
+        calls.append((ops, audits))
+        return 200, {"ok": True}
+
+    async def run():
+        c = PatchCoalescer(apply, window=0.01)
+        op = lambda v: [{"op": "replace", "path": "/panel_configs/p/controls/x", "value": v}]
+        return await asyncio.gather(
+            c.submit("k", None, op(1), {"source": "patch", "actor": "alice"}),
+            c.submit("k", None, op(2), {"source": "patch", "actor": "bob"}),
+        )
+
+    results = asyncio.run(run())
+    assert [r[1]["coalesced"] for r in results] == [2, 2]
+    assert calls == [([{"op": "replace", "path": "/panel_configs/p/controls/x", "value": 2}],
+                      [{"source": "patch", "actor": "alice"}, {"source": "patch", "actor": "bob"}])]
+
+
+def test_rejected_merge_reapplies_each_batch_with_its_own_audit():
+    calls = []
+
+    async def apply(target, ops, audits):
+        calls.append(audits)
+        return (400, {"error": "bad"}) if len(audits) > 1 else (200, {"ok": True})
+
+    async def run():
+        c = PatchCoalescer(apply, window=0.01)
+        return await asyncio.gather(
+            c.submit("k", None, [{"op": "add", "path": "/a/b/c/d", "value": 1}], {"actor": "alice"}),
+            c.submit("k", None, [{"op": "add", "path": "/a/b/c/e", "value": 2}], {"actor": "bob"}),
+        )
+
+    asyncio.run(run())
+    assert calls[1:] == [[{"actor": "alice"}], [{"actor": "bob"}]]
@@ -0,0 +1,65 @@
+import json
+from pathlib import Path
+
+from evaluators.delegation import DelegationEngine, validate_delegation
+from state.derived import DerivedGraph, Node
+from state.patching import apply_ops
+
+RULES = json.loads((Path(__file__).resolve().parent.parent / "policy" / "delegation_rules.json").read_text())
+
+STATE = {
+    "spend": {"amount": 100},
+    "delegation": {
+        "people": ["Alex", "Priya"],
+        "roles": ["Spending", "Payment"],
+        "assignments": {"Spending": "Alex", "Payment": "Alex"},
+        "acting": [],
+    },
+}
+
+
+def test_same_delegation_object_reuses_the_last_result():
+    engine = DelegationEngine()
+    first = engine.validate(STATE["delegation"], RULES)
+    rechecked = engine.rechecked
+    again = engine.validate(STATE["delegation"], RULES)
+    assert again == first == validate_delegation(STATE["delegation"], RULES)
+    assert engine.reused == 1 and engine.rechecked == rechecked
+
+    again.append({"code": "x"})  # callers get their own list
+    assert engine.validate(STATE["delegation"], RULES) == first
+
+
+def test_spend_edits_do_not_revalidate_delegation():
+    engine = DelegationEngine()
+    graph = DerivedGraph()
+    graph.register(Node("spend", lambda ctx, spend: {"violations": []}, inputs=["/spend"]))
+    graph.register(Node("delegation", lambda ctx, d: engine.validate(d or {}, RULES), inputs=["/delegation"], memo=False))
+    graph.register(Node("violations", lambda ctx, s, d: s["violations"] + d, deps=["spend", "delegation"],
+                        outputs=lambda v: {"/violations": v}))
+
+    state = dict(STATE, violations=[])
+    ops = [{"op": "replace", "path": "/delegation/assignments/Payment", "value": "Priya"}]
+    state, _ = graph.run(apply_ops(state, ops), ops, {})
+    builds, rechecked = engine.full_builds, engine.rechecked
+    for amount in (200, 300):
+        ops = [{"op": "replace", "path": "/spend/amount", "value": amount}]
+        state, _ = graph.run(apply_ops(state, ops), ops, {})
+    assert (engine.full_builds, engine.rechecked, engine.reused) == (builds, rechecked, 2)
+    assert state["violations"] == validate_delegation(state["delegation"], RULES)
+
+
+def test_acting_overlap_is_opt_in():
+    delegation = {
+        "people": ["Alex", "Priya"],
+        "roles": ["Spending", "Payment"],
+        "assignments": {},
+        "acting": [
+            {"person": "Alex", "role": "Spending", "from": "2024-01-01", "to": "2024-01-31"},
+            {"person": "Priya", "role": "Spending", "from": "2024-01-15", "to": "2024-02-15"},
+        ],
+    }
+    legacy = {"delegation": {k: v for k, v in RULES["delegation"].items() if k != "acting_rules"}}
+    assert "ActingOverlap" not in {v["code"] for v in validate_delegation(delegation, legacy)}
+    codes = [v["code"] for v in validate_delegation(delegation, RULES)]
+    assert codes.count("ActingOverlap") == 1
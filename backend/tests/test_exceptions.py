@@ -0,0 +1,104 @@
+import random
+
+from evaluators.approval import ChainResolver, InstrumentMatcher, normalize_instrument
+from evaluators.batch_exceptions import benchmark
+from evaluators.exceptions import ExceptionMatcher
+from evaluators.substrings import SubstringMatcher
+
+INF = float("inf")
+VALUES = [-INF, -5.0, 0.0, 5.0, 10.0, INF, "inf", "-inf", "nan", "x", None]
+AMOUNTS = [None, -INF, -5.0, 0.0, 2.5, 5.0, 7.5, 10.0, 1e9, INF, float("nan")]
+WORDS = ["", "grant", "rant", "ant", "travel", "a", "gift card", "card"]
+
+
+def reference(policy, keywords, amount):
+    """Per-policy matching as the tracker did before policies were compiled."""
+    cond = policy.get("when")
+    if not cond or not isinstance(cond, dict):
+        return True
+    want = (cond.get("keyword") or "").strip().lower()
+    if want and want not in (keywords or "").strip().lower():
+        return False
+    amt = cond.get("amount")
+    if not amt:
+        return True
+    if amount is None:
+        return False
+    try:
+        v = float(amt.get("value"))
+    except Exception:
+        return True
+    op = (amt.get("op") or "").strip()
+    a = float(amount)
+    if op == "<": return a < v
+    if op == "<=": return a <= v
+    if op == ">": return a > v
+    if op == ">=": return a >= v
+    if op == "==": return a == v
+    return True
+
+
+def random_policy(rng):
+    when = {}
+    if rng.random() < 0.7:
+        when["keyword"] = rng.choice(WORDS)
+    r = rng.random()
+    if r < 0.7:
+        when["amount"] = {"op": rng.choice(["<", "<=", ">", ">=", "==", "!=", ""]), "value": rng.choice(VALUES)}
+    elif r < 0.75:
+        when["amount"] = "large"
+    return {"when": when}
+
+
+def test_compiled_policies_match_per_policy_comparison():
+    rng = random.Random(7)
+    for _ in range(300):
+        policies = [random_policy(rng) for _ in range(rng.randint(0, 8))]
+        matcher = ExceptionMatcher(policies)
+        for amount in AMOUNTS:
+            keywords = " ".join(rng.sample(WORDS, 2)).upper()
+            want = [k for k, p in enumerate(policies) if reference(p, keywords, amount)]
+            assert matcher.applicable(keywords, amount) == want, (policies, keywords, amount)
+
+
+def test_infinite_amounts_compare_like_floats():
+    policies = [{"when": {"amount": {"op": op, "value": "inf"}}} for op in ("<", "<=", ">", ">=", "==")]
+    assert ExceptionMatcher(policies).applicable("", INF) == [1, 3, 4]
+    assert ExceptionMatcher(policies).applicable("", 5.0) == [0, 1]
+
+
+def test_substring_matcher_finds_every_occurring_pattern():
+    rng = random.Random(3)
+    alphabet = "abc"
+    for _ in range(300):
+        patterns = ["".join(rng.choice(alphabet) for _ in range(rng.randint(0, 4))) for _ in range(rng.randint(0, 6))]
+        text = "".join(rng.choice(alphabet) for _ in range(rng.randint(0, 12)))
+        want = sorted(k for k, p in enumerate(patterns) if p and p in text)
+        assert SubstringMatcher((p, k) for k, p in enumerate(patterns)).match(text) == want
+
+
+def test_keyword_matching_scales_to_large_policy_sets():
+    for row in benchmark([10, 3000], requests=20):
+        assert row["mismatches"] == 0, row
+
+
+def test_instrument_triggers_use_the_shared_matcher():
+    resolver = ChainResolver({
+        "levels": [{"condition": {"field": "amount", "op": ">=", "value": 0}, "approvers": ["Manager"]}],
+        "triggers": [{"when": {"instrument": "cheque"}, "add": ["Second signatory"]}],
+    })
+    assert resolver.resolve(10, " Bank CHEQUE ") == ("Manager", "Second signatory")
+    assert resolver.resolve(10, "wire") == ("Manager",)
+
+
+def test_instrument_matcher_agrees_with_per_trigger_loop():
+    rng = random.Random(5)
+    names = ["cheque", "e-transfer", "wire", "credit card", "card", "eft", "ach", "direct deposit"]
+    triggers = [{"when": {"instrument": " ".join(rng.sample(names, rng.randint(1, 2))).upper()}} for _ in range(500)]
+    triggers.append({"when": {}})
+    matcher = InstrumentMatcher(triggers)
+    for _ in range(200):
+        inst = normalize_instrument(" ".join(rng.sample(names, 3)))
+        want = [k for k, t in enumerate(triggers)
+                if normalize_instrument(t["when"].get("instrument")) and normalize_instrument(t["when"].get("instrument")) in inst]
+        assert matcher.match(inst) == want
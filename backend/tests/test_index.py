@@ -0,0 +1,43 @@
+import random
+
+import numpy as np
+import pytest
+from rank_bm25 import BM25Okapi
+
+from retrieval.analyzer import get_analyzer
+from retrieval.index import Chunk, DocIndex
+
+ANALYZER = get_analyzer()
+# Zipf-like term frequencies: common terms get negative idf (WAND falls back),
+# short documents drawn from few terms give exact score ties.
+VOCAB = [f"term{i}" for i in range(60)]
+WEIGHTS = [1 / (i + 1) for i in range(len(VOCAB))]
+
+
+def corpus(rng, n):
+    return [
+        Chunk(id=f"c{i}", text=" ".join(rng.choices(VOCAB, WEIGHTS, k=rng.randint(1, 25))), page=1, offset=0)
+        for i in range(n)
+    ]
+
+
+def reference(bm25, tokens, k):
+    """rank_bm25 scores, sorted best first; ties keep document order."""
+    scores = bm25.get_scores(tokens)
+    return scores, sorted(range(len(scores)), key=lambda i: scores[i], reverse=True)[:k]
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_top_indices_match_rank_bm25(seed):
+    rng = random.Random(seed)
+    chunks = corpus(rng, rng.choice([1, 7, 40, 150, 400]))
+    index = DocIndex("t", chunks, ANALYZER)
+    bm25 = BM25Okapi([ANALYZER(c.text) for c in chunks])
+    for _ in range(300):  # 1,500 queries over the five corpora
+        tokens = rng.choices(VOCAB + ["unseen"], k=rng.randint(1, 6))
+        k = rng.randint(1, 12)
+        scores, want = reference(bm25, tokens, k)
+        assert np.allclose(index.get_scores(tokens), scores)
+        for wand in (False, True):
+            got = index.top_indices(tokens, k, wand=wand)
+            assert got == want, (tokens, k, wand)
@@ -0,0 +1,43 @@
+from retrieval.cache import RetrievalCache
+from state.lru import VersionedLRU
+from state.panel_cache import PanelCache
+
+
+def test_new_version_drops_the_docs_entries():
+    cache = VersionedLRU(max_entries=8)
+    calls = []
+    compute = lambda: calls.append(1) or len(calls)
+    assert cache.get_or_compute("d", 1, "q", compute) == 1
+    assert cache.get_or_compute("d", 1, "q", compute) == 1
+    cache.get_or_compute("other", 1, "q", compute)
+    assert cache.get_or_compute("d", 2, "q", compute) == 3
+    s = cache.stats()
+    assert (s["entries"], s["docs"], s["hits"], s["misses"], s["invalidations"]) == (2, 2, 1, 3, 1)
+
+    cache.invalidate("d")
+    assert cache.stats()["entries"] == 1
+    cache.invalidate()
+    assert cache.stats()["entries"] == cache.stats()["docs"] == 0
+
+
+def test_lru_eviction_and_none_values():
+    cache = VersionedLRU(max_entries=2)
+    for key in ("a", "b"):
+        cache.get_or_compute("d", 1, key, lambda: None)
+    cache.get_or_compute("d", 1, "a", lambda: 1 / 0)  # None is a cached value; refreshes "a"
+    cache.get_or_compute("d", 1, "c", lambda: None)
+    cache.get_or_compute("d", 1, "a", lambda: 1 / 0)
+    s = cache.stats()
+    assert (s["entries"], s["evictions"], s["hits"]) == (2, 1, 2)
+
+
+def test_panel_and_retrieval_caches_share_the_lru():
+    panels = PanelCache()
+    panels.get_or_compute("d", 1, "spend", {"b": 1, "a": 2}, lambda: {"ok": True})
+    assert panels.get_or_compute("d", 1, "spend", {"a": 2, "b": 1}, lambda: 1 / 0) == {"ok": True}
+    assert panels.stats()["by_type"] == {"spend": {"hits": 1, "misses": 1}}
+
+    results = RetrievalCache()
+    results.get_or_compute("d", "v1", ("cash",), 5, False, lambda: [3, 1])
+    assert results.get_or_compute("d", "v1", ("cash",), 5, False, lambda: 1 / 0) == [3, 1]
+    assert results.get_or_compute("d", "v1", ("cash",), 5, True, lambda: [1, 3]) == [1, 3]
@@ -0,0 +1,116 @@
+import json
+import random
+
+import pytest
+from pydantic import ValidationError
+
+from state.patching import apply_ops
+from state.validation import validate_full, validate_incremental
+from state_models import AppState
+
+# Differential test: incremental validation must return exactly what full
+# validation returns, or raise a ValidationError with the same payload.
+
+BASE = validate_full({
+    "meta": {"docName": "Demo", "doc_id": "policy.pdf"},
+    "panels": ["spend"],
+    "panel_configs": {"p1": {"type": "exceptions", "controls": {"entry": {"amount": 5}}}},
+    "spend": {"amount": 18000, "category": "ops", "flags": ["urgent"], "requester": "Alex", "approver": "Priya"},
+    "delegation": {"people": ["Alex", "Priya"], "roles": ["Spending", "Payment"],
+                   "assignments": {"Spending": "Alex", "Payment": None}, "acting": []},
+    "violations": [{"code": "SoD", "message": "same person"}],
+    "citations": [{"key": "c1", "href": "#p1"}],
+})
+
+# (path, values) per top-level key: valid values first, then ones that must be rejected or coerced.
+TARGETS = {
+    "meta": [("/meta/docName", ["Other", 3, None]), ("/meta/server_timestamp", [1.5, "12", "soon"]),
+             ("/meta/extra", [{"x": 1}, [1, 2]]), ("/meta", [{"docName": "New"}, {}, "x"])],
+    "panels": [("/panels/-", ["approvals", 7, None]), ("/panels/0", ["x", {"a": 1}]), ("/panels", [[], ["a", "b"], "p"])],
+    "panel_configs": [("/panel_configs/p2", [{"type": "x"}, 1, None]), ("/panel_configs/p1/controls/entry/amount", [7, "x"]),
+                      ("/panel_configs", [{}, []])],
+    "spend": [("/spend/amount", [22000, "22000", "lots", None]), ("/spend/category", ["asset", "other", 1]),
+              ("/spend/flags/-", ["new", 5]), ("/spend/required_steps", [["a"], "a"]), ("/spend/unknown", [1]),
+              ("/spend", [{}, {"amount": 1}, {"bogus": 1}, []])],
+    "delegation": [("/delegation/people/-", ["Sam", 1]), ("/delegation/assignments/Payment", ["Sam", None, 3]),
+                   ("/delegation/acting/-", [{"role": "Payment", "person": "Sam"}, "x"]), ("/delegation/extra", [1]),
+                   ("/delegation", [{}, {"people": "x"}])],
+    "violations": [("/violations/-", [{"code": "A", "message": "m"}, {"code": "A"}, {"code": 1, "message": "m", "x": 2}]),
+                   ("/violations/0/path", ["/spend", 5]), ("/violations", [[], [1]])],
+    "citations": [("/citations/-", [{"key": "k"}, {"href": "h"}]), ("/citations/0/snippet", ["s", 1.5]),
+                  ("/citations", [[], None])],
+}
+
+
+def outcome(fn):
+    try:
+        return "ok", fn()
+    except ValidationError as e:
+        return "error", json.loads(e.json())
+
+
+def assert_same(base, ops):
+    try:
+        candidate = apply_ops(base, ops)
+    except Exception:
+        pytest.skip("ops do not apply")
+    full = outcome(lambda: validate_full(candidate))
+    incremental = outcome(lambda: validate_incremental(base, candidate, ops))
+    assert incremental == full, ops
+    return full
+
+
+def random_op(rng, key):
+    path, values = rng.choice(TARGETS[key])
+    if path.endswith("/-"):
+        return {"op": "add", "path": path, "value": rng.choice(values)}
+    kind = rng.choice(["replace", "replace", "add", "remove"])
+    if kind == "remove":
+        return {"op": "remove", "path": path}
+    return {"op": kind, "path": path, "value": rng.choice(values)}
+
+
+def applicable(base, ops):
+    try:
+        apply_ops(base, ops)
+        return True
+    except Exception:
+        return False
+
+
+@pytest.mark.parametrize("key", sorted(AppState.model_fields))
+def test_every_top_level_key_is_targeted(key):
+    assert key in TARGETS
+
+
+@pytest.mark.parametrize("seed", range(40))
+def test_random_patches_match_full_validation(seed):
+    rng = random.Random(seed)
+    base, seen = BASE, set()
+    for _ in range(25):
+        keys = rng.sample(sorted(TARGETS), rng.randint(1, 3))
+        ops = [random_op(rng, k) for k in keys for _ in range(rng.randint(1, 2))]
+        if not applicable(base, ops):
+            continue
+        kind, result = assert_same(base, ops)
+        seen.add(kind)
+        if kind == "ok":
+            base = result  # keep patching the normalized root, as the store does
+    assert seen
+
+
+@pytest.mark.parametrize("ops", [
+    [{"op": "replace", "path": "", "value": dict(BASE, panels=["x"])}],  # root replacement
+    [{"op": "replace", "path": "", "value": {"meta": {"docName": "x"}}}],  # root replacement, invalid
+    [{"op": "add", "path": "/extra", "value": 1}],  # added top-level key
+    [{"op": "remove", "path": "/citations"}],  # removed top-level key
+    [{"op": "remove", "path": "/panel_configs"}],  # removed key that has a default
+    [{"op": "move", "from": "/spend", "path": "/delegation"}],
+    [{"op": "copy", "from": "/violations", "path": "/citations"}],
+    [{"op": "replace", "path": "/spend/amount", "value": "lots"}, {"op": "replace", "path": "/violations/0/code", "value": 5}],
+    [{"op": "replace", "path": "/spend/category", "value": "bogus"}, {"op": "add", "path": "/panels/-", "value": "ok"}],
+    [{"op": "test", "path": "/spend/amount", "value": 18000.0}, {"op": "replace", "path": "/spend/amount", "value": "1e3"}],
+    [{"op": "add", "path": "/meta/nested", "value": {"deep": [1, {"x": None}]}}],
+])
+def test_edge_cases_match_full_validation(ops):
+    assert_same(BASE, ops)
@@ -0,0 +1,195 @@
+import json
+import os
+import time
+
+from state import wal
+from state.patching import apply_ops
+from state.shards import ShardRegistry
+from state.wal import OpLog
+
+
+def initial():
+    return {"meta": {"docName": "Demo"}, "panels": [], "n": 0}
+
+
+def registry(tmp_path, every=200):
+    return ShardRegistry(
+        initial_state=initial,
+        spill_dir=tmp_path / "sessions",
+        journal_factory=lambda sid: OpLog(tmp_path / "journal" / sid, snapshot_every=every),
+        journal_dir=tmp_path / "journal",
+    )
+
+
+def commit(store, n, actor="alice"):
+    ops = [{"op": "replace", "path": "/n", "value": n}]
+    return store.commit(apply_ops(store.root, ops), ops, {"source": "patch", "actor": actor})
+
+
+def test_restart_recovers_sessions_with_fewer_commits_than_a_snapshot(tmp_path):
+    shards = registry(tmp_path)
+    store = shards.get("s1").store
+    commit(store, 1)
+    commit(store, 2)
+    shards.close()
+
+    shard = registry(tmp_path).get("s1")
+    assert shard.store.revision == 2
+    assert shard.store.root["n"] == 2
+    assert [r["rev"] for r in shard.store.journal.history()] == [1, 2]
+    assert shard.store.journal.recovery["replayed"] == 2
+
+
+def test_log_without_snapshot_replays_onto_initial_state(tmp_path):
+    log = OpLog(tmp_path, snapshot_every=200)
+    root = initial()
+    for rev in (1, 2, 3):
+        ops = [{"op": "replace", "path": "/n", "value": rev}]
+        root = apply_ops(root, ops)
+        log.append(rev, ops, root)
+    log.close()
+    assert not (tmp_path / "snapshot.json").exists()
+    # As journals written before the first record carried its state.
+    lines = [json.loads(line) for line in (tmp_path / "log.ndjson").read_text().splitlines()]
+    (tmp_path / "log.ndjson").write_text("".join(json.dumps({k: v for k, v in r.items() if k != "state"}) + "\n" for r in lines))
+
+    size = (tmp_path / "log.ndjson").stat().st_size
+    rev, root = OpLog(tmp_path).recover(initial)
+    assert (rev, root["n"]) == (3, 3)
+    assert (tmp_path / "log.ndjson").stat().st_size == size
+
+
+def test_only_a_torn_tail_is_truncated(tmp_path):
+    shards = registry(tmp_path)
+    store = shards.get("s1").store
+    for n in (1, 2, 3):
+        commit(store, n)
+    shards.close()
+    path = tmp_path / "journal" / "s1" / "log.ndjson"
+    valid = path.read_bytes()
+    path.write_bytes(valid + b'{"rev": 4, "ops": [{"op"')
+
+    shard = registry(tmp_path).get("s1")
+    assert shard.store.revision == 3
+    assert path.read_bytes() == valid
+
+
+def test_unreplayable_records_are_moved_aside_not_deleted(tmp_path):
+    shards = registry(tmp_path)
+    store = shards.get("s1").store
+    for n in (1, 2, 3):
+        commit(store, n)
+    shards.close()
+    path = tmp_path / "journal" / "s1" / "log.ndjson"
+    lines = path.read_bytes().splitlines(keepends=True)
+    path.write_bytes(lines[0] + lines[2])  # gap before revision 3
+
+    shard = registry(tmp_path).get("s1")
+    assert shard.store.revision == 1
+    moved = shard.store.journal.recovery["unreplayed"]
+    assert (tmp_path / "journal" / "s1" / moved).read_bytes() == lines[0] + lines[2]
+    commit(shard.store, 9)
+    shard.store.journal.close()
+    rev, root = OpLog(tmp_path / "journal" / "s1").recover(initial)
+    assert (rev, root["n"]) == (2, 9)
+
+
+def test_snapshots_rotate_the_log_and_recovery_survives_a_lost_snapshot_write(tmp_path):
+    shards = registry(tmp_path, every=3)
+    store = shards.get("s1").store
+    for n in range(1, 8):
+        commit(store, n)
+    shards.close()
+    jdir = tmp_path / "journal" / "s1"
+    assert sorted(p.name for p in jdir.glob("audit-*")) == [
+        "audit-0000000001-0000000003.ndjson", "audit-0000000004-0000000006.ndjson"]
+    assert json.loads((jdir / "snapshot.json").read_text())["rev"] == 6
+
+    (jdir / "snapshot.json").write_text(json.dumps({"rev": 3, "state": dict(initial(), n=3)}))
+    shard = registry(tmp_path, every=3).get("s1")
+    assert (shard.store.revision, shard.store.root["n"]) == (7, 7)
+    assert [r["rev"] for r in shard.store.journal.history()] == list(range(1, 8))
+
+
+def test_wholesale_commit_recovers_without_its_snapshot(tmp_path):
+    shards = registry(tmp_path)
+    store = shards.get("s1").store
+    commit(store, 1)
+    store.commit(dict(initial(), n=42), None, {"source": "reset"})
+    commit(store, 43)
+    shards.close()
+    (tmp_path / "journal" / "s1" / "snapshot.json").unlink()
+
+    shard = registry(tmp_path).get("s1")
+    assert (shard.store.revision, shard.store.root["n"]) == (3, 43)
+    assert all("state" not in r for r in shard.store.journal.history())
+
+
+def test_append_does_not_fsync_or_write_snapshots_inline(tmp_path, monkeypatch):
+    calls = []
+    monkeypatch.setattr(wal.os, "fsync", lambda fd: calls.append(fd))
+    written = []
+    monkeypatch.setattr(OpLog, "checkpoint", lambda self, rev, root: written.append(rev))
+    log = OpLog(tmp_path, snapshot_every=2)
+    root = initial()
+    for rev in range(1, 6):
+        ops = [{"op": "replace", "path": "/n", "value": rev}]
+        root = apply_ops(root, ops)
+        log.append(rev, ops, root)
+    assert calls == []
+    assert written == [2, 4]
+    assert not (tmp_path / "snapshot.json").exists()
+    monkeypatch.setattr(wal.os, "fsync", os.fsync)
+    log.close()
+
+
+def test_spilled_count_includes_journaled_shards(tmp_path):
+    shards = registry(tmp_path)
+    commit(shards.get("s1").store, 1)
+    shards.get("s2")
+    shards.spill(shards.shards["s1"])
+    assert shards.stats()["spilled"] == 1
+
+
+def test_journal_is_written_from_the_first_commit(tmp_path):
+    shards = registry(tmp_path)
+    store = shards.get("s1", seed=dict(initial(), n=41)).store
+    shards.close()
+    assert not (tmp_path / "journal" / "s1").exists()
+
+    commit(store, 42)
+    shards.close()
+    assert not (tmp_path / "journal" / "s1" / "snapshot.json").exists()
+    shard = registry(tmp_path).get("s1")
+    assert (shard.store.revision, shard.store.root["n"]) == (1, 42)
+    assert "state" not in shard.store.journal.history()[0]
+
+
+def test_idle_sweep_drops_unused_shards_and_spills_used_ones(tmp_path):
+    shards = registry(tmp_path)
+    shards.ttl = shards.sweep_interval = 0
+    shards.get("opened")
+    commit(shards.get("used").store, 1)
+    time.sleep(0.01)
+    shards.maybe_sweep()
+    assert shards.shards == {}
+    assert sorted(p.name for p in (tmp_path / "journal").iterdir()) == ["used"]
+    assert list((tmp_path / "sessions").iterdir()) == []
+    assert registry(tmp_path).get("used").store.root["n"] == 1
+
+
+def test_sweep_prunes_old_journals_that_never_got_past_revision_zero(tmp_path):
+    shards = registry(tmp_path)
+    commit(shards.get("kept").store, 1)
+    shards.close()
+    empty = tmp_path / "journal" / "empty"
+    empty.mkdir()
+    (empty / "snapshot.json").write_text(json.dumps({"rev": 0, "state": initial()}))
+    old = time.time() - 3600
+    for d in (empty, tmp_path / "journal" / "kept"):
+        os.utime(d, (old, old))
+
+    shards = registry(tmp_path)
+    shards.ttl = 1800
+    assert shards.prune_journals() == 1
+    assert sorted(p.name for p in (tmp_path / "journal").iterdir()) == ["kept"]
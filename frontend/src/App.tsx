@@ -1,5 +1,5 @@
 import { useEffect, useRef, useState } from "react";
-import { AguiClient, BASE_URL } from "./agui/bridge";
+import { AguiClient, BASE_URL, sessionFetch } from "./agui/bridge";
 import type { AppState, PatchOp } from "./state/types";
 // Legacy imports retained elsewhere if needed
 
@@ -190,7 +190,7 @@ export default function App() {
   useEffect(() => {
     const client = new AguiClient(setState);
     clientRef.current = client;
-    client.connect();
+    client.connect().catch((err) => console.error("connect failed", err));
     return () => client.disconnect();
   }, []);
 
@@ -218,7 +218,7 @@ export default function App() {
   // helper for sidebar clicks 
   async function runAgentPrompt(p: string) {
     try {
-      await fetch(`${BASE_URL}/chat/ask`, {
+      await sessionFetch("/chat/ask", {
         method: "POST",
         headers: { "Content-Type": "application/json" },
         body: JSON.stringify({ prompt: p })
@@ -246,7 +246,7 @@ export default function App() {
                   const form = new FormData();
                   form.append("file", f);
                   form.append("kind", "auto");
-                  const res = await fetch(`${BASE_URL}/ingest/upload`, { method: "POST", body: form });
+                  const res = await sessionFetch("/ingest/upload", { method: "POST", body: form });
                   const data = await res.json();
                   if (!res.ok) throw new Error(data?.error || "Upload failed");
                   setDocName(data.docName || f.name);
@@ -3,11 +3,46 @@ import type { AppState, PatchOp } from "../state/types";
 
 const BASE_URL = import.meta.env.VITE_BACKEND_URL || "http://localhost:8000";
 
+// Each tab works in its own server-side state shard. The id comes from
+// /chat/open once and is kept in sessionStorage, so remounts and reloads
+// reuse it; every request and the SSE stream carry it.
+const SESSION_KEY = "agui.session_id";
+let sessionPromise: Promise<string> | null = null;
+type SessionInfo = { session_id: string; doc_id?: string | null; greeting?: string };
+let opened: SessionInfo | null = null;
+
+export function openSession(): Promise<string> {
+  if (!sessionPromise) {
+    sessionPromise = (async () => {
+      const saved = sessionStorage.getItem(SESSION_KEY);
+      if (saved) return saved;
+      const res = await fetch(`${BASE_URL}/chat/open`, { method: "POST", headers: { "Content-Type": "application/json" }, body: JSON.stringify({}) });
+      if (!res.ok) throw new Error(await res.text());
+      opened = await res.json();
+      sessionStorage.setItem(SESSION_KEY, opened!.session_id);
+      return opened!.session_id;
+    })().catch((err) => {
+      sessionPromise = null;
+      throw err;
+    });
+  }
+  return sessionPromise;
+}
+
+// fetch() against the backend in this tab's session.
+export async function sessionFetch(path: string, init: RequestInit = {}): Promise<Response> {
+  const sessionId = await openSession();
+  const headers = new Headers(init.headers);
+  headers.set("X-Session-Id", sessionId);
+  return fetch(`${BASE_URL}${path}`, { ...init, headers });
+}
+
 type SnapshotEvent = { state: AppState; ts: number };
 type DeltaEvent = { ops: PatchOp[] };
 
 export class AguiClient {
   private es?: EventSource;
+  private closed = false;
   private state: AppState | null = null;
   private onChange: (s: AppState) => void;
 
@@ -15,9 +50,12 @@ export class AguiClient {
     this.onChange = onChange;
   }
 
-  connect() {
+  async connect() {
     if (this.es) return;
-    this.es = new EventSource(`${BASE_URL}/agui/stream`);
+    this.closed = false;
+    const sessionId = await openSession();
+    if (this.es || this.closed) return;
+    this.es = new EventSource(`${BASE_URL}/agui/stream?session_id=${encodeURIComponent(sessionId)}`);
 
     this.es.addEventListener("RUN_STARTED", () => {
     });
@@ -55,6 +93,7 @@ export class AguiClient {
   }
 
   disconnect() {
+    this.closed = true;
     if (this.es) {
       this.es.close();
       this.es = undefined;
@@ -73,7 +112,7 @@ export class AguiClient {
       this.onChange(this.state);
     }
 
-    const res = await fetch(`${BASE_URL}/agui/patch`, {
+    const res = await sessionFetch("/agui/patch", {
       method: "POST",
       headers: { "Content-Type": "application/json" },
       body: JSON.stringify({ ops }),
@@ -87,7 +126,7 @@ export class AguiClient {
   }
 
   async reset(panels: string[]) {
-    const res = await fetch(`${BASE_URL}/agui/reset`, {
+    const res = await sessionFetch("/agui/reset", {
       method: "POST",
       headers: { "Content-Type": "application/json" },
       body: JSON.stringify({ panels }),
@@ -96,14 +135,13 @@ export class AguiClient {
     return res.json();
   }
 
-    async chatOpen() {
-    const res = await fetch(`${BASE_URL}/chat/open`, { method: "POST", headers: { "Content-Type":"application/json" }, body: JSON.stringify({}) });
-    if (!res.ok) throw new Error(await res.text());
-    return res.json(); 
+    async chatOpen(): Promise<SessionInfo> {
+    const session_id = await openSession();
+    return opened?.session_id === session_id ? opened : { session_id };
   }
 
   async chatAsk(session_id: string, prompt: string) {
-    const res = await fetch(`${BASE_URL}/chat/ask`, {
+    const res = await sessionFetch("/chat/ask", {
       method: "POST",
       headers: { "Content-Type":"application/json" },
       body: JSON.stringify({ session_id, prompt })
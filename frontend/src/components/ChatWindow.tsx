@@ -1,6 +1,6 @@
 import React, { useEffect, useRef, useState } from "react";
 import * as AdaptiveCards from "adaptivecards";
-import { BASE_URL } from "../agui/bridge";
+import { openSession, sessionFetch } from "../agui/bridge";
 import { Card, Form, InputGroup, Button, Badge } from "react-bootstrap";
 
 type ChatMsg = { role: "assistant" | "user"; text: string };
@@ -18,7 +18,7 @@ export default function ChatWindow() {
 
   async function fetchState() {
     try {
-      const res = await fetch(`${BASE_URL}/agui/state`);
+      const res = await sessionFetch("/agui/state");
       return await res.json();
     } catch {
       return null;
@@ -38,10 +38,10 @@ export default function ChatWindow() {
     let pid = findPanelId(st);
     if (pid) return pid;
     try {
-      await fetch(`${BASE_URL}/chat/ask`, {
+      await sessionFetch("/chat/ask", {
         method: "POST",
         headers: { "Content-Type": "application/json" },
-        body: JSON.stringify({ prompt: "spending checker" })
+        body: JSON.stringify({ prompt: "spending checker", wait: true })
       });
     } catch {}
     // poll up to ~2s
@@ -56,7 +56,7 @@ export default function ChatWindow() {
 
   async function patchOps(ops: any[]) {
     try {
-      await fetch(`${BASE_URL}/agui/patch`, {
+      await sessionFetch("/agui/patch", {
         method: "POST",
         headers: { "Content-Type": "application/json" },
         body: JSON.stringify({ ops })
@@ -78,7 +78,7 @@ export default function ChatWindow() {
   }
 
   useEffect(() => {
-    fetch(`${BASE_URL}/chat/open`, { method: "POST" }).catch(() => {});
+    openSession().catch(() => {});
   }, []);
 
   useEffect(() => {
@@ -117,7 +117,7 @@ export default function ChatWindow() {
           if (kind === "chat" && prompt) {
             (window as any).__onUserPrompt?.(data.label || prompt);
             try {
-              await fetch(`${BASE_URL}/chat/ask`, {
+              await sessionFetch("/chat/ask", {
                 method: "POST",
                 headers: { "Content-Type": "application/json" },
                 body: JSON.stringify({ prompt })
@@ -125,7 +125,7 @@ export default function ChatWindow() {
             } catch {}
           } else if (kind === "export") {
             try {
-              await fetch(`${BASE_URL}/agui/patch`, {
+              await sessionFetch("/agui/patch", {
                 method: "POST",
                 headers: { "Content-Type": "application/json" },
                 body: JSON.stringify({ ops: [{ op: "add", path: "/meta/exportRequested", value: true }] })
@@ -174,10 +174,10 @@ export default function ChatWindow() {
     setMsgs((m) => [...m, { role: "user", text: q }]);
 
     try {
-      const res = await fetch(`${BASE_URL}/chat/ask`, {
+      const res = await sessionFetch("/chat/ask", {
         method: "POST",
         headers: { "Content-Type": "application/json" },
-        body: JSON.stringify({ prompt: q })
+        body: JSON.stringify({ prompt: q, wait: true })
       });
       const data = await res.json();
       const reply = data?.message || "Okay — I’ve updated the panels.";
@@ -210,7 +210,7 @@ export default function ChatWindow() {
                     if (it.kind === "chat" && it.prompt) {
                       (window as any).__onUserPrompt?.(it.label);
                       try {
-                        await fetch(`${BASE_URL}/chat/ask`, {
+                        await sessionFetch("/chat/ask", {
                           method: "POST",
                           headers: { "Content-Type": "application/json" },
                           body: JSON.stringify({ prompt: it.prompt })
@@ -246,7 +246,7 @@ export default function ChatWindow() {
                       }
                     } else if (it.kind === "export") {
                       try {
-                        await fetch(`${BASE_URL}/agui/patch`, {
+                        await sessionFetch("/agui/patch", {
                           method: "POST",
                           headers: { "Content-Type": "application/json" },
                           body: JSON.stringify({ ops: [{ op: "add", path: "/meta/exportRequested", value: true }] })
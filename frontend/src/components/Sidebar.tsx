@@ -1,5 +1,5 @@
 import { Card, Button, Row, Col } from "react-bootstrap";
-import { BASE_URL } from "../agui/bridge";
+import { sessionFetch } from "../agui/bridge";
 
 type AgentItem = { title: string; prompt: string; desc: string };
 
@@ -34,7 +34,7 @@ export default function Sidebar({ onRun }: { onRun: (prompt: string) => void })
                         // Update chat UI immediately
                         (window as any).__onUserPrompt?.(a.title);
                         // Hit backend chat endpoint
-                        await fetch(`${BASE_URL}/chat/ask`, {
+                        await sessionFetch("/chat/ask", {
                           method: "POST",
                           headers: { "Content-Type": "application/json" },
                           body: JSON.stringify({ prompt: a.prompt })
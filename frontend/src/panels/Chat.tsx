@@ -23,7 +23,7 @@ export default function Chat(
       if (!client) return;
       const res = await client.chatOpen();
       setSession({ session_id: res.session_id, doc_id: res.doc_id });
-      setMsgs([{ role:"assistant", content: res.greeting }]);
+      if (res.greeting) setMsgs([{ role:"assistant", content: res.greeting }]);
     })();
   }, [client]);
 